@@ -0,0 +1,141 @@
+"""
+Агрегаты по складу на массивах NumPy: количество по типам, средний возраст
+остатков, списания по месяцам и гистограммы.
+
+NumPy — необязательная зависимость: без нее модуль импортируется,
+но функции поднимают RuntimeError.
+"""
+from datetime import date
+from models import Clothing, Furniture
+from store import BASE, CLOTHING, FURNITURE, NO_DATE, ProductStore
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TYPE_NAMES = {BASE: "BaseProduct", CLOTHING: "Clothing", FURNITURE: "Furniture"}
+# порядковый номер дня 1970-01-01: от него отсчитывается datetime64[D]
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("Для аналитики требуется NumPy (pip install numpy)")
+
+
+class InventoryArrays:
+    """
+    Колонки склада в виде массивов NumPy: количество, вес, даты поступления
+    и списания (порядковые номера дней, 0 — не списано) и код типа продукта.
+    """
+
+    def __init__(self, counts, weights, receipt, write_off, kinds):
+        self.counts = counts
+        self.weights = weights
+        self.receipt = receipt
+        self.write_off = write_off
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.counts)
+
+    @classmethod
+    def from_store(cls, store):
+        """Оборачивает колонки ProductStore без копирования."""
+        require_numpy()
+        return cls(
+            np.frombuffer(store.counts, dtype=np.int64),
+            np.frombuffer(store.weights, dtype=np.int64),
+            np.frombuffer(store.receipt, dtype=np.int32),
+            np.frombuffer(store.write_off, dtype=np.int32),
+            np.frombuffer(store.kinds, dtype=np.int8),
+        )
+
+    @classmethod
+    def from_products(cls, products):
+        require_numpy()
+        if isinstance(products, ProductStore):
+            return cls.from_store(products)
+        n = len(products)
+        counts = np.fromiter((p.count for p in products), dtype=np.int64, count=n)
+        weights = np.fromiter((p.weight if isinstance(p, Furniture) else 0 for p in products),
+                              dtype=np.int64, count=n)
+        receipt = np.fromiter((p.date_of_receipt.toordinal() for p in products), dtype=np.int32, count=n)
+        write_off = np.fromiter((p.date_of_write_off.toordinal() if p.date_of_write_off else NO_DATE
+                                 for p in products), dtype=np.int32, count=n)
+        kinds = np.fromiter((CLOTHING if isinstance(p, Clothing) else FURNITURE if isinstance(p, Furniture)
+                             else BASE for p in products), dtype=np.int8, count=n)
+        return cls(counts, weights, receipt, write_off, kinds)
+
+
+def count_by_type(arrays):
+    """Суммарное количество единиц товара по типам продуктов."""
+    totals = np.bincount(arrays.kinds, weights=arrays.counts, minlength=len(TYPE_NAMES))
+    return {TYPE_NAMES[code]: int(totals[code]) for code in TYPE_NAMES}
+
+
+def products_by_type(arrays):
+    totals = np.bincount(arrays.kinds, minlength=len(TYPE_NAMES))
+    return {TYPE_NAMES[code]: int(totals[code]) for code in TYPE_NAMES}
+
+
+def on_hand(arrays):
+    return arrays.write_off == NO_DATE
+
+
+def average_age_on_hand(arrays, today=None):
+    """Средний возраст (в днях) несписанных продуктов или None, если таких нет."""
+    today = (today or date.today()).toordinal()
+    mask = on_hand(arrays)
+    if not mask.any():
+        return None
+    return float((today - arrays.receipt[mask]).mean())
+
+
+def write_offs_per_month(arrays):
+    """Число списаний по месяцам: {"YYYY-MM": количество} в порядке месяцев."""
+    write_off = arrays.write_off[arrays.write_off != NO_DATE]
+    if not len(write_off):
+        return {}
+    months = (write_off.astype(np.int64) - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]")
+    months = months.astype(np.int64)
+    first = months.min()
+    counts = np.bincount(months - first)
+    return {str(np.datetime64(int(first + offset), "M")): int(counts[offset])
+            for offset in np.flatnonzero(counts)}
+
+
+def write_off_rate(arrays):
+    """Доля списанных продуктов."""
+    if not len(arrays):
+        return 0.0
+    return float((~on_hand(arrays)).mean())
+
+
+def age_histogram(arrays, today=None, bins=(0, 30, 90, 180, 365, 730)):
+    """
+    Гистограмма возраста несписанных продуктов по границам bins (в днях);
+    последний интервал открыт справа.
+    """
+    today = (today or date.today()).toordinal()
+    ages = today - arrays.receipt[on_hand(arrays)]
+    edges = np.append(np.asarray(bins), max(int(ages.max(initial=0)), bins[-1]) + 1)
+    counts, _ = np.histogram(ages, bins=edges)
+    labels = [f"{low}-{high - 1}" for low, high in zip(bins, bins[1:])] + [f"{bins[-1]}+"]
+    return dict(zip(labels, counts.tolist()))
+
+
+def summary(products, today=None):
+    """Все агрегаты для панели статистики одним словарем."""
+    arrays = InventoryArrays.from_products(products)
+    return {
+        "products": len(arrays),
+        "products_by_type": products_by_type(arrays),
+        "count_by_type": count_by_type(arrays),
+        "total_weight": int(arrays.weights.sum()),
+        "average_age_on_hand": average_age_on_hand(arrays, today),
+        "write_off_rate": write_off_rate(arrays),
+        "write_offs_per_month": write_offs_per_month(arrays),
+        "age_histogram": age_histogram(arrays, today),
+    }
@@ -0,0 +1,130 @@
+"""
+Буферизованный асинхронный лог приложения.
+
+Записи попадают в очередь и пишутся в файл фоновым потоком (QueueListener),
+поэтому разбор файла с множеством ошибок не ждет диска. Файл и поток
+создаются при первой записи, а не при импорте. Одинаковые ошибки, которые
+идут потоком, ограничиваются: за интервал пишутся первые burst записей
+каждого вида, остальные подсчитываются и сводятся в одну строку.
+"""
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FILE = "app.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class RateLimiter:
+    """
+    Ограничитель повторяющихся записей. Вид записи — шаблон сообщения и его
+    последний аргумент (причина ошибки), так что ошибки разных продуктов
+    с одной причиной считаются одинаковыми.
+    """
+
+    def __init__(self, burst=10, interval=1.0):
+        self.burst = burst
+        self.interval = interval
+        self.lock = threading.Lock()
+        # вид -> [начало интервала, пропущено записей, подавлено записей, последняя подавленная]
+        self.groups = {}
+
+    @staticmethod
+    def group_of(record):
+        return record.msg, str(record.args[-1]) if record.args else None
+
+    def admit(self, record):
+        """Возвращает записи, которые нужно вывести: саму запись и/или сводку по предыдущему интервалу."""
+        group = self.group_of(record)
+        now = time.monotonic()
+        with self.lock:
+            state = self.groups.get(group)
+            if state is None or now - state[0] >= self.interval:
+                summary = self._summary(state)
+                self.groups[group] = [now, 1, 0, None]
+                return [summary, record] if summary else [record]
+            if state[1] < self.burst:
+                state[1] += 1
+                return [record]
+            state[2] += 1
+            state[3] = record
+            return []
+
+    def flush(self):
+        """Сводки по всем видам, у которых есть подавленные записи."""
+        with self.lock:
+            summaries = [self._summary(state) for state in self.groups.values()]
+            self.groups.clear()
+        return [summary for summary in summaries if summary]
+
+    @staticmethod
+    def _summary(state):
+        if not state or not state[2]:
+            return None
+        last = state[3]
+        return logging.makeLogRecord({
+            "name": last.name, "levelno": last.levelno, "levelname": last.levelname,
+            "msg": "Еще %d похожих записей не выведено, последняя: %s",
+            "args": (state[2], last.getMessage()),
+        })
+
+
+class BufferedLogHandler(QueueHandler):
+    """QueueHandler с ленивым запуском файлового обработчика и ограничением повторов."""
+
+    def __init__(self, filename=LOG_FILE, burst=10, interval=1.0):
+        super().__init__(queue.SimpleQueue())
+        self.filename = filename
+        self.limiter = RateLimiter(burst, interval)
+        self.listener = None
+        self.file_handler = None
+        self.start_lock = threading.Lock()
+
+    def _start(self):
+        with self.start_lock:
+            if self.listener is None:
+                self.file_handler = logging.FileHandler(self.filename, encoding="utf-8", delay=True)
+                self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                self.listener = QueueListener(self.queue, self.file_handler)
+                self.listener.start()
+
+    def prepare(self, record):
+        # запись остается в этом процессе, поэтому форматирование откладывается до фонового потока
+        return record
+
+    def emit(self, record):
+        try:
+            records = self.limiter.admit(record)
+            if records:
+                if self.listener is None:
+                    self._start()
+                for item in records:
+                    self.enqueue(item)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """Выводит сводки подавленных записей. Запись в файл по-прежнему идет в фоне."""
+        summaries = self.limiter.flush()
+        if summaries:
+            if self.listener is None:
+                self._start()
+            for summary in summaries:
+                self.enqueue(summary)
+
+    def close(self):
+        self.flush()
+        with self.start_lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.file_handler.close()
+                self.listener = None
+        super().close()
+
+
+def flush(logger):
+    """Сбрасывает сводки подавленных записей у обработчиков logger, например после разбора файла."""
+    for handler in logger.handlers:
+        handler.flush()
@@ -0,0 +1,792 @@
+"""
+Бенчмарки производительности склада.
+
+Запуск: python bench.py <имя> [параметры], список бенчмарков: python bench.py --list
+Проверка регрессий: python bench.py suite (сравнение с bench_baseline.json
+рядом со скриптом; другой файл — --baseline, без сравнения — --baseline "")
+"""
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+
+BENCHMARKS = {}
+# базовые замеры для проверки регрессий в bench_suite
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+def _break_date(item):
+    item["date_of_receipt"] = "31.02.2025"
+
+
+def _break_count(item):
+    item["count"] = "много"
+
+
+def _drop_name(item):
+    del item["name"]
+
+
+def _break_details(item):
+    if "size" in item:
+        item["size"] = "XXXXL"
+    elif "dimensions" in item:
+        item["dimensions"] = "0x10x10"
+    else:
+        item["date_of_write_off"] = "01.01.2000"
+
+
+# виды некорректных записей, встречающиеся в реальных выгрузках
+INVALID_MUTATIONS = (_break_date, _break_count, _drop_name, _break_details)
+
+
+def generate_inventory(filename, n, seed=0, invalid=0.0):
+    """
+    Записывает в файл детерминированный синтетический склад из n продуктов
+    (базовые продукты, одежда и мебель вперемешку). Доля invalid записей
+    испорчена одним из INVALID_MUTATIONS; при invalid=0 файл тот же, что и раньше.
+    """
+    rng = random.Random(seed)
+    # отдельный генератор, чтобы доля ошибок не меняла корректные записи
+    broken = random.Random(seed + 1)
+    sizes = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
+    with open(filename, 'w', encoding="UTF-8") as f:
+        f.write("{")
+        for i in range(n):
+            item = {
+                "name": f"Product {rng.randrange(n)}",
+                "date_of_receipt": f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2015, 2025)}",
+                "count": rng.randint(0, 1000),
+            }
+            kind = rng.random()
+            if kind < 0.4:
+                item.update(size=rng.choice(sizes), color="Red", material="Cotton")
+            elif kind < 0.7:
+                item.update(material="Wood", weight=rng.randint(1, 200),
+                            dimensions=f"{rng.randint(1, 300)}x{rng.randint(1, 300)}x{rng.randint(1, 300)}")
+            if invalid and broken.random() < invalid:
+                broken.choice(INVALID_MUTATIONS)(item)
+            if i:
+                f.write(",")
+            f.write(f'\n  "Prod{i + 1}": ')
+            json.dump(item, f, ensure_ascii=False)
+        f.write("\n}")
+
+
+def _measure_in_child(target, args, results):
+    start = time.perf_counter()
+    first = target(*args)
+    results.put({
+        "first": first - start if first else None,
+        "total": time.perf_counter() - start,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def run_isolated(target, *args):
+    """
+    Запускает target в отдельном процессе, чтобы пиковая память (RSS)
+    одного варианта не влияла на другой. target возвращает момент (perf_counter)
+    получения первого результата.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_measure_in_child, args=(target, args, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def _load_parse_json(filename):
+    from utils import parse_json
+    products = parse_json(filename)
+    return time.perf_counter() if products else None
+
+
+def _load_iter_products(filename):
+    from utils import iter_products
+    first = None
+    for _ in iter_products(filename):
+        if first is None:
+            first = time.perf_counter()
+    return first
+
+
+def _load_snapshot(filename):
+    import snapshot
+    store = snapshot.load(filename)
+    return time.perf_counter() if store is not None and len(store) else None
+
+
+def report(title, rows):
+    print(title)
+    for name, result in rows:
+        values = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                           for k, v in result.items())
+        print(f"  {name:<24} {values}")
+
+
+@benchmark
+def bench_stream(n=200_000):
+    """Пиковая память и время до первого продукта: parse_json против iter_products."""
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        report(f"parse ({n} продуктов, {os.path.getsize(filename) / 2**20:.1f} MiB)", [
+            ("parse_json", run_isolated(_load_parse_json, filename)),
+            ("iter_products", run_isolated(_load_iter_products, filename)),
+        ])
+
+
+def make_products(n, seed=0):
+    """Создает в памяти n синтетических продуктов без записи на диск."""
+    from models import BaseProduct
+    rng = random.Random(seed)
+    return [BaseProduct({
+        "name": f"Product {i}",
+        "date_of_receipt": f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024",
+        "count": rng.randint(0, 1000),
+    }) for i in range(n)]
+
+
+def _time_per_op(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1000
+
+
+@benchmark
+def bench_table_edit(n=None, edits=100):
+    """Задержка правки строки таблицы (мс) на 10k, 100k и 1M продуктов."""
+    import tkinter as tk
+    from tkinter import ttk
+    from table import ProductTable, VirtualTable
+    from ui import product_row
+    from utils import set_write_off_date
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Пропущено: нет дисплея для Tk ({e})")
+        return
+    root.withdraw()
+    for size in ([n] if n else [10_000, 100_000, 1_000_000]):
+        products = make_products(size)
+        extra = make_products(edits, seed=1)
+        rows = []
+        for mode in ("incremental", "virtual"):
+            tree = ttk.Treeview(root, columns=tuple(range(6)), show="headings")
+            if mode == "virtual":
+                table = VirtualTable(tree, ttk.Scrollbar(root), product_row)
+            else:
+                table = ProductTable(tree, product_row)
+            start = time.perf_counter()
+            table.set_rows(products)
+            root.update()
+            setup = time.perf_counter() - start
+
+            def write_off(product):
+                set_write_off_date(product, "01.01.2026")
+                table.update(product)
+
+            def append(product):
+                products.append(product)
+                table.append(product)
+
+            def remove(product):
+                products.pop()
+                table.remove(product)
+
+            rows.append((mode, {
+                "setup_s": setup,
+                "update_ms": _time_per_op(write_off, products[:edits]),
+                "append_ms": _time_per_op(append, extra),
+                "remove_ms": _time_per_op(remove, extra[::-1]),
+            }))
+            tree.destroy()
+        report(f"table edit ({size} продуктов)", rows)
+    root.destroy()
+
+
+class _DictProduct:
+    """Продукт в прежнем представлении: атрибуты в __dict__, даты как datetime."""
+
+    def __init__(self, product):
+        self.name = product.name
+        self.date_of_receipt = product.date_of_receipt
+        self.date_of_write_off = product.date_of_write_off
+        self.count = product.count
+
+
+def _traced_size(build):
+    import tracemalloc
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+@benchmark
+def bench_memory(n=1_000_000):
+    """Память на хранение n продуктов: __dict__, __slots__ и колоночный ProductStore."""
+    from datetime import datetime
+    from models import BaseProduct
+    from store import ProductStore
+
+    rng = random.Random(0)
+    records = [(f"Product {i}", datetime(2024, rng.randint(1, 12), rng.randint(1, 28)), rng.randint(0, 1000))
+               for i in range(n)]
+
+    def build_slots():
+        products = []
+        for name, date, count in records:
+            product = BaseProduct.__new__(BaseProduct)
+            product.name, product.date_of_receipt, product.date_of_write_off, product.count = name, date, None, count
+            # как у продукта из файла до присвоения ключа: ProductStore читает key
+            product.key, product.dirty = None, False
+            products.append(product)
+        return products
+
+    # даты и имена создаются заново, как при разборе файла, а не разделяются между вариантами
+    def fresh(products):
+        for product in products:
+            product.name = "".join(product.name)
+            product.date_of_receipt = product.date_of_receipt.replace()
+        return products
+
+    slots, slots_size = _traced_size(lambda: fresh(build_slots()))
+    _, dict_size = _traced_size(lambda: fresh([_DictProduct(p) for p in slots]))
+    _, store_size = _traced_size(lambda: ProductStore.from_products(slots))
+    report(f"memory ({n} продуктов)", [
+        (name, {"total_mb": size / 2**20, "bytes_per_product": size / n})
+        for name, size in (("__dict__", dict_size), ("__slots__", slots_size), ("ProductStore", store_size))
+    ])
+
+
+@benchmark
+def bench_dates(n=1_000_000):
+    """Разбор и форматирование дат: strptime/strftime против кэширующего кодека dates."""
+    from datetime import datetime
+    from dates import DATE_FORMAT, parse_date, format_date
+
+    rng = random.Random(0)
+    strings = [f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2015, 2025)}"
+               for _ in range(n)]
+
+    def timed(func, items):
+        start = time.perf_counter()
+        result = [func(item) for item in items]
+        return time.perf_counter() - start, result
+
+    strptime_time, parsed = timed(lambda value: datetime.strptime(value, DATE_FORMAT), strings)
+    parse_date_time, _ = timed(parse_date, strings)
+    strftime_time, _ = timed(lambda value: value.strftime(DATE_FORMAT), parsed)
+    format_date_time, _ = timed(format_date, parsed)
+    report(f"dates ({n} значений, {len(set(strings))} уникальных)", [
+        ("parse", {"strptime_s": strptime_time, "parse_date_s": parse_date_time,
+                   "speedup": strptime_time / parse_date_time}),
+        ("format", {"strftime_s": strftime_time, "format_date_s": format_date_time,
+                    "speedup": strftime_time / format_date_time}),
+    ])
+
+
+@benchmark
+def bench_search(n=1_000_000, repeat=20):
+    """Время построения ProductIndex и задержка запросов (мс) на n продуктах."""
+    from datetime import datetime
+    from index import ProductIndex
+
+    products = make_products(n)
+    start = time.perf_counter()
+    index = ProductIndex(products)
+    build = time.perf_counter() - start
+
+    low, high = datetime(2024, 3, 1).toordinal(), datetime(2024, 3, 7).toordinal()
+    queries = {
+        "by_name": lambda: index.by_name(f"Product {n // 2}"),
+        "substring": lambda: index.query("uct 12345"),
+        "prefix": lambda: index.query("pr"),
+        "receipt_week": lambda: index.query(ranges={"date_of_receipt": (low, high)}),
+        "count_range": lambda: index.query(ranges={"count": (10, 12)}),
+        "text_and_range": lambda: index.query("uct 1", {"count": (10, 20)}),
+    }
+    rows = [("build", {"seconds": build})]
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            found = len(query())
+        rows.append((name, {"ms": (time.perf_counter() - start) / repeat * 1000, "found": found}))
+
+    product = products[n // 2]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index.update(product)
+    rows.append(("update", {"ms": (time.perf_counter() - start) / repeat * 1000}))
+    report(f"search ({n} продуктов)", rows)
+
+
+@benchmark
+def bench_parallel(n=2_000_000):
+    """Масштабирование parse_json_parallel по числу процессов против parse_json."""
+    from utils import parse_json, parse_json_parallel
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        start = time.perf_counter()
+        count = len(parse_json(filename))
+        serial = time.perf_counter() - start
+        rows = [("parse_json", {"seconds": serial, "products": count})]
+
+        workers = 1
+        while True:
+            start = time.perf_counter()
+            count = len(parse_json_parallel(filename, workers=workers))
+            elapsed = time.perf_counter() - start
+            rows.append((f"parallel x{workers}", {"seconds": elapsed, "speedup": serial / elapsed,
+                                                  "products": count}))
+            if workers >= (os.cpu_count() or 1):
+                break
+            workers = min(workers * 2, os.cpu_count())
+        report(f"parallel ({n} продуктов, {os.cpu_count()} CPU)", rows)
+
+
+@benchmark
+def bench_analytics(n=10_000_000):
+    """Векторные агрегаты analytics на n строках и преобразование продуктов в массивы."""
+    import numpy as np
+    import analytics
+    from datetime import date
+
+    rng = np.random.default_rng(0)
+    today = date(2025, 6, 1)
+    start_ordinal = date(2015, 1, 1).toordinal()
+    receipt = rng.integers(start_ordinal, today.toordinal(), n, dtype=np.int32)
+    written_off = rng.random(n) < 0.3
+    write_off = np.where(written_off, receipt + rng.integers(0, 365, n, dtype=np.int32), 0).astype(np.int32)
+    arrays = analytics.InventoryArrays(
+        rng.integers(0, 1000, n), rng.integers(0, 200, n), receipt, write_off,
+        rng.integers(0, 3, n, dtype=np.int8))
+
+    rows = []
+    for name, func in (
+            ("count_by_type", lambda: analytics.count_by_type(arrays)),
+            ("average_age_on_hand", lambda: analytics.average_age_on_hand(arrays, today)),
+            ("write_offs_per_month", lambda: analytics.write_offs_per_month(arrays)),
+            ("age_histogram", lambda: analytics.age_histogram(arrays, today))):
+        start = time.perf_counter()
+        func()
+        rows.append((name, {"ms": (time.perf_counter() - start) * 1000}))
+
+    products = make_products(min(n, 1_000_000))
+    start = time.perf_counter()
+    analytics.InventoryArrays.from_products(products)
+    rows.append((f"from_products ({len(products)})", {"ms": (time.perf_counter() - start) * 1000}))
+    report(f"analytics ({n} строк)", rows)
+
+
+@benchmark
+def bench_bulk_write_off(n=100_000):
+    """Списание n продуктов: bulk_write_off против цикла set_write_off_date."""
+    from utils import bulk_write_off, set_write_off_date
+
+    products = make_products(n)
+    start = time.perf_counter()
+    for product in products:
+        set_write_off_date(product, "01.01.2026")
+    loop = time.perf_counter() - start
+
+    products = make_products(n)
+    start = time.perf_counter()
+    bulk_write_off(products, "01.01.2026")
+    bulk = time.perf_counter() - start
+
+    dates = ["01.01.2026"] * n
+    start = time.perf_counter()
+    bulk_write_off(products, dates)
+    per_item = time.perf_counter() - start
+    report(f"bulk write-off ({n} продуктов)", [
+        ("set_write_off_date", {"ms": loop * 1000}),
+        ("bulk_write_off", {"ms": bulk * 1000, "speedup": loop / bulk}),
+        ("bulk (даты по продуктам)", {"ms": per_item * 1000}),
+    ])
+
+
+@benchmark
+def bench_snapshot(n=1_000_000):
+    """Холодный старт: потоковый разбор JSON против загрузки бинарного снимка."""
+    from storage import JsonStorage
+    from utils import iter_products
+    import snapshot
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        start = time.perf_counter()
+        JsonStorage(filename).save_all(list(iter_products(filename)), write_snapshot=True)
+        save = time.perf_counter() - start
+        report(f"cold start ({n} продуктов, JSON {os.path.getsize(filename) / 2**20:.1f} MiB, "
+               f"снимок {os.path.getsize(snapshot.snapshot_path(filename)) / 2**20:.1f} MiB)", [
+            ("save_all + снимок", {"total": save}),
+            ("iter_products", run_isolated(_load_iter_products, filename)),
+            ("snapshot.load", run_isolated(_load_snapshot, filename)),
+        ])
+
+
+@benchmark
+def bench_random_access(n=1_000_000, reads=1000):
+    """Индекс смещений JSON: построение, повторное открытие из кэша и чтение случайных продуктов."""
+    from jsonindex import IndexedJsonFile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        start = time.perf_counter()
+        IndexedJsonFile(filename).close()
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        with IndexedJsonFile(filename) as products:
+            reopen = time.perf_counter() - start
+            rows = random.Random(0).sample(range(len(products)), min(reads, len(products)))
+            read = _time_per_op(products.__getitem__, rows)
+        report(f"random access ({n} продуктов, {os.path.getsize(filename) / 2**20:.1f} MiB)", [
+            ("построение индекса", {"s": build}),
+            ("открытие с кэшем", {"s": reopen}),
+            ("чтение продукта", {"ms": read}),
+        ])
+
+
+@benchmark
+def bench_logging(n=200_000, invalid=0.5):
+    """Разбор файла с долей invalid ошибочных записей: FileHandler против буферизованного лога."""
+    import logging
+    from applog import LOG_FORMAT, BufferedLogHandler
+    from utils import logger, parse_json
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n, invalid=invalid)
+        log_file = os.path.join(tmp, "app.log")
+
+        def sync_handler():
+            handler = logging.FileHandler(log_file, encoding="utf-8")
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            return handler
+
+        variants = [
+            ("FileHandler", sync_handler),
+            ("очередь без ограничения", lambda: BufferedLogHandler(log_file, burst=float("inf"))),
+            ("очередь с ограничением", lambda: BufferedLogHandler(log_file)),
+        ]
+        saved = logger.handlers[:]
+        rows = []
+        try:
+            for name, make_handler in variants:
+                handler = make_handler()
+                logger.handlers = [handler]
+                start = time.perf_counter()
+                parse_json(filename)
+                parsed = time.perf_counter() - start
+                handler.close()
+                rows.append((name, {"parse_s": parsed, "drained_s": time.perf_counter() - start,
+                                    "log_lines": sum(1 for _ in open(log_file, encoding="utf-8"))}))
+                os.remove(log_file)
+        finally:
+            logger.handlers = saved
+        report(f"logging ({n} продуктов, доля ошибок {invalid})", rows)
+
+
+@benchmark
+def bench_validators(n=300_000, invalid=0.1, repeat=3):
+    """Скорость проверки и создания продуктов (записей/с) из уже разобранных словарей."""
+    from validation import ValidationError
+    from utils import build_product
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n, invalid=invalid)
+        with open(filename, encoding="UTF-8") as f:
+            items = list(json.load(f).items())
+
+    def build_all(subset):
+        for key, item in subset:
+            try:
+                build_product(item, key)
+            except ValidationError:
+                pass
+
+    valid = []
+    for key, item in items:
+        try:
+            build_product(item, key)
+        except ValidationError:
+            continue
+        valid.append((key, item))
+    rows = []
+    for name, subset in (("все записи", items), ("только корректные", valid)):
+        elapsed = min(_timed(build_all, subset) for _ in range(repeat))
+        rows.append((name, {"records_per_s": len(subset) / elapsed}))
+    report(f"validators ({n} записей, доля ошибок {invalid})", rows)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+@benchmark
+def bench_sort(n=1_000_000, edits=1000):
+    """Сортировка таблицы: построение перестановки, смена направления и правки против sorted()."""
+    from index import SortIndex
+    from ui import SORT_KEYS
+
+    products = make_products(n)
+    start = time.perf_counter()
+    sorted(products, key=SORT_KEYS["Количество"])
+    full = time.perf_counter() - start
+
+    sorter = SortIndex(products, SORT_KEYS)
+    start = time.perf_counter()
+    sorter.order("Количество")
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    rows = sorter.rows("Количество", descending=True)
+    rows[0], rows[n // 2]
+    flip = time.perf_counter() - start
+
+    def write_off(product):
+        product.count += 1
+        sorter.update(product)
+
+    extra = make_products(edits, seed=1)
+    report(f"sort ({n} продуктов)", [
+        ("sorted()", {"s": full}),
+        ("первая сортировка", {"s": build}),
+        ("смена направления", {"ms": flip * 1000}),
+        ("добавление", {"ms": _time_per_op(sorter.add, extra)}),
+        ("изменение", {"ms": _time_per_op(write_off, products[:edits])}),
+        ("удаление", {"ms": _time_per_op(sorter.remove, extra)}),
+    ])
+
+
+@benchmark
+def bench_reload(n=200_000, changed=100):
+    """Подхват изменений другого процесса: дописанный журнал и перезаписанный файл против полной загрузки."""
+    from storage import JsonStorage
+    from watcher import diff_products
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        storage = JsonStorage(filename)
+        start = time.perf_counter()
+        products = list(storage.iter_products())
+        full = time.perf_counter() - start
+        reloader = storage.watch()
+
+        def reload():
+            reloader.poll()
+            start = time.perf_counter()
+            changes = reloader.reload(lambda: (p.key for p in products))
+            operations = diff_products(products, changes)
+            return {"s": time.perf_counter() - start, "reread": len(changes), "operations": len(operations)}
+
+        with open(filename, encoding="UTF-8") as f:
+            data = json.load(f)
+        keys = list(data)[::n // changed]
+        rows = []
+        for title, step in (("файл, первое изменение", 1), ("файл, следующие", 2)):
+            for key in keys:
+                data[key]["count"] += step
+            with open(filename, 'w', encoding="UTF-8") as f:
+                json.dump(data, f)
+            rows.append((title, reload()))
+        JsonStorage(filename).save_changes({key: dict(data[key], count=0) for key in keys})
+        rows.append(("журнал", reload()))
+        report(f"reload ({n} продуктов, {changed} изменений)", [("полная загрузка", {"s": full})] + rows)
+
+
+@benchmark
+def bench_shards(n=400_000, shards=8):
+    """Загрузка склада из нескольких файлов: по очереди через iter_products против ShardedStorage."""
+    from storage import ShardedStorage
+    from utils import iter_products
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(shards):
+            generate_inventory(os.path.join(tmp, f"warehouse{i}.json"), n // shards, seed=i)
+        start = time.perf_counter()
+        sequential = sum(1 for name in sorted(os.listdir(tmp))
+                         for _ in iter_products(os.path.join(tmp, name)))
+        one_by_one = time.perf_counter() - start
+        start = time.perf_counter()
+        sharded = sum(1 for _ in ShardedStorage(tmp).iter_products())
+        parallel = time.perf_counter() - start
+        report(f"shards ({n} продуктов в {shards} файлах, {os.cpu_count()} CPU)", [
+            ("по очереди", {"s": one_by_one, "products": sequential}),
+            ("ShardedStorage", {"s": parallel, "products": sharded, "speedup": one_by_one / parallel}),
+        ])
+
+
+@benchmark
+def bench_serialization(n=200_000):
+    """
+    Запись склада через dump_products каждой установленной библиотекой JSON с отступом
+    и в компактном режиме против прежнего пути (словарь всех продуктов и json.dump(indent=2));
+    load_s — чтение записанного файла той же библиотекой.
+    """
+    import serialization
+    from utils import dump_products, parse_json, product_to_dict
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n)
+        products = parse_json(filename)
+
+        def measure(write, backend, repeat=3):
+            elapsed = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                write()
+                elapsed = min(elapsed, time.perf_counter() - start)
+            size = os.path.getsize(filename)
+            with open(filename, 'rb') as f:
+                raw = f.read()
+            start = time.perf_counter()
+            backend.loads(raw)
+            return {"save_s": elapsed, "MB": size / 2**20, "MB/s": size / 2**20 / elapsed,
+                    "products/s": n / elapsed, "load_s": time.perf_counter() - start}
+
+        def stdlib_dump():
+            data = {f"Prod{i + 1}": product_to_dict(p) for i, p in enumerate(products)}
+            with open(filename, 'w', encoding="UTF-8") as f:
+                json.dump(data, f, indent=2)
+
+        rows = [("json.dump(indent=2)", measure(stdlib_dump, serialization.get_backend("json")))]
+        for name, backend in serialization.BACKENDS.items():
+            for compact in (False, True):
+                def write():
+                    with open(filename, 'wb') as f:
+                        dump_products(products, f, compact, backend)
+                rows.append((f"{name}{' compact' if compact else ''}", measure(write, backend)))
+        report(f"serialization ({n} продуктов)", rows)
+
+
+def _parse_save_child(filename, results):
+    from utils import parse_json, save_products
+    start = time.perf_counter()
+    products = parse_json(filename)
+    parsed = time.perf_counter()
+    save_products(filename + ".out", products)
+    results.put({
+        "parse_s": parsed - start,
+        "save_s": time.perf_counter() - parsed,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "products": len(products),
+    })
+
+
+def _table_rows(filename):
+    """Построение значений всех строк таблицы — то, что платит ProductTable.set_rows помимо Tk."""
+    from ui import product_row
+    from utils import iter_products
+    products = list(iter_products(filename))
+    start = time.perf_counter()
+    for product in products:
+        product_row(product)
+    return time.perf_counter() - start
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Сравнивает замеры с базовыми; возвращает имена метрик, ухудшившихся больше чем на tolerance."""
+    regressions = []
+    for metric, value in results.items():
+        expected = baseline.get(metric)
+        if expected and value > expected * (1 + tolerance):
+            regressions.append(metric)
+    return regressions
+
+
+@benchmark
+def bench_suite(n=100_000, invalid=0.05, baseline=BASELINE, save_baseline=None, tolerance=0.25):
+    """Разбор, пиковая память, сохранение и строки таблицы; сравнение с сохраненной базой."""
+    from utils import logger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "inventory.json")
+        generate_inventory(filename, n, invalid=invalid)
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_parse_save_child, args=(filename, queue))
+        proc.start()
+        child = queue.get()
+        proc.join()
+        # ошибки проверки ожидаемы и не должны засорять app.log
+        logger.disabled = True
+        try:
+            rows = _table_rows(filename)
+        finally:
+            logger.disabled = False
+    results = {"parse_s": child["parse_s"], "save_s": child["save_s"],
+               "max_rss_mb": child["max_rss_mb"], "table_rows_s": rows}
+
+    key = f"{n}:{invalid}"
+    stored = {}
+    if baseline and os.path.exists(baseline):
+        with open(baseline, encoding="UTF-8") as f:
+            stored = json.load(f)
+    expected = stored.get(key, {})
+    regressions = compare_with_baseline(results, expected, tolerance)
+    report(f"suite ({n} продуктов, {child['products']} корректных, доля ошибок {invalid})", [
+        (metric + (" РЕГРЕССИЯ" if metric in regressions else ""),
+         {"value": value, **({"baseline": expected[metric], "ratio": value / expected[metric]}
+                             if expected.get(metric) else {})})
+        for metric, value in results.items()
+    ])
+    if save_baseline:
+        stored[key] = results
+        with open(save_baseline, 'w', encoding="UTF-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+    if regressions:
+        raise SystemExit(f"Регрессия производительности: {', '.join(regressions)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("name", nargs="?", help="имя бенчмарка")
+    parser.add_argument("-n", type=int, help="количество продуктов")
+    parser.add_argument("--invalid", type=float, help="доля некорректных записей в синтетическом складе")
+    parser.add_argument("--baseline", help="файл с базовыми замерами для сравнения "
+                                           "(по умолчанию bench_baseline.json, \"\" — не сравнивать)")
+    parser.add_argument("--save-baseline", help="записать замеры в файл как новую базу")
+    parser.add_argument("--tolerance", type=float, help="допустимое ухудшение относительно базы (0.25 = 25%%)")
+    parser.add_argument("--list", action="store_true", help="показать доступные бенчмарки")
+    args = parser.parse_args()
+    if args.list or not args.name:
+        for name, func in BENCHMARKS.items():
+            print(f"{name:<16} {func.__doc__}")
+        return
+    func = BENCHMARKS[args.name]
+    accepted = inspect.signature(func).parameters
+    kwargs = {name: value for name, value in vars(args).items()
+              if name in accepted and value is not None}
+    func(**kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Консольный инструмент для пакетных операций со складом без графического интерфейса.
+
+Примеры:
+    python cli.py import inventory.json inventory.db
+    python cli.py writeoff inventory.json writeoff.csv -o result.json
+    python cli.py stats inventory.db
+    python cli.py export inventory.db inventory.json
+    python cli.py --metrics metrics.prom import inventory.json inventory.db
+    python cli.py --compact export inventory.db inventory.json
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+import metrics
+import serialization
+from storage import SqliteStorage, open_storage
+from utils import logger, set_write_off_date
+from validation import ValidationError
+
+
+class ErrorCounter(logging.Handler):
+    """Считает ошибки, которые разбор записывает в лог ProductParser."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class Counted:
+    """Обертка над потоком продуктов, считающая прошедшие через нее записи."""
+
+    def __init__(self, products):
+        self.products = products
+        self.count = 0
+
+    def __iter__(self):
+        for product in self.products:
+            self.count += 1
+            yield product
+
+
+def report(action, records, started, errors=0):
+    elapsed = time.perf_counter() - started
+    rate = records / elapsed if elapsed > 0 else float("inf")
+    print(f"{action}: {records} записей за {elapsed:.2f} с ({rate:,.0f} записей/с)"
+          + (f", ошибок: {errors}" if errors else ""))
+
+
+def copy_products(source, destination):
+    """Потоково переносит продукты из одного хранилища в другое, заменяя его содержимое."""
+    if os.path.abspath(source) == os.path.abspath(destination):
+        raise SystemExit("Источник и назначение должны различаться")
+    src, dst = open_storage(source), open_storage(destination)
+    try:
+        products = Counted(src.iter_products())
+        dst.save_all(products)
+        return products.count
+    finally:
+        src.close()
+        dst.close()
+
+
+def read_write_offs(filename):
+    """Читает CSV со столбцами «название, дата списания» в словарь название -> дата."""
+    write_offs = {}
+    with open(filename, newline='', encoding="UTF-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            name, date_str = row[0].strip(), row[1].strip()
+            if name.lower() in ("name", "название"):
+                continue
+            write_offs[name] = date_str
+    return write_offs
+
+
+def command_import(args, errors):
+    started = time.perf_counter()
+    records = copy_products(args.source, args.destination)
+    report("Импорт", records, started, errors.count)
+
+
+def command_export(args, errors):
+    started = time.perf_counter()
+    records = copy_products(args.source, args.destination)
+    report("Экспорт", records, started, errors.count)
+
+
+def command_writeoff(args, errors):
+    """
+    Списывает все продукты, имена которых есть в CSV. Продукты читаются и пишутся
+    потоком; в SQLite без --output обновляются только затронутые строки.
+    """
+    started = time.perf_counter()
+    write_offs = read_write_offs(args.csv)
+    storage = open_storage(args.inventory)
+    written_off = 0
+    records = 0
+
+    def apply(products):
+        nonlocal written_off, records
+        for product in products:
+            records += 1
+            date_str = write_offs.get(product.name)
+            if date_str is not None:
+                try:
+                    set_write_off_date(product, date_str)
+                    written_off += 1
+                except ValidationError as e:
+                    logger.error("Ошибка списания продукта %s: %s", product.key, e)
+            yield product
+
+    try:
+        if args.output is None and isinstance(storage, SqliteStorage):
+            for product in apply(storage.iter_products()):
+                if product.name in write_offs and product.date_of_write_off is not None:
+                    storage.update_write_off(product)
+        else:
+            destination = open_storage(args.output) if args.output else storage
+            try:
+                destination.save_all(apply(storage.iter_products()))
+            finally:
+                if destination is not storage:
+                    destination.close()
+    finally:
+        storage.close()
+    print(f"Списано продуктов: {written_off}")
+    report("Списание", records, started, errors.count)
+
+
+def command_stats(args, errors):
+    started = time.perf_counter()
+    storage = open_storage(args.inventory)
+    by_type = {}
+    total_count = 0
+    written_off = 0
+    records = 0
+    try:
+        for product in storage.iter_products():
+            records += 1
+            type_name = type(product).__name__
+            by_type[type_name] = by_type.get(type_name, 0) + 1
+            total_count += product.count
+            if product.date_of_write_off is not None:
+                written_off += 1
+    finally:
+        storage.close()
+    print(f"Продуктов: {records}")
+    for type_name, count in sorted(by_type.items()):
+        print(f"  {type_name}: {count}")
+    print(f"Суммарное количество: {total_count}")
+    print(f"Списано: {written_off}")
+    report("Статистика", records, started, errors.count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="сохранить метрики выполнения (.prom — формат Prometheus, иначе JSON)")
+    parser.add_argument("--compact", action="store_true",
+                        help="писать JSON-файлы без отступов: продукт — одна строка")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="проверить JSON-файл и загрузить продукты в хранилище")
+    command.add_argument("source")
+    command.add_argument("destination")
+    command.set_defaults(handler=command_import)
+
+    command = commands.add_parser("export", help="выгрузить хранилище в другой файл (JSON или SQLite)")
+    command.add_argument("source")
+    command.add_argument("destination")
+    command.set_defaults(handler=command_export)
+
+    command = commands.add_parser("writeoff", help="списать продукты по CSV «название,дата»")
+    command.add_argument("inventory")
+    command.add_argument("csv")
+    command.add_argument("-o", "--output", help="записать результат в другой файл вместо исходного")
+    command.set_defaults(handler=command_writeoff)
+
+    command = commands.add_parser("stats", help="сводка по складу")
+    command.add_argument("inventory")
+    command.set_defaults(handler=command_stats)
+
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    if args.compact:
+        serialization.set_compact()
+    errors = ErrorCounter()
+    logger.addHandler(errors)
+    try:
+        args.handler(args, errors)
+    finally:
+        logger.removeHandler(errors)
+        if args.metrics:
+            metrics.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+from datetime import datetime
+from functools import lru_cache
+
+DATE_FORMAT = "%d.%m.%Y"
+
+
+@lru_cache(maxsize=1 << 16)
+def _parse_cached(value):
+    if len(value) == 10 and value[2] == "." and value[5] == "." and value.isascii():
+        day, month, year = value[:2], value[3:5], value[6:]
+        if day.isdigit() and month.isdigit() and year.isdigit():
+            return datetime(int(year), int(month), int(day))
+    # нестандартные записи вроде "1.4.2025" разбирает strptime, как и раньше
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def parse_date(value):
+    """
+    Разбирает дату в формате DD.MM.YYYY. Результат кэшируется, поэтому повторяющиеся
+    даты разбираются один раз. При ошибке поднимает ValueError, как datetime.strptime.
+    """
+    if type(value) is not str:
+        return datetime.strptime(value, DATE_FORMAT)
+    return _parse_cached(value)
+
+
+@lru_cache(maxsize=1 << 16)
+def format_date(value):
+    """Форматирует дату в DD.MM.YYYY с кэшированием результата."""
+    return value.strftime(DATE_FORMAT)
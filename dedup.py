@@ -0,0 +1,84 @@
+"""
+Поиск и слияние дубликатов продуктов в одном или нескольких файлах склада.
+
+Примеры:
+    python dedup.py north.json south.json
+    python dedup.py north.json south.json --merge-counts -o merged.json
+"""
+import argparse
+from storage import open_storage
+
+
+def find_duplicates(products):
+    """
+    Группирует равные (по __eq__) продукты за один проход с помощью их отпечатков.
+    Возвращает список групп, в каждой больше одного продукта, в порядке первого появления.
+    """
+    groups = {}
+    for product in products:
+        groups.setdefault(product, []).append(product)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def deduplicate(products, merge_counts=False):
+    """
+    Возвращает продукты без дубликатов в порядке первого появления.
+    С merge_counts продукты, отличающиеся только количеством, сливаются в один,
+    а их количества складываются; иначе удаляются только полностью равные продукты.
+    """
+    unique = {}
+    for product in products:
+        key = product.content_key(include_count=False) if merge_counts else product
+        kept = unique.get(key)
+        if kept is None:
+            unique[key] = product
+        elif merge_counts:
+            kept.count += product.count
+    return list(unique.values())
+
+
+def iter_sources(filenames):
+    """Пары (имя файла, продукт) из нескольких файлов склада по порядку."""
+    for filename in filenames:
+        storage = open_storage(filename)
+        try:
+            for product in storage.iter_products():
+                yield filename, product
+        finally:
+            storage.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="+", help="файлы склада (JSON или SQLite)")
+    parser.add_argument("--merge-counts", action="store_true",
+                        help="сливать продукты, различающиеся только количеством, складывая количество")
+    parser.add_argument("-o", "--output", help="записать склад без дубликатов в этот файл")
+    args = parser.parse_args(argv)
+
+    products = []
+    sources = {}
+    for filename, product in iter_sources(args.files):
+        sources[id(product)] = f"{filename}:{product.key}"
+        products.append(product)
+
+    groups = find_duplicates(products)
+    for group in groups:
+        print(f"{group[0].name}: " + ", ".join(sources[id(product)] for product in group))
+    print(f"Групп дубликатов: {len(groups)}, лишних записей: {sum(len(g) - 1 for g in groups)}")
+
+    if args.output:
+        result = deduplicate(products, args.merge_counts)
+        for product in result:
+            # ключи из разных файлов могут совпадать, поэтому продукты нумеруются заново
+            product.key = None
+        storage = open_storage(args.output)
+        try:
+            storage.save_all(result)
+        finally:
+            storage.close()
+        print(f"Записано продуктов: {len(result)} из {len(products)}")
+
+
+if __name__ == "__main__":
+    main()
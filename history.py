@@ -0,0 +1,131 @@
+"""
+История правок для отмены и повтора.
+
+Каждая правка записывается командой с обратной операцией: команда хранит
+ссылки на сами продукты и только те значения, которые правка изменила
+(позицию в списке, прежние даты списания), а не копию списка. Поэтому шаг
+истории занимает память по размеру правки, а не склада. Команды применяются
+к цели с методами insert_product, delete_product и products_updated (UI).
+"""
+from collections import deque
+
+
+class Added:
+    """Продукт добавлен в позицию position списка."""
+
+    def __init__(self, product, position):
+        self.product = product
+        self.position = position
+        self.title = f"добавление {product.name}"
+
+    def undo(self, target):
+        self.position = target.delete_product(self.product, self.position)
+
+    def redo(self, target):
+        target.insert_product(self.product, self.position)
+
+
+class Removed:
+    """Продукт удален из позиции position списка."""
+
+    def __init__(self, product, position):
+        self.product = product
+        self.position = position
+        self.title = f"удаление {product.name}"
+
+    def undo(self, target):
+        target.insert_product(self.product, self.position)
+
+    def redo(self, target):
+        self.position = target.delete_product(self.product, self.position)
+
+
+class WrittenOff:
+    """
+    Продуктам задана дата списания. previous — прежние даты по одной на продукт;
+    новые даты запоминаются при создании команды, одна на всех, если они совпадают.
+    """
+
+    def __init__(self, products, previous):
+        self.products = list(products)
+        self.previous = list(previous)
+        dates = [product.date_of_write_off for product in self.products]
+        self.dates = dates[0] if dates and dates.count(dates[0]) == len(dates) else dates
+        self.title = (f"списание {self.products[0].name}" if len(self.products) == 1
+                      else f"списание {len(self.products)} продуктов")
+
+    def _assign(self, target, dates):
+        if not isinstance(dates, list):
+            dates = [dates] * len(self.products)
+        for product, date in zip(self.products, dates):
+            product.date_of_write_off = date
+        target.products_updated(self.products)
+
+    def undo(self, target):
+        self._assign(target, self.previous)
+
+    def redo(self, target):
+        self._assign(target, self.dates)
+
+
+class Batch:
+    """Несколько команд, которые отменяются и повторяются как одна правка."""
+
+    def __init__(self, commands, title):
+        self.commands = list(commands)
+        self.title = title
+
+    def undo(self, target):
+        for command in reversed(self.commands):
+            command.undo(target)
+
+    def redo(self, target):
+        for command in self.commands:
+            command.redo(target)
+
+
+class History:
+    """
+    Стеки отмены и повтора. Хранится не больше depth последних правок: при переполнении
+    вытесняется самая старая. Новая правка очищает стек повтора.
+    """
+
+    def __init__(self, depth=100):
+        self.done = deque(maxlen=depth)
+        self.undone = []
+
+    def __len__(self):
+        return len(self.done)
+
+    def record(self, command):
+        self.done.append(command)
+        self.undone.clear()
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def undo(self, target):
+        """Отменяет последнюю правку и возвращает ее команду; None, если отменять нечего."""
+        if not self.done:
+            return None
+        # команда снимается со стека только после успешной отмены
+        command = self.done[-1]
+        command.undo(target)
+        self.undone.append(self.done.pop())
+        return command
+
+    def redo(self, target):
+        """Повторяет последнюю отмененную правку и возвращает ее команду; None, если повторять нечего."""
+        if not self.undone:
+            return None
+        command = self.undone[-1]
+        command.redo(target)
+        self.done.append(self.undone.pop())
+        return command
@@ -0,0 +1,262 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Sequence
+
+NO_WRITE_OFF = 0
+FIELDS = ("date_of_receipt", "date_of_write_off", "count")
+
+
+def _field_values(product):
+    """Значения полей для отсортированных индексов; даты — порядковые номера дней."""
+    write_off = product.date_of_write_off
+    return (
+        product.date_of_receipt.toordinal(),
+        write_off.toordinal() if write_off else NO_WRITE_OFF,
+        product.count,
+    )
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductIndex:
+    """
+    Индексы для поиска продуктов в памяти:
+    хеш-индекс по точному имени, триграммный индекс для поиска подстроки
+    и отсортированные индексы по датам поступления, списания и количеству
+    для диапазонных запросов.
+    Внутри продукты нумеруются по порядку добавления: равные продукты могут
+    повторяться, а номер задает порядок выдачи результатов.
+    """
+
+    def __init__(self, products=()):
+        self.seq_of = {}
+        self.products = {}
+        self.next_seq = 0
+        self.values = {}
+        self.names = {}
+        self.trigrams = {}
+        self.sorted = {field: [] for field in FIELDS}
+        self.extend(products)
+
+    def __len__(self):
+        return len(self.products)
+
+    def add(self, product):
+        self._index(self._register(product), product, insort)
+
+    def extend(self, products):
+        """Массовое добавление: записи дописываются в конец, списки сортируются один раз."""
+        for product in products:
+            self._index(self._register(product), product, list.append)
+        for entries in self.sorted.values():
+            entries.sort()
+
+    def remove(self, product):
+        seq = self.seq_of.pop(id(product))
+        del self.products[seq]
+        self._unindex(seq)
+
+    def update(self, product):
+        """Переиндексирует измененный продукт, сохраняя его позицию в порядке выдачи."""
+        seq = self.seq_of[id(product)]
+        self._unindex(seq)
+        self._index(seq, product, insort)
+
+    def _register(self, product):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.seq_of[id(product)] = seq
+        self.products[seq] = product
+        return seq
+
+    def _index(self, seq, product, add_entry):
+        name = product.name
+        lower = name.lower()
+        values = _field_values(product)
+        self.values[seq] = (name, lower, values)
+
+        ids = self.names.get(name)
+        if ids is None:
+            ids = self.names[name] = set()
+        ids.add(seq)
+        for trigram in trigrams(lower):
+            ids = self.trigrams.get(trigram)
+            if ids is None:
+                ids = self.trigrams[trigram] = set()
+            ids.add(seq)
+        for field, value in zip(FIELDS, values):
+            add_entry(self.sorted[field], (value, seq))
+
+    def _unindex(self, seq):
+        name, lower, values = self.values.pop(seq)
+        self._discard(self.names, name, seq)
+        for trigram in trigrams(lower):
+            self._discard(self.trigrams, trigram, seq)
+        for field, value in zip(FIELDS, values):
+            self._delete_sorted(self.sorted[field], (value, seq))
+
+    @staticmethod
+    def _discard(mapping, key, seq):
+        ids = mapping[key]
+        ids.discard(seq)
+        if not ids:
+            del mapping[key]
+
+    @staticmethod
+    def _delete_sorted(entries, entry):
+        pos = bisect_left(entries, entry)
+        if pos < len(entries) and entries[pos] == entry:
+            del entries[pos]
+
+    def by_name(self, name):
+        return self._ordered(self.names.get(name, ()))
+
+    def search_ids(self, text):
+        """Номера продуктов, имя которых содержит text (без учета регистра)."""
+        text = text.lower()
+        if len(text) < 3:
+            # для коротких запросов триграмм нет: подстрока ищется просмотром всех имен
+            return {seq for seq, (_, lower, _) in self.values.items() if text in lower}
+        posting = sorted((self.trigrams.get(t, set()) for t in trigrams(text)), key=len)
+        ids = set(posting[0]).intersection(*posting[1:])
+        if len(text) > 3:
+            # совпадение всех триграмм еще не гарантирует подстроку
+            values = self.values
+            ids = {seq for seq in ids if text in values[seq][1]}
+        return ids
+
+    def range_ids(self, field, low=None, high=None):
+        """Номера продуктов, у которых значение поля field лежит в [low, high]."""
+        entries = self.sorted[field]
+        if field == "date_of_write_off" and low is None:
+            # несписанные продукты не попадают в диапазон дат списания
+            low = NO_WRITE_OFF + 1
+        start = 0 if low is None else bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect_right(entries, (high, float("inf")))
+        return {seq for _, seq in entries[start:end]}
+
+    def query(self, text=None, ranges=None):
+        """
+        Возвращает продукты, удовлетворяющие всем условиям, в порядке добавления.
+        ranges — словарь поле -> (low, high), даты задаются порядковыми номерами дней.
+        """
+        result = None
+        if text:
+            result = self.search_ids(text)
+        for field, (low, high) in (ranges or {}).items():
+            ids = self.range_ids(field, low, high)
+            result = ids if result is None else result & ids
+        if result is None:
+            result = self.products.keys()
+        return self._ordered(result)
+
+    def _ordered(self, ids):
+        products = self.products
+        return [products[seq] for seq in sorted(ids)]
+
+
+class SortIndex:
+    """
+    Кэшированные перестановки для сортировки таблицы по колонкам.
+    Для каждой колонки, по которой уже сортировали, хранится массив номеров
+    продуктов по возрастанию ключа (равные ключи — в порядке добавления).
+    Правка продукта находит его место бинарным поиском и сдвигает массив,
+    без полной пересортировки; обратный порядок — тот же массив с конца.
+    keys — словарь колонка -> функция ключа продукта.
+    """
+
+    def __init__(self, products, keys):
+        self.key_funcs = keys
+        self.products = list(products)
+        self.seq_of = {id(product): seq for seq, product in enumerate(self.products)}
+        # колонка -> ключи по номеру продукта (None для удаленных)
+        self.keys = {}
+        self.orders = {}
+
+    def order(self, column):
+        """Перестановка для колонки; при первом обращении строится одной сортировкой."""
+        order = self.orders.get(column)
+        if order is None:
+            key = self.key_funcs[column]
+            keys = self.keys[column] = [None if product is None else key(product) for product in self.products]
+            alive = (seq for seq, product in enumerate(self.products) if product is not None)
+            order = self.orders[column] = array('q', sorted(alive, key=keys.__getitem__))
+        return order
+
+    def _find(self, column, key, seq):
+        keys = self.keys[column]
+        return bisect_left(self.orders[column], (key, seq), key=lambda other: (keys[other], other))
+
+    def add(self, product):
+        seq = len(self.products)
+        self.products.append(product)
+        self.seq_of[id(product)] = seq
+        for column, order in self.orders.items():
+            key = self.key_funcs[column](product)
+            self.keys[column].append(key)
+            order.insert(self._find(column, key, seq), seq)
+
+    def remove(self, product):
+        seq = self.seq_of.pop(id(product))
+        self.products[seq] = None
+        for column, order in self.orders.items():
+            del order[self._find(column, self.keys[column][seq], seq)]
+            self.keys[column][seq] = None
+
+    def update(self, product):
+        seq = self.seq_of[id(product)]
+        for column, order in self.orders.items():
+            keys = self.keys[column]
+            key = self.key_funcs[column](product)
+            if key == keys[seq]:
+                continue
+            del order[self._find(column, keys[seq], seq)]
+            keys[seq] = key
+            order.insert(self._find(column, key, seq), seq)
+
+    def position(self, column, product, descending=False):
+        """Позиция продукта в отсортированном по колонке порядке."""
+        seq = self.seq_of[id(product)]
+        pos = self._find(column, self.keys[column][seq], seq)
+        return len(self.orders[column]) - 1 - pos if descending else pos
+
+    def rows(self, column, descending=False):
+        """Все продукты в порядке сортировки — ленивая последовательность поверх перестановки."""
+        return SortedRows(self.products, self.order(column), descending)
+
+    def sort(self, products, column, descending=False):
+        """Сортирует подмножество продуктов (например, результат поиска) по кэшированным ключам."""
+        self.order(column)
+        keys, seq_of = self.keys[column], self.seq_of
+
+        def key(product):
+            seq = seq_of[id(product)]
+            return keys[seq], seq
+
+        return sorted(products, key=key, reverse=descending)
+
+
+class SortedRows(Sequence):
+    """Продукты в порядке перестановки; изменения перестановки видны сразу."""
+
+    def __init__(self, products, order, descending):
+        self.products = products
+        self.order = order
+        self.descending = descending
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if self.descending:
+            row = -1 - row
+        return self.products[self.order[row]]
+
+    def __iter__(self):
+        products = self.products
+        order = reversed(self.order) if self.descending else self.order
+        return (products[seq] for seq in order)
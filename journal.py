@@ -0,0 +1,124 @@
+import os
+import serialization
+from utils import build_product, logger, save_products
+
+
+class Journal:
+    """
+    Журнал изменений склада — файл <имя файла>.journal рядом с основным JSON.
+    Каждая строка журнала — одна операция: запись продукта по ключу
+    ({"op": "put", "key": ..., "data": {...}}) или удаление ({"op": "del", "key": ...}).
+    Сохранение после правки дописывает в журнал только измененные продукты,
+    а когда журнал разрастается, он сворачивается в основной файл атомарной перезаписью.
+    """
+
+    def __init__(self, filename, compact_threshold=10000):
+        self.filename = filename
+        self.path = filename + ".journal"
+        self.compact_threshold = compact_threshold
+        self.entries = 0
+
+    def read(self):
+        """Возвращает изменения из журнала: ключ -> данные продукта или None для удаленных."""
+        changes = {}
+        self.entries = 0
+        try:
+            f = open(self.path, 'r', encoding="UTF-8")
+        except FileNotFoundError:
+            return changes
+        with f:
+            for line in f:
+                try:
+                    entry = serialization.loads(line)
+                except ValueError:
+                    # недописанная при сбое последняя строка
+                    logger.error(f"Поврежденная запись журнала {self.path} пропущена")
+                    continue
+                changes[entry["key"]] = entry.get("data") if entry["op"] == "put" else None
+                self.entries += 1
+        return changes
+
+    def tail(self, offset=0):
+        """
+        Изменения, дописанные в журнал после смещения offset (в байтах), и смещение
+        конца последней полной строки, с которого продолжается следующее чтение.
+        """
+        changes = {}
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return changes, 0
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # строку еще дописывает другой процесс, она будет прочитана в следующий раз
+                    break
+                offset += len(line)
+                try:
+                    entry = serialization.loads(line)
+                except ValueError:
+                    logger.error(f"Поврежденная запись журнала {self.path} пропущена")
+                    continue
+                changes[entry["key"]] = entry.get("data") if entry["op"] == "put" else None
+        return changes, offset
+
+    def apply(self, products):
+        """
+        Накладывает журнал на поток продуктов из основного файла: измененные продукты
+        подменяются, удаленные пропускаются, новые добавляются в конец.
+        """
+        changes = self.read()
+        for product in products:
+            if product.key not in changes:
+                yield product
+                continue
+            data = changes.pop(product.key)
+            if data is not None:
+                product = self._build(product.key, data)
+                if product is not None:
+                    yield product
+        for key, data in changes.items():
+            if data is not None:
+                product = self._build(key, data)
+                if product is not None:
+                    yield product
+
+    def _build(self, key, data):
+        try:
+            return build_product(data, key)
+        except Exception as e:
+            logger.error("Ошибка обработки продукта %s из журнала: %s", key, e)
+            return None
+
+    def append(self, changes):
+        """Дописывает изменения в журнал и сбрасывает их на диск."""
+        with open(self.path, 'a+b') as f:
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # последняя строка недописана при сбое: новая запись не должна склеиться с ней
+                    f.write(b"\n")
+            for key, data in changes.items():
+                if data is None:
+                    entry = {"op": "del", "key": key}
+                else:
+                    entry = {"op": "put", "key": key, "data": data}
+                f.write(serialization.dumps(entry) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += len(changes)
+
+    def compact(self, products):
+        """Атомарно перезаписывает основной файл текущим состоянием и очищает журнал."""
+        save_products(self.filename, products)
+        # если сбой случится до удаления журнала, его повторное применение ничего не изменит
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.entries = 0
+
+    def needs_compaction(self, pending):
+        return (not os.path.exists(self.filename)
+                or self.entries + pending > self.compact_threshold)
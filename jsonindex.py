@@ -0,0 +1,265 @@
+"""
+Произвольный доступ к продуктам большого JSON-файла без его полного разбора.
+
+При первом открытии файл один раз просматривается и строится индекс смещений:
+для каждого корректного продукта — ключ и границы его значения в байтах.
+Индекс кэшируется в <имя файла>.idx и используется, пока не изменились mtime
+и размер JSON. Сам файл отображается в память (mmap), и декодируются только
+запрошенные записи, например строки, видимые в VirtualTable. LazyProducts
+дает поверх индекса изменяемый список, который интерфейс использует вместо
+полностью загруженного.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import serialization
+from array import array
+from collections.abc import MutableSequence, Sequence
+from utils import build_product, flush_log, iter_json_spans, logger
+from validation import ValidationError
+
+MAGIC = b"INVOFFS1"
+VERSION = 1
+# magic, версия, mtime_ns и размер JSON, число записей
+HEADER = struct.Struct("<8sHxxxxxxqqq")
+LENGTH = struct.Struct("<q")
+SCAN_CHUNK = 1 << 20
+
+
+def index_path(filename):
+    return filename + ".idx"
+
+
+def _from_latin1(value):
+    # файл просматривается как latin-1, чтобы позиции символов совпадали со смещениями байт
+    if isinstance(value, str):
+        return value if value.isascii() else value.encode("latin-1").decode("utf-8")
+    if isinstance(value, dict):
+        return {_from_latin1(k): _from_latin1(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_latin1(v) for v in value]
+    return value
+
+
+class IndexedJsonFile(Sequence):
+    """
+    Последовательность продуктов JSON-файла с ленивым декодированием.
+    Продукт разбирается при первом обращении и дальше возвращается тот же объект,
+    поэтому правки запрошенных продуктов не теряются. Некорректные продукты
+    в индекс не попадают и, как в iter_products, регистрируются в лог.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.keys = []
+        self.starts = array('q')
+        self.ends = array('q')
+        self.loaded = {}
+        self.file = open(filename, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        info = os.fstat(self.file.fileno())
+        self.opened = (info.st_ino, info.st_mtime_ns, info.st_size)
+        if not self._load_index():
+            self._build_index()
+            self._save_index()
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.mapped, mmap.mmap):
+            self.mapped.close()
+        self.file.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("IndexedJsonFile index out of range")
+        product = self.loaded.get(row)
+        if product is None:
+            # строку могут одновременно читать главный и рабочий поток: оба получат один объект
+            product = self.loaded.setdefault(row, build_product(self.item(row), self.keys[row]))
+        return product
+
+    def item(self, row):
+        """Словарь с данными продукта в строке row, декодированный из отображенного файла."""
+        return serialization.loads(self.mapped[self.starts[row]:self.ends[row]])
+
+    def get(self, key, default=None):
+        """Продукт по ключу ProdN или default, если такого ключа нет."""
+        row = self.rows.get(key)
+        return default if row is None else self[row]
+
+    def _stat(self):
+        info = os.fstat(self.file.fileno())
+        return info.st_mtime_ns, info.st_size
+
+    def stale(self):
+        """True, если файл на диске изменен или заменен после открытия."""
+        try:
+            info = os.stat(self.filename)
+        except FileNotFoundError:
+            return True
+        return (info.st_ino, info.st_mtime_ns, info.st_size) != self.opened
+
+    def _build_index(self):
+        def chunks():
+            for start in range(0, len(self.mapped), SCAN_CHUNK):
+                yield self.mapped[start:start + SCAN_CHUNK].decode("latin-1")
+
+        try:
+            for key, item, start, end in iter_json_spans(chunks()):
+                try:
+                    key = _from_latin1(key)
+                    try:
+                        item = _from_latin1(item)
+                    except UnicodeError:
+                        # в строке смешаны байты UTF-8 и \u-escape вне latin-1
+                        item = json.loads(self.mapped[start:end])
+                    build_product(item, key)
+                except ValidationError as ve:
+                    logger.error("Ошибка обработки продукта %s: %s", key, ve)
+                    continue
+                except Exception as e:
+                    logger.error("Непредвиденная ошибка при обработке продукта %s: %s", key, e)
+                    continue
+                self.keys.append(key)
+                self.starts.append(start)
+                self.ends.append(end)
+        except Exception as e:
+            logger.error("Ошибка открытия или чтения файла %s: %s", self.filename, e)
+        flush_log(logger)
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.filename), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        try:
+            magic, version, mtime_ns, size, rows = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or (mtime_ns, size) != self._stat():
+                return False
+            position = HEADER.size
+            sections = []
+            for _ in range(4):
+                (length,) = LENGTH.unpack_from(data, position)
+                position += LENGTH.size
+                sections.append(data[position:position + length])
+                position += length
+        except struct.error:
+            return False
+        keys, key_ends, self.starts, self.ends = sections[0], array('q'), array('q'), array('q')
+        key_ends.frombytes(sections[1])
+        self.starts.frombytes(sections[2])
+        self.ends.frombytes(sections[3])
+        if not len(key_ends) == len(self.starts) == len(self.ends) == rows:
+            self.starts, self.ends = array('q'), array('q')
+            return False
+        start = 0
+        for end in key_ends:
+            self.keys.append(keys[start:end].decode("utf-8"))
+            start = end
+        return True
+
+    def _save_index(self):
+        keys = bytearray()
+        key_ends = array('q')
+        for key in self.keys:
+            keys += key.encode("utf-8")
+            key_ends.append(len(keys))
+        path = index_path(self.filename)
+        try:
+            fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", suffix=".idx",
+                                            dir=os.path.dirname(os.path.abspath(path)))
+        except OSError as e:
+            # без кэша индекс просто будет построен заново при следующем открытии
+            logger.error(f"Ошибка записи индекса {path}: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, *self._stat(), len(self.keys)))
+                for section in (keys, key_ends, self.starts, self.ends):
+                    raw = memoryview(section).cast('B')
+                    f.write(LENGTH.pack(len(raw)))
+                    f.write(raw)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+
+class LazyProducts(MutableSequence):
+    """
+    Список продуктов поверх IndexedJsonFile (или строк базы storage.SqliteRows)
+    для виртуальной таблицы. Пока строка не запрошена, в списке лежит ее номер
+    в источнике; при первом обращении продукт декодируется и занимает место номера.
+    Вставки, удаления и замены работают как в обычном списке и не читают источник.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.items = list(range(len(source)))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        item = self.items[position]
+        if type(item) is int:
+            item = self.items[position] = self.source[item]
+        return item
+
+    def __setitem__(self, position, product):
+        self.items[position] = product
+
+    def __delitem__(self, position):
+        del self.items[position]
+
+    def insert(self, position, product):
+        self.items.insert(position, product)
+
+    def copy(self):
+        """
+        Снимок списка для рабочего потока: копируются только номера строк и уже
+        декодированные продукты, остальные декодируются при чтении снимка в том же потоке.
+        """
+        rows = LazyProducts.__new__(LazyProducts)
+        rows.source = self.source
+        rows.items = list(self.items)
+        return rows
+
+    def keys(self):
+        """Ключи продуктов по порядку; ключи недекодированных строк берутся из источника."""
+        keys = self.source.keys
+        return (keys[item] if type(item) is int else item.key for item in self.items)
+
+    def loaded(self):
+        """Пары (позиция, продукт) для уже декодированных продуктов."""
+        return ((position, item) for position, item in enumerate(self.items) if type(item) is not int)
+
+    def index_of(self, product):
+        """Позиция продукта по идентичности; недекодированные строки не читаются."""
+        for position, item in self.loaded():
+            if item is product:
+                return position
+        raise ValueError("Продукта нет в списке")
@@ -1,7 +1,32 @@
+import argparse
 import tkinter as tk
+import metrics
+import serialization
+from storage import open_storage
 from ui import UI
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = UI(root, "example.json")
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Менеджмент склада")
+    parser.add_argument("filename", nargs="?", default="example.json",
+                        help="файл склада: JSON, база SQLite (.db, .sqlite, .sqlite3) "
+                             "или каталог/glob-шаблон с файлами отдельных складов")
+    parser.add_argument("--virtual", action="store_true",
+                        help="виртуализированная таблица для больших складов")
+    parser.add_argument("--no-watch", action="store_true",
+                        help="не подхватывать изменения файла склада, сделанные другими программами")
+    parser.add_argument("--compact", action="store_true",
+                        help="сохранять JSON без отступов: быстрее и файл меньше")
+    parser.add_argument("--history-depth", type=int, default=100,
+                        help="сколько последних правок можно отменить (по умолчанию 100)")
+    args = parser.parse_args()
+    if args.compact:
+        serialization.set_compact()
+
+    # INVENTORY_METRICS=metrics.json|metrics.prom и INVENTORY_PROFILE=app.prof включают замеры
+    metrics.dump_at_exit()
+    with metrics.profiling():
+        root = tk.Tk()
+        app = UI(root, args.filename, virtual=args.virtual,
+                 storage=open_storage(args.filename), watch=not args.no_watch,
+                 history_depth=args.history_depth)
+        root.mainloop()
@@ -0,0 +1,187 @@
+"""
+Необязательная инструментация горячих путей: таймеры и счетчики.
+
+По умолчанию выключена и почти ничего не стоит. Включается переменной окружения
+INVENTORY_METRICS или вызовом enable(). Если значение переменной — путь к файлу,
+при выходе из программы туда сохраняются метрики: в формате Prometheus для
+файлов .prom и .txt, иначе в JSON. Переменная INVENTORY_PROFILE=<файл> включает
+запись профиля cProfile главного потока (см. profiling()).
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from validation import ValidationError
+
+PREFIX = "inventory_"
+PROMETHEUS_EXTENSIONS = (".prom", ".txt")
+
+_lock = threading.Lock()
+# имя -> [число замеров, сумма секунд, максимум секунд]
+_timers = {}
+# имя -> {кортеж пар (метка, значение): число}
+_counters = {}
+enabled = bool(os.environ.get("INVENTORY_METRICS"))
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def observe(name, seconds):
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+
+def count(name, amount=1, **labels):
+    if not enabled:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """Контекстный менеджер, замеряющий время блока под именем name."""
+    return _Timer(name) if enabled else _NULL_TIMER
+
+
+def timed(name):
+    """Декоратор: замеряет время каждого вызова функции, пока метрики включены."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def error_label(error):
+    """Метка ошибки проверки: текст ValidationError или имя класса непредвиденного исключения."""
+    return str(error) if isinstance(error, ValidationError) else type(error).__name__
+
+
+def snapshot():
+    """Текущие метрики в виде словаря, пригодного для json.dump."""
+    with _lock:
+        return {
+            "timers": {name: {"count": n, "total_seconds": total, "max_seconds": peak}
+                       for name, (n, total, peak) in sorted(_timers.items())},
+            "counters": {name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                         for name, series in sorted(_counters.items())},
+        }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def to_prometheus():
+    """Текущие метрики в текстовом формате Prometheus."""
+    data = snapshot()
+    lines = []
+    for name, stats in data["timers"].items():
+        metric = f"{PREFIX}{name}_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        lines.append(f"{metric}_count {stats['count']}")
+        lines.append(f"{metric}_sum {stats['total_seconds']!r}")
+        lines.append(f"# TYPE {metric}_max gauge")
+        lines.append(f"{metric}_max {stats['max_seconds']!r}")
+    for name, series in data["counters"].items():
+        metric = f"{PREFIX}{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for entry in series:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in entry["labels"].items())
+            lines.append(f"{metric}{{{labels}}} {entry['value']}" if labels else f"{metric} {entry['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path):
+    """Сохраняет метрики в файл: Prometheus для .prom/.txt, иначе JSON."""
+    with open(path, 'w', encoding="UTF-8") as f:
+        if path.endswith(PROMETHEUS_EXTENSIONS):
+            f.write(to_prometheus())
+        else:
+            json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def dump_at_exit(path=None):
+    """
+    Регистрирует сохранение метрик при выходе. Без path берется значение
+    INVENTORY_METRICS, если это путь к файлу, а не просто флаг включения.
+    """
+    path = path or os.environ.get("INVENTORY_METRICS")
+    if enabled and path and path not in ("1", "true", "yes"):
+        atexit.register(dump, path)
+
+
+@contextmanager
+def profiling(path=None):
+    """
+    Записывает профиль cProfile выполняемого блока в path (по умолчанию —
+    INVENTORY_PROFILE); без пути ничего не делает. Профилируется только
+    текущий поток, фоновые задачи в него не попадают.
+    """
+    path = path or os.environ.get("INVENTORY_PROFILE")
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -1,37 +1,80 @@
 # models.py
-from datetime import datetime
-from validation import ValidationError
+import hashlib
+from dates import format_date
+from schema import CHOICE, DATE, DIMENSIONS, INT, Field, KeySetDispatch, Schema, compile_init
+
+def fingerprint_of(content_key):
+    """Стабильный между запусками 64-битный хеш кортежа полей продукта."""
+    digest = hashlib.blake2b(repr(content_key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
 
 class BaseProduct:
-    def __init__(self, data: dict):
-        required_fields = ["name", "date_of_receipt", "count"]
-        for field in required_fields:
-            if field not in data:
-                raise ValidationError(f"Field '{field}' is missing")
-        self.name = data["name"]
-        try:
-            self.date_of_receipt = datetime.strptime(data["date_of_receipt"], "%d.%m.%Y")
-        except ValueError:
-            raise ValidationError("Неверный формат даты, ожидается 'DD.MM.YYYY'")
-        if "date_of_write_off" in data:
-            try:
-                self.date_of_write_off = datetime.strptime(data["date_of_write_off"], "%d.%m.%Y")
-            except ValueError:
-                raise ValidationError("Неверный формат даты списания, ожидается 'DD.MM.YYYY'")
-        else:
-            self.date_of_write_off = None
-        if not isinstance(data["count"], int):
-            raise ValidationError("Поле 'count' должно быть числом")
-        self.count = data["count"]
+    __slots__ = ("name", "date_of_receipt", "_date_of_write_off", "_count", "key", "dirty", "_fingerprint")
+    kind = "BaseProduct"
+
+    schema = Schema("Field '{}' is missing", (
+        Field("name"),
+        Field("date_of_receipt", DATE, "Неверный формат даты, ожидается 'DD.MM.YYYY'"),
+        Field("date_of_write_off", DATE, "Неверный формат даты списания, ожидается 'DD.MM.YYYY'",
+              optional=True, attr="_date_of_write_off"),
+        Field("count", INT, "Поле 'count' должно быть числом", attr="_count"),
+    ))
+
+    # __init__(self, data) генерируется по схеме в конце модуля; кроме полей
+    # он задает key (ключ "ProdN" в файле) и dirty (признак несохраненных изменений)
+
+    # изменяемые поля сбрасывают кэш отпечатка; остальные задаются только при создании
+    @property
+    def date_of_write_off(self):
+        return self._date_of_write_off
+
+    @date_of_write_off.setter
+    def date_of_write_off(self, value):
+        self._date_of_write_off = value
+        self._fingerprint = None
+
+    @property
+    def count(self):
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+        self._fingerprint = None
+
+    def content_key(self, include_count=True):
+        """
+        Кортеж полей, которые сравнивает __eq__. Даты представлены порядковыми
+        номерами дней. Без количества (include_count=False) ключ подходит
+        для поиска одинаковых продуктов с разным количеством.
+        """
+        write_off = self.date_of_write_off
+        return (self.kind, self.name, self.date_of_receipt.toordinal(),
+                write_off.toordinal() if write_off else 0,
+                int(self.count) if include_count else None) + self._extra_key()
+
+    def _extra_key(self):
+        return ()
+
+    @property
+    def fingerprint(self):
+        """Кэшируемый отпечаток содержимого, согласованный с __eq__."""
+        fingerprint = self._fingerprint
+        if fingerprint is None:
+            fingerprint = self._fingerprint = fingerprint_of(self.content_key())
+        return fingerprint
+
+    def __hash__(self):
+        return self.fingerprint
 
     @property
     def formated_date_of_receipt(self):
-        return self.date_of_receipt.strftime('%d.%m.%Y')
+        return format_date(self.date_of_receipt)
 
     @property
     def formated_date_of_write_off(self):
         if self.date_of_write_off:
-            return self.date_of_write_off.strftime('%d.%m.%Y')
+            return format_date(self.date_of_write_off)
         return "Не списано"
 
     def __eq__(self, other):
@@ -47,18 +90,14 @@ class BaseProduct:
                 f"count={self.count}, write_off_date={self.formated_date_of_write_off}>")
 
 class Clothing(BaseProduct):
-    def __init__(self, data: dict):
-        super().__init__(data)
-        required_fields = ["size", "color", "material"]
-        for field in required_fields:
-            if field not in data:
-                raise ValidationError(f"Поле '{field}' отсутствует в Clothing")
-        sizes = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
-        if data["size"] not in sizes:
-            raise ValidationError(f"Поле 'size' неверно задано")
-        self.size = data["size"]
-        self.color = data["color"]
-        self.material = data["material"]
+    __slots__ = ("size", "color", "material")
+    kind = "Clothing"
+
+    schema = Schema("Поле '{}' отсутствует в Clothing", (
+        Field("size", CHOICE, "Поле 'size' неверно задано", choices=("XS", "S", "M", "L", "XL", "XXL", "XXXL")),
+        Field("color"),
+        Field("material"),
+    ))
 
     def __eq__(self, other):
         if not super().__eq__(other):
@@ -69,37 +108,27 @@ class Clothing(BaseProduct):
                 self.color == other.color and
                 self.material == other.material)
 
+    __hash__ = BaseProduct.__hash__
+
+    def _extra_key(self):
+        return (self.size, self.color, self.material)
+
     def __repr__(self):
         return (f"<Clothing name={self.name}, date={self.formated_date_of_receipt}, "
                 f"count={self.count}, size={self.size}, color={self.color}, "
                 f"material={self.material}, write_off_date={self.formated_date_of_write_off}>")
 
 class Furniture(BaseProduct):
-    def __init__(self, data: dict):
-        super().__init__(data)
-        required_fields = ["material", "dimensions", "weight"]
-        for field in required_fields:
-            if field not in data:
-                raise ValidationError(f"Field '{field}' is missing in Furniture")
-        self.material = data["material"]
-        dimensions_str = data["dimensions"]
-        dimensions_parts = dimensions_str.split('x')
-        if len(dimensions_parts) != 3:
-            raise ValidationError("Размеры должны быть в формате <int>x<int>x<int>")
-        try:
-            width = int(dimensions_parts[0])
-            length = int(dimensions_parts[1])
-            height = int(dimensions_parts[2])
-        except:
-            raise ValidationError("Размеры должны быть только числами")
-        if width <= 0 or length <= 0 or height <= 0:
-            raise ValidationError("Размеры должны быть положительными числами")
-        self.dimensions = data["dimensions"]
-        if not isinstance(data["weight"], int):
-            raise ValidationError("Поле 'weight' должно быть числом")
-        if data["weight"] < 0:
-            raise ValidationError("Поле 'weight' должно быть положительным")
-        self.weight = data["weight"]
+    __slots__ = ("material", "dimensions", "weight")
+    kind = "Furniture"
+
+    schema = Schema("Field '{}' is missing in Furniture", (
+        Field("material"),
+        Field("dimensions", DIMENSIONS, ("Размеры должны быть в формате <int>x<int>x<int>",
+                                         "Размеры должны быть только числами",
+                                         "Размеры должны быть положительными числами")),
+        Field("weight", INT, ("Поле 'weight' должно быть числом", "Поле 'weight' должно быть положительным")),
+    ))
 
     def __eq__(self, other):
         if not super().__eq__(other):
@@ -110,7 +139,18 @@ class Furniture(BaseProduct):
                 self.dimensions == other.dimensions and
                 self.weight == other.weight)
 
+    __hash__ = BaseProduct.__hash__
+
+    def _extra_key(self):
+        return (self.material, self.dimensions, int(self.weight))
+
     def __repr__(self):
         return (f"<Furniture name={self.name}, date={self.formated_date_of_receipt}, "
                 f"count={self.count}, material={self.material}, dimensions={self.dimensions}, "
                 f"weight={self.weight}, write_off_date={self.formated_date_of_write_off}>")
+
+for _cls in (BaseProduct, Clothing, Furniture):
+    _cls.__init__ = compile_init(_cls)
+
+# тип продукта по набору полей записи: одежда, затем мебель, иначе базовый продукт
+product_class = KeySetDispatch((Clothing, Furniture), BaseProduct)
@@ -0,0 +1,162 @@
+"""
+Декларативные схемы продуктов и их компиляция.
+
+Схема перечисляет поля типа продукта и проверки для них. compile_init один раз
+генерирует по цепочке схем класса и его предков функцию __init__ с развернутыми
+проверками: без циклов по спискам полей и без пересоздания констант на каждый
+продукт. Сообщения об ошибках задаются в схеме и не меняются.
+"""
+from dates import parse_date
+from validation import ValidationError
+
+
+class Field:
+    """
+    Поле схемы. check — вид проверки (ANY, DATE, INT, CHOICE, DIMENSIONS),
+    errors — сообщения для ее нарушений, attr — атрибут продукта, если он
+    отличается от имени поля. Необязательное поле без значения дает None.
+    """
+
+    def __init__(self, name, check=None, errors=(), optional=False, attr=None, choices=()):
+        self.name = name
+        self.check = check or ANY
+        self.errors = (errors,) if isinstance(errors, str) else tuple(errors)
+        self.optional = optional
+        self.attr = attr or name
+        self.choices = tuple(choices)
+
+
+class Schema:
+    """Поля одного типа продукта (без полей предков) и шаблон сообщения об отсутствующем поле."""
+
+    def __init__(self, missing, fields):
+        self.missing = missing
+        self.fields = tuple(fields)
+
+    @property
+    def required(self):
+        return tuple(field.name for field in self.fields if not field.optional)
+
+
+# Генераторы кода проверок: получают поле, выражение со значением и отступ,
+# возвращают строки, которые проверяют значение и записывают его в атрибут.
+
+def ANY(field, value, indent, constants):
+    return [f"{indent}self.{field.attr} = {value}"]
+
+
+def DATE(field, value, indent, constants):
+    return [
+        f"{indent}try:",
+        f"{indent}    self.{field.attr} = parse_date({value})",
+        f"{indent}except ValueError:",
+        f"{indent}    raise ValidationError({field.errors[0]!r})",
+    ]
+
+
+def INT(field, value, indent, constants):
+    # второе сообщение, если задано, запрещает отрицательные значения
+    lines = [
+        f"{indent}value = {value}",
+        f"{indent}if not isinstance(value, int):",
+        f"{indent}    raise ValidationError({field.errors[0]!r})",
+    ]
+    if len(field.errors) > 1:
+        lines += [f"{indent}if value < 0:",
+                  f"{indent}    raise ValidationError({field.errors[1]!r})"]
+    return lines + [f"{indent}self.{field.attr} = value"]
+
+
+def CHOICE(field, value, indent, constants):
+    name = f"CHOICES_{len(constants)}"
+    # кортеж, а не множество: непривычное значение (например, список) дает ошибку проверки, а не TypeError
+    constants[name] = field.choices
+    return [
+        f"{indent}value = {value}",
+        f"{indent}if value not in {name}:",
+        f"{indent}    raise ValidationError({field.errors[0]!r})",
+        f"{indent}self.{field.attr} = value",
+    ]
+
+
+def DIMENSIONS(field, value, indent, constants):
+    # строка вида <int>x<int>x<int> с положительными числами
+    wrong_format, not_numbers, not_positive = field.errors
+    return [
+        f"{indent}value = {value}",
+        f"{indent}parts = value.split('x')",
+        f"{indent}if len(parts) != 3:",
+        f"{indent}    raise ValidationError({wrong_format!r})",
+        f"{indent}try:",
+        f"{indent}    width = int(parts[0])",
+        f"{indent}    length = int(parts[1])",
+        f"{indent}    height = int(parts[2])",
+        f"{indent}except:",
+        f"{indent}    raise ValidationError({not_numbers!r})",
+        f"{indent}if width <= 0 or length <= 0 or height <= 0:",
+        f"{indent}    raise ValidationError({not_positive!r})",
+        f"{indent}self.{field.attr} = value",
+    ]
+
+
+def schema_chain(cls):
+    """Схемы класса и его предков, начиная с самого базового."""
+    return [klass.__dict__["schema"] for klass in reversed(cls.__mro__) if "schema" in klass.__dict__]
+
+
+def compile_init(cls):
+    """
+    Генерирует __init__(self, data) для класса продукта: служебные атрибуты,
+    затем для каждой схемы от предка к потомку — проверка наличия обязательных
+    полей и проверки значений в порядке их объявления.
+    """
+    constants = {"ValidationError": ValidationError, "parse_date": parse_date}
+    lines = [
+        "def __init__(self, data):",
+        "    self.key = None",
+        "    self.dirty = False",
+        "    self._fingerprint = None",
+    ]
+    for schema in schema_chain(cls):
+        for name in schema.required:
+            lines += [f"    if {name!r} not in data:",
+                      f"        raise ValidationError({schema.missing.format(name)!r})"]
+        for field in schema.fields:
+            value = f"data[{field.name!r}]"
+            if field.optional:
+                lines.append(f"    if {field.name!r} in data:")
+                lines += field.check(field, value, " " * 8, constants)
+                lines += ["    else:", f"        self.{field.attr} = None"]
+            else:
+                lines += field.check(field, value, " " * 4, constants)
+    namespace = {}
+    exec(compile("\n".join(lines), f"<schema {cls.__name__}>", "exec"), constants, namespace)
+    init = namespace["__init__"]
+    init.__qualname__ = f"{cls.__name__}.__init__"
+    return init
+
+
+class KeySetDispatch:
+    """
+    Выбор класса продукта по набору ключей записи. Класс подходит, если в записи
+    есть все обязательные поля его собственной схемы; классы проверяются по порядку,
+    иначе берется default. Результат для каждого встреченного набора ключей
+    запоминается, так что для типичной записи выбор — один поиск в словаре.
+    """
+
+    MAX_CACHED = 1024
+
+    def __init__(self, classes, default):
+        self.rules = [(frozenset(cls.__dict__["schema"].required), cls) for cls in classes]
+        self.default = default
+        self.cache = {}
+
+    def __call__(self, item):
+        keys = frozenset(item)
+        cls = self.cache.get(keys)
+        if cls is None:
+            cls = next((cls for required, cls in self.rules if required <= keys), self.default)
+            # произвольные наборы ключей из испорченных файлов не должны раздувать кэш
+            if len(self.cache) < self.MAX_CACHED:
+                self.cache[keys] = cls
+        return cls
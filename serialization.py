@@ -0,0 +1,95 @@
+"""
+Кодирование и декодирование JSON с необязательными быстрыми библиотеками.
+
+Используется первая установленная библиотека из orjson и ujson, иначе
+стандартный модуль json; переменная окружения INVENTORY_JSON=orjson|ujson|json
+задает ее явно. Все варианты читают str и bytes, а пишут bytes в UTF-8
+без экранирования не-ASCII символов: компактно, без пробелов, или с отступом
+в два пробела, как json.dump(..., indent=2).
+
+Файлы склада по умолчанию пишутся с отступом. Компактный режим (продукт —
+одна строка без пробелов внутри) включается переменной INVENTORY_JSON_COMPACT
+или вызовом set_compact(); он в несколько раз быстрее и дает файл меньше.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class Backend:
+    """Библиотека JSON: loads(str | bytes), dumps(obj) -> bytes и dumps_indented(obj) -> bytes."""
+
+    def __init__(self, name, loads, dumps, dumps_indented):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.dumps_indented = dumps_indented
+
+    def __repr__(self):
+        return f"<Backend {self.name}>"
+
+
+def _orjson():
+    def dumps_indented(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    return Backend("orjson", orjson.loads, orjson.dumps, dumps_indented)
+
+
+def _ujson():
+    def dumps(obj, indent=0):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, indent=indent).encode("utf-8")
+
+    return Backend("ujson", ujson.loads, dumps, lambda obj: dumps(obj, 2))
+
+
+def _stdlib():
+    compact = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    indented = json.JSONEncoder(ensure_ascii=False, indent=2)
+    return Backend("json", json.loads,
+                   lambda obj: compact.encode(obj).encode("utf-8"),
+                   lambda obj: indented.encode(obj).encode("utf-8"))
+
+
+# в порядке предпочтения; стандартный модуль есть всегда
+BACKENDS = {name: make() for name, module, make in (
+    ("orjson", orjson, _orjson),
+    ("ujson", ujson, _ujson),
+    ("json", json, _stdlib),
+) if module is not None}
+
+
+def get_backend(name=None):
+    """Библиотека по имени; без имени — самая быстрая из установленных."""
+    if name is None:
+        return next(iter(BACKENDS.values()))
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Библиотека JSON {name!r} не установлена, доступны: {', '.join(BACKENDS)}") from None
+
+
+backend = get_backend(os.environ.get("INVENTORY_JSON") or None)
+compact = bool(os.environ.get("INVENTORY_JSON_COMPACT"))
+
+
+def set_compact(on=True):
+    global compact
+    compact = on
+
+
+def loads(data):
+    return backend.loads(data)
+
+
+def dumps(obj, indent=False):
+    return backend.dumps_indented(obj) if indent else backend.dumps(obj)
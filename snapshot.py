@@ -0,0 +1,160 @@
+"""
+Бинарный снимок склада — файл <имя файла>.snap рядом с основным JSON.
+
+Снимок хранит колонки ProductStore как есть: заголовок с отпечатком исходного JSON
+(mtime, размер и blake2b-хэш) и секции с байтами массивов, выровненные по 8 байт.
+При запуске снимок отображается в память и колонки восстанавливаются через
+array.frombytes, без разбора JSON и повторной проверки продуктов. Если JSON
+изменился после записи снимка, снимок считается устаревшим и не используется.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from store import ProductStore, TextColumn
+
+MAGIC = b"INVSNAP1"
+VERSION = 1
+# magic, версия, порядок байт, mtime_ns и размер исходного JSON, число строк, хэш JSON
+HEADER = struct.Struct("<8sHBxxxxxqqq32s")
+LENGTH = struct.Struct("<q")
+ARRAY_COLUMNS = ("kinds", "receipt", "write_off", "counts", "weights",
+                 "sizes", "colors", "materials", "dimensions")
+TEXT_COLUMNS = ("keys", "names")
+BYTE_ORDERS = {"little": 0, "big": 1}
+
+
+def snapshot_path(filename):
+    return filename + ".snap"
+
+
+def file_digest(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=32)).digest()
+
+
+def _sections(store):
+    for column in ARRAY_COLUMNS:
+        yield getattr(store, column)
+    for column in TEXT_COLUMNS:
+        text = getattr(store, column)
+        yield text.data
+        yield text.starts
+        yield text.ends
+    # таблица строк — один UTF-8 буфер и концы строк в нем
+    ends = array('q')
+    data = bytearray()
+    for value in store.strings.strings:
+        data += value.encode("utf-8")
+        ends.append(len(data))
+    yield data
+    yield ends
+
+
+def write(filename, store):
+    """
+    Атомарно записывает снимок store для JSON-файла filename.
+    Вызывается сразу после сохранения JSON: в заголовок попадает его текущий отпечаток.
+    """
+    info = os.stat(filename)
+    header = HEADER.pack(MAGIC, VERSION, BYTE_ORDERS[sys.byteorder], info.st_mtime_ns,
+                         info.st_size, len(store), file_digest(filename))
+    path = snapshot_path(filename)
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", suffix=".snap",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            for section in _sections(store):
+                raw = memoryview(section).cast('B')
+                f.write(LENGTH.pack(len(raw)))
+                f.write(raw)
+                f.write(b"\0" * (-len(raw) % 8))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _read_header(mapped, filename):
+    if len(mapped) < HEADER.size:
+        return None
+    magic, version, byte_order, mtime_ns, size, rows, digest = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDERS[sys.byteorder]:
+        return None
+    try:
+        info = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    # сначала дешевая проверка mtime и размера, хэш считается только если они совпали
+    if info.st_mtime_ns != mtime_ns or info.st_size != size:
+        return None
+    if file_digest(filename) != digest:
+        return None
+    return rows
+
+
+def load(filename):
+    """
+    Загружает снимок для JSON-файла filename в ProductStore.
+    Возвращает None, если снимка нет, он поврежден или JSON изменился после его записи.
+    """
+    try:
+        f = open(snapshot_path(filename), 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            rows = _read_header(mapped, filename)
+            if rows is None:
+                return None
+            try:
+                return _restore(mapped, rows)
+            except (struct.error, ValueError):
+                return None
+
+
+def _restore(mapped, rows):
+    position = HEADER.size
+
+    def section(typecode=None):
+        nonlocal position
+        (length,) = LENGTH.unpack_from(mapped, position)
+        position += LENGTH.size
+        end = position + length
+        if end > len(mapped):
+            raise ValueError("Обрезанный снимок")
+        raw = mapped[position:end]
+        position = end + (-length % 8)
+        if typecode is None:
+            return bytearray(raw)
+        values = array(typecode)
+        values.frombytes(raw)
+        return values
+
+    store = ProductStore()
+    for column in ARRAY_COLUMNS:
+        setattr(store, column, section(getattr(store, column).typecode))
+    for column in TEXT_COLUMNS:
+        text = TextColumn()
+        text.data = section()
+        text.starts = section('q')
+        text.ends = section('q')
+        setattr(store, column, text)
+    data = section()
+    ends = section('q')
+    start = 0
+    for end in ends:
+        store.strings.intern(data[start:end].decode("utf-8"))
+        start = end
+    if any(len(column) != rows for column in (*(getattr(store, name) for name in ARRAY_COLUMNS),
+                                              store.keys, store.names)):
+        raise ValueError("Несогласованные колонки снимка")
+    return store
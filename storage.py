@@ -0,0 +1,509 @@
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+from collections.abc import Sequence
+import snapshot
+from datetime import datetime
+from dates import format_date, parse_date
+from journal import Journal
+from jsonindex import IndexedJsonFile, LazyProducts
+from models import BaseProduct, Clothing, Furniture
+from store import ProductStore
+from utils import build_product, iter_products, logger, parse_files_parallel, product_class, product_to_dict
+from watcher import JsonReloader, ShardedReloader
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+GLOB_CHARS = "*?["
+DEFAULT_SHARD = "inventory.json"
+
+
+class JsonStorage:
+    """
+    Хранилище в JSON-файле; правки дописываются в журнал рядом с ним.
+    Полное сохранение с write_snapshot=True (из интерфейса) пишет рядом бинарный снимок,
+    из которого следующий запуск загружает продукты без разбора JSON, пока файл не изменится.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal = Journal(filename)
+        # индекс смещений открывается один раз и переоткрывается, только если файл изменился
+        self.indexed = None
+
+    def iter_products(self, progress=None):
+        return self.journal.apply(self._iter_source(progress))
+
+    def _iter_source(self, progress=None):
+        store = snapshot.load(self.filename)
+        if store is None:
+            yield from iter_products(self.filename, progress=progress)
+            return
+        total = len(store)
+        for row, product in enumerate(store):
+            if progress is not None and row % 65536 == 0:
+                progress(row, total)
+            yield product
+        if progress is not None:
+            progress(total, total)
+
+    def _indexed(self):
+        """
+        IndexedJsonFile основного файла или None, если файла нет или у него есть журнал.
+        Устаревший экземпляр не закрывается: его строки еще может читать LazyProducts.
+        """
+        if not os.path.exists(self.filename) or os.path.exists(self.journal.path):
+            return None
+        if self.indexed is None or self.indexed.closed or self.indexed.stale():
+            self.indexed = IndexedJsonFile(self.filename)
+        return self.indexed
+
+    def lazy_products(self):
+        """
+        Продукты для виртуальной таблицы без полного разбора файла: LazyProducts
+        поверх индекса смещений. None, если у файла есть журнал — тогда продукты
+        загружаются обычным потоком.
+        """
+        indexed = self._indexed()
+        return None if indexed is None else LazyProducts(indexed)
+
+    def needs_full_save(self, pending):
+        return self.journal.needs_compaction(pending)
+
+    def assign_key(self, key):
+        """Ключ, под которым хранится новый продукт с ключом key; в одном файле он не меняется."""
+        return key
+
+    def save_changes(self, changes):
+        """Сохраняет изменения: ключ -> данные продукта в формате файла или None для удаленных."""
+        self.journal.append(changes)
+
+    def save_all(self, products, write_snapshot=False):
+        """
+        Перезаписывает файл продуктами и очищает журнал. Без снимка продукты
+        пишутся потоком и в памяти не копятся; снимок держит их все в ProductStore.
+        """
+        if not write_snapshot:
+            self.journal.compact(products)
+            return
+        store = ProductStore()
+
+        def collect():
+            for product in products:
+                # ключи те же, что dump_products дает продуктам без ключа
+                store.append(product, f"Prod{len(store) + 1}" if product.key is None else None)
+                yield product
+
+        self.journal.compact(collect())
+        try:
+            snapshot.write(self.filename, store)
+        except OSError as e:
+            # без снимка следующий запуск просто прочитает JSON
+            logger.error(f"Ошибка записи снимка {snapshot.snapshot_path(self.filename)}: {e}")
+
+    def watch(self):
+        """Отслеживание изменений файла и журнала другими процессами."""
+        return JsonReloader(self.filename)
+
+    def update_write_off(self, product):
+        self.journal.append({product.key: product_to_dict(product)})
+
+    def close(self):
+        if self.indexed is not None:
+            self.indexed.close()
+            self.indexed = None
+
+
+class SqliteStorage:
+    """
+    Хранилище в базе SQLite (режим WAL): отдельная таблица на каждый тип продукта,
+    индексы по имени и датам. Общий порядок продуктов задает столбец position.
+    Даты хранятся как текст YYYY-MM-DD.
+    """
+
+    TABLES = {
+        BaseProduct: ("base_products", ()),
+        Clothing: ("clothing", ("size", "color", "material")),
+        Furniture: ("furniture", ("material", "dimensions", "weight")),
+    }
+    COMMON = ("key", "position", "name", "date_of_receipt", "date_of_write_off", "count")
+
+    def __init__(self, filename):
+        self.filename = filename
+        # соединение используется из рабочих потоков загрузки и сохранения по очереди
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            for table, extra in self.TABLES.values():
+                columns = ", ".join(f"{column} {'INTEGER' if column == 'weight' else 'TEXT'} NOT NULL"
+                                    for column in extra)
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "key TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, "
+                    "date_of_receipt TEXT NOT NULL, date_of_write_off TEXT, count INTEGER NOT NULL"
+                    + (f", {columns}" if columns else "") + ")")
+                for column in ("position", "name", "date_of_receipt", "date_of_write_off"):
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table}({column})")
+
+    @staticmethod
+    def _to_iso(value):
+        return parse_date(value).strftime("%Y-%m-%d") if value else None
+
+    @staticmethod
+    def _from_iso(value):
+        return format_date(datetime.fromisoformat(value))
+
+    def _table_of(self, product):
+        for cls in (Clothing, Furniture):
+            if isinstance(product, cls):
+                return self.TABLES[cls][0]
+        return self.TABLES[BaseProduct][0]
+
+    def _select(self, where="", order_limit=""):
+        parts = []
+        for cls, (table, extra) in self.TABLES.items():
+            columns = list(self.COMMON)
+            for column in ("size", "color", "material", "dimensions", "weight"):
+                columns.append(column if column in extra else f"NULL AS {column}")
+            parts.append(f"SELECT {', '.join(columns)} FROM {table} {where}")
+        return " UNION ALL ".join(parts) + f" ORDER BY position {order_limit}"
+
+    def _row_to_product(self, row):
+        key, _, name, receipt, write_off, count, size, color, material, dimensions, weight = row
+        item = {"name": name, "date_of_receipt": self._from_iso(receipt), "count": count}
+        if write_off is not None:
+            item["date_of_write_off"] = self._from_iso(write_off)
+        for field, value in (("size", size), ("color", color), ("material", material),
+                             ("dimensions", dimensions), ("weight", weight)):
+            if value is not None:
+                item[field] = value
+        try:
+            return build_product(item, key)
+        except Exception as e:
+            logger.error("Ошибка обработки продукта %s из %s: %s", key, self.filename, e)
+            return None
+
+    def count(self):
+        with self.lock:
+            return sum(self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                       for table, _ in self.TABLES.values())
+
+    def keys(self):
+        """Ключи всех продуктов в порядке position; сами продукты не читаются."""
+        query = " UNION ALL ".join(f"SELECT key, position FROM {table}" for table, _ in self.TABLES.values())
+        with self.lock:
+            return [key for key, _ in self.connection.execute(f"{query} ORDER BY position")]
+
+    def products_by_key(self, keys):
+        """Словарь ключ -> продукт для переданных ключей; отсутствующие и некорректные строки пропускаются."""
+        keys = list(keys)
+        marks = ", ".join("?" * len(keys))
+        with self.lock:
+            rows = self.connection.execute(self._select(where=f"WHERE key IN ({marks})"),
+                                           keys * len(self.TABLES)).fetchall()
+        products = {}
+        for row in rows:
+            product = self._row_to_product(row)
+            if product is not None:
+                products[product.key] = product
+        return products
+
+    def iter_products(self, progress=None, page_size=10000):
+        """Читает продукты страницами по position, не держа в памяти всю таблицу."""
+        total = self.count()
+        last_position = -1
+        done = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    self._select(where="WHERE position > ?", order_limit="LIMIT ?"),
+                    (last_position,) * len(self.TABLES) + (page_size,)).fetchall()
+            if not rows:
+                return
+            last_position = rows[-1][1]
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+            for row in rows:
+                product = self._row_to_product(row)
+                if product is not None:
+                    yield product
+
+    def needs_full_save(self, pending):
+        return False
+
+    def _upsert(self, key, data, position=None):
+        table, extra = self.TABLES[product_class(data)]
+        if position is None:
+            # тип продукта мог смениться — удаляем запись из остальных таблиц
+            for other, _ in self.TABLES.values():
+                if other != table:
+                    self.connection.execute(f"DELETE FROM {other} WHERE key = ?", (key,))
+            position = self._next_position()
+        columns = ("key", "name", "date_of_receipt", "date_of_write_off", "count") + extra
+        values = (key, data["name"], self._to_iso(data["date_of_receipt"]),
+                  self._to_iso(data.get("date_of_write_off")), data["count"]) + tuple(data[c] for c in extra)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        self.connection.execute(
+            f"INSERT INTO {table} (position, {', '.join(columns)}) "
+            f"VALUES (?, {', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(key) DO UPDATE SET {updates}",
+            (position,) + values)
+
+    def _next_position(self):
+        return 1 + max(self.connection.execute(f"SELECT COALESCE(MAX(position), -1) FROM {table}").fetchone()[0]
+                       for table, _ in self.TABLES.values())
+
+    def assign_key(self, key):
+        return key
+
+    def save_changes(self, changes):
+        """Сохраняет изменения одной транзакцией, затрагивая только измененные строки."""
+        with self.lock, self.connection:
+            for key, data in changes.items():
+                if data is None:
+                    for table, _ in self.TABLES.values():
+                        self.connection.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                else:
+                    self._upsert(key, data)
+
+    def save_all(self, products, write_snapshot=False):
+        """Заменяет содержимое базы переданными продуктами; снимок базе не нужен."""
+        with self.lock, self.connection:
+            for table, _ in self.TABLES.values():
+                self.connection.execute(f"DELETE FROM {table}")
+            for position, product in enumerate(products):
+                self._upsert(product.key or f"Prod{position + 1}", product_to_dict(product), position)
+
+    def watch(self):
+        # правки другого процесса могут остаться в файле -wal, не меняя mtime базы
+        return None
+
+    def lazy_products(self):
+        """Продукты для виртуальной таблицы: LazyProducts, читающий строки базы страницами."""
+        return LazyProducts(SqliteRows(self))
+
+    def update_write_off(self, product):
+        """Обновляет дату списания одной строки."""
+        table = self._table_of(product)
+        write_off = product.date_of_write_off.strftime("%Y-%m-%d") if product.date_of_write_off else None
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE {table} SET date_of_write_off = ? WHERE key = ?",
+                                    (write_off, product.key))
+
+    def close(self):
+        self.connection.close()
+
+
+class SqliteRows(Sequence):
+    """
+    Строки базы SQLite для LazyProducts. Ключи в порядке position читаются одним
+    запросом при открытии, продукты — при первом обращении страницей из PAGE_SIZE
+    соседних строк. Страница выбирается по ключам, а не по смещению, поэтому правки,
+    сохраненные после открытия, не сдвигают строки. Соединение принадлежит хранилищу.
+    """
+
+    PAGE_SIZE = 256
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.keys = storage.keys()
+        self.loaded = {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("SqliteRows index out of range")
+        product = self.loaded.get(row)
+        if product is None:
+            start = row - row % self.PAGE_SIZE
+            rows = [r for r in range(start, min(start + self.PAGE_SIZE, len(self))) if r not in self.loaded]
+            found = self.storage.products_by_key(self.keys[r] for r in rows)
+            for r in rows:
+                if self.keys[r] in found:
+                    # страницу могут одновременно читать главный и рабочий поток: оба получат одни объекты
+                    self.loaded.setdefault(r, found[self.keys[r]])
+            product = self.loaded.get(row)
+            if product is None:
+                raise KeyError(f"Продукта {self.keys[row]} нет в {self.storage.filename}")
+        return product
+
+
+class ShardedStorage:
+    """
+    Склад из нескольких JSON-файлов (по файлу на склад): каталог или glob-шаблон.
+    Файлы читаются пулом потоков, а продукты проверяются пулом процессов, после чего
+    объединяются в один список в порядке имен файлов. Ключ продукта в объединенном
+    списке — "<имя файла>/<ключ в файле>", по нему определяется исходный файл.
+    Каждый файл ведется как JsonStorage со своим журналом, поэтому сохранение
+    затрагивает только файлы с изменениями. Новые продукты попадают в файл по умолчанию:
+    первый найденный или inventory.json в каталоге.
+    """
+
+    def __init__(self, source, workers=None):
+        self.source = source
+        self.workers = workers or os.cpu_count() or 1
+        if os.path.isdir(source):
+            paths = glob.glob(os.path.join(glob.escape(source), "*.json"))
+        else:
+            paths = glob.glob(source)
+        self.shards = {os.path.basename(path): JsonStorage(path) for path in sorted(paths)}
+        if self.shards:
+            self.default = next(iter(self.shards))
+        elif os.path.isdir(source):
+            self.default = DEFAULT_SHARD
+            self.shards[DEFAULT_SHARD] = JsonStorage(os.path.join(source, DEFAULT_SHARD))
+        else:
+            raise ValueError(f"Нет файлов склада по шаблону {source}")
+        # ключи новых продуктов без файла -> (файл, ключ в файле), назначенные в assign_key или при сохранении
+        self.assigned = {}
+        # наибольший номер ключа ProdN в каждом файле
+        self.last_numbers = {}
+
+    def source_of(self, key):
+        """Имя файла, в котором хранится (или будет сохранен) продукт с ключом key."""
+        located = self._locate(key, create=False)
+        return located[0] if located else self.default
+
+    def iter_products(self, progress=None):
+        filenames = [shard.filename for shard in self.shards.values()]
+        sizes = [os.path.getsize(filename) if os.path.exists(filename) else 0 for filename in filenames]
+        total, done = sum(sizes), 0
+        loaded = parse_files_parallel(filenames, self.workers)
+        for (name, shard), size, (_, products) in zip(self.shards.items(), sizes, loaded):
+            for product in shard.journal.apply(products):
+                self._note_number(name, product.key)
+                product.key = f"{name}/{product.key}"
+                yield product
+            done += size
+            if progress is not None:
+                progress(done, total)
+
+    def _note_number(self, name, key):
+        if key and key.startswith("Prod") and key[4:].isdigit():
+            self.last_numbers[name] = max(self.last_numbers.get(name, 0), int(key[4:]))
+
+    def _next_key(self, name):
+        if name not in self.last_numbers:
+            self.last_numbers[name] = 0
+            for product in self.shards[name].iter_products():
+                self._note_number(name, product.key)
+        self.last_numbers[name] += 1
+        return f"Prod{self.last_numbers[name]}"
+
+    def _locate(self, key, create=True):
+        """(файл, ключ в файле) для ключа продукта; новым ключам назначается место в файле по умолчанию."""
+        name, sep, local = (key or "").partition("/")
+        if sep and name in self.shards:
+            return name, local
+        located = self.assigned.get(key)
+        if located is None and create:
+            located = self.assigned[key] = (self.default, self._next_key(self.default))
+        return located
+
+    def assign_key(self, key):
+        """
+        Ключ "<файл>/<ключ в файле>" для нового продукта с ключом key: место в файле
+        по умолчанию назначается сразу, поэтому после сохранения ключ в памяти совпадает
+        с ключом, под которым продукт перечитывается из файла.
+        """
+        name, local = self._locate(key)
+        return f"{name}/{local}"
+
+    def needs_full_save(self, pending):
+        # каждый файл сам сворачивает свой журнал в save_changes
+        return False
+
+    def save_changes(self, changes):
+        """Раскладывает изменения по файлам и сохраняет только затронутые файлы."""
+        by_shard = {}
+        for key, data in changes.items():
+            located = self._locate(key, create=data is not None)
+            if located is not None:
+                name, local = located
+                by_shard.setdefault(name, {})[local] = data
+        for name, local_changes in by_shard.items():
+            shard = self.shards[name]
+            if shard.needs_full_save(len(local_changes)):
+                current = {product.key: product for product in shard.iter_products()}
+                for local, data in local_changes.items():
+                    if data is None:
+                        current.pop(local, None)
+                    else:
+                        current[local] = build_product(data, local)
+                shard.save_all(current.values())
+            else:
+                shard.save_changes(local_changes)
+
+    def save_all(self, products, write_snapshot=False):
+        """
+        Перезаписывает все файлы; продукты без файла попадают в файл по умолчанию.
+        Снимки не пишутся: файлы склада читаются параллельным разбором JSON, а не через снимок.
+        """
+        groups = {name: [] for name in self.shards}
+        for product in products:
+            name, local = self._locate(product.key)
+            groups[name].append(build_product(product_to_dict(product), local))
+        for name, group in groups.items():
+            self.shards[name].save_all(group)
+
+    def lazy_products(self):
+        # ключи файлов склада меняются при объединении, поэтому продукты загружаются потоком
+        return None
+
+    def watch(self):
+        reloaders = {name: shard.watch() for name, shard in self.shards.items()}
+        return ShardedReloader(reloaders, self._note_number)
+
+    def update_write_off(self, product):
+        self.save_changes({product.key: product_to_dict(product)})
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+
+def open_storage(filename):
+    """
+    Выбирает хранилище: каталог или glob-шаблон — склад из нескольких файлов,
+    SQLite для .db/.sqlite/.sqlite3, иначе JSON. Существующий файл открывается
+    как файл, даже если в его имени есть символы шаблона.
+    """
+    if os.path.isdir(filename) or (not os.path.isfile(filename)
+                                   and any(char in filename for char in GLOB_CHARS)):
+        return ShardedStorage(filename)
+    if os.path.splitext(filename)[1].lower() in SQLITE_EXTENSIONS:
+        return SqliteStorage(filename)
+    return JsonStorage(filename)
+
+
+def convert(source, destination):
+    """Переносит продукты между хранилищами, например JSON -> SQLite или обратно."""
+    src, dst = open_storage(source), open_storage(destination)
+    try:
+        dst.save_all(src.iter_products())
+    finally:
+        src.close()
+        dst.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт и экспорт склада между JSON и SQLite")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+    convert(args.source, args.destination)
@@ -0,0 +1,229 @@
+from array import array
+from datetime import datetime
+from models import BaseProduct, Clothing, Furniture, fingerprint_of
+
+BASE, CLOTHING, FURNITURE = 0, 1, 2
+NO_DATE = 0
+NO_STRING = -1
+
+
+class StringTable:
+    """Таблица строк: каждая уникальная строка хранится один раз, на нее ссылаются по номеру."""
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class TextColumn:
+    """Колонка строк, упакованных в один UTF-8 буфер со смещениями начала и конца."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = array('q')
+        self.ends = array('q')
+
+    def append(self, value):
+        self.starts.append(len(self.data))
+        self.data += value.encode("utf-8")
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, row):
+        return self.data[self.starts[row]:self.ends[row]].decode("utf-8")
+
+    def __setitem__(self, row, value):
+        # старое значение остается в буфере: имена меняются редко
+        self.starts[row] = len(self.data)
+        self.data += value.encode("utf-8")
+        self.ends[row] = len(self.data)
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class ProductStore:
+    """
+    Колоночное хранилище продуктов.
+    Числа и даты (в виде порядковых номеров дней) лежат в типизированных массивах,
+    имена и ключи — в упакованных текстовых колонках, остальные строки — в общей
+    таблице строк. Доступ к продуктам идет через представления, которые ведут
+    себя как обычные BaseProduct/Clothing/Furniture.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.kinds = array('b')
+        self.keys = TextColumn()
+        self.names = TextColumn()
+        self.receipt = array('i')
+        self.write_off = array('i')
+        self.counts = array('q')
+        self.weights = array('q')
+        self.sizes = array('i')
+        self.colors = array('i')
+        self.materials = array('i')
+        self.dimensions = array('i')
+
+    @classmethod
+    def from_products(cls, products):
+        store = cls()
+        for product in products:
+            store.append(product)
+        return store
+
+    def append(self, product, key=None):
+        """Добавляет продукт в хранилище и возвращает номер его строки. key подменяет product.key."""
+        intern = self.strings.intern
+        row = len(self.kinds)
+        self.keys.append(key or product.key or "")
+        self.names.append(product.name)
+        self.receipt.append(product.date_of_receipt.toordinal())
+        self.write_off.append(product.date_of_write_off.toordinal() if product.date_of_write_off else NO_DATE)
+        self.counts.append(product.count)
+        if isinstance(product, Clothing):
+            self.kinds.append(CLOTHING)
+            self.sizes.append(intern(product.size))
+            self.colors.append(intern(product.color))
+            self.materials.append(intern(product.material))
+            self.dimensions.append(NO_STRING)
+            self.weights.append(0)
+        elif isinstance(product, Furniture):
+            self.kinds.append(FURNITURE)
+            self.sizes.append(NO_STRING)
+            self.colors.append(NO_STRING)
+            self.materials.append(intern(product.material))
+            self.dimensions.append(intern(product.dimensions))
+            self.weights.append(product.weight)
+        else:
+            self.kinds.append(BASE)
+            for column in (self.sizes, self.colors, self.materials, self.dimensions):
+                column.append(NO_STRING)
+            self.weights.append(0)
+        return row
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("ProductStore index out of range")
+        return VIEW_CLASSES[self.kinds[row]](self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+def _string_column(column):
+    def getter(view):
+        return view._store.strings[getattr(view._store, column)[view._row]]
+
+    def setter(view, value):
+        getattr(view._store, column)[view._row] = view._store.strings.intern(value)
+
+    return property(getter, setter)
+
+
+def _value_column(column):
+    def getter(view):
+        return getattr(view._store, column)[view._row]
+
+    def setter(view, value):
+        getattr(view._store, column)[view._row] = value
+
+    return property(getter, setter)
+
+
+def _date_column(column):
+    def getter(view):
+        ordinal = getattr(view._store, column)[view._row]
+        return datetime.fromordinal(ordinal) if ordinal != NO_DATE else None
+
+    def setter(view, value):
+        getattr(view._store, column)[view._row] = value.toordinal() if value else NO_DATE
+
+    return property(getter, setter)
+
+
+def _key_column():
+    def getter(view):
+        return view._store.keys[view._row] or None
+
+    def setter(view, value):
+        view._store.keys[view._row] = value or ""
+
+    return property(getter, setter)
+
+
+class _BaseColumns:
+    __slots__ = ()
+    key = _key_column()
+    name = _value_column("names")
+    date_of_receipt = _date_column("receipt")
+    date_of_write_off = _date_column("write_off")
+    count = _value_column("counts")
+
+    @property
+    def fingerprint(self):
+        # колонки меняются в обход представления, поэтому отпечаток не кэшируется
+        return fingerprint_of(self.content_key())
+
+
+class _ClothingColumns(_BaseColumns):
+    __slots__ = ()
+    size = _string_column("sizes")
+    color = _string_column("colors")
+    material = _string_column("materials")
+
+
+class _FurnitureColumns(_BaseColumns):
+    __slots__ = ()
+    material = _string_column("materials")
+    dimensions = _string_column("dimensions")
+    weight = _value_column("weights")
+
+
+class BaseProductView(_BaseColumns, BaseProduct):
+    """Представление строки ProductStore с API и __eq__ класса BaseProduct."""
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self.dirty = False
+
+
+class ClothingView(_ClothingColumns, Clothing):
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self.dirty = False
+
+
+class FurnitureView(_FurnitureColumns, Furniture):
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self.dirty = False
+
+
+VIEW_CLASSES = {BASE: BaseProductView, CLOTHING: ClothingView, FURNITURE: FurnitureView}
@@ -0,0 +1,198 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class ProductTable:
+    """
+    Таблица с устойчивым соответствием продуктов и элементов Treeview.
+    Добавление, изменение и удаление продукта затрагивают только его строку.
+    """
+
+    def __init__(self, tree, row_values):
+        self.tree = tree
+        self.row_values = row_values
+        self.iids = {}
+        self.products_by_iid = {}
+
+    def set_rows(self, rows):
+        self.tree.delete(*self.tree.get_children())
+        self.iids.clear()
+        self.products_by_iid.clear()
+        for product in rows:
+            self.append(product)
+
+    def append(self, product):
+        self.insert(product, tk.END)
+
+    def insert(self, product, position):
+        iid = self.tree.insert("", position, values=self.row_values(product))
+        self.iids[id(product)] = iid
+        self.products_by_iid[iid] = product
+
+    def move(self, product, position):
+        iid = self.iids.get(id(product))
+        if iid is not None:
+            self.tree.move(iid, "", position)
+
+    def extend(self, products):
+        for product in products:
+            self.append(product)
+
+    def update(self, product):
+        iid = self.iids.get(id(product))
+        if iid is not None:
+            self.tree.item(iid, values=self.row_values(product))
+
+    def update_many(self, products):
+        for product in products:
+            self.update(product)
+
+    def replace(self, old, new):
+        """Показывает в строке продукта old продукт new."""
+        iid = self.iids.pop(id(old), None)
+        if iid is not None:
+            self.iids[id(new)] = iid
+            self.products_by_iid[iid] = new
+            self.tree.item(iid, values=self.row_values(new))
+
+    def select_all(self):
+        self.tree.selection_set(self.tree.get_children())
+
+    def remove(self, product):
+        iid = self.iids.pop(id(product), None)
+        if iid is not None:
+            del self.products_by_iid[iid]
+            self.tree.delete(iid)
+
+    def selected_products(self):
+        return [self.products_by_iid[iid] for iid in self.tree.selection()]
+
+
+class VirtualTable:
+    """
+    Виртуализированная таблица поверх ttk.Treeview.
+    В Treeview хранятся только строки видимого окна (плюс небольшой запас),
+    при прокрутке те же элементы заполняются значениями других строк.
+    Поэтому стоимость перерисовки не зависит от общего числа строк.
+    """
+
+    def __init__(self, tree, scrollbar, row_values, buffer=5):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_values = row_values
+        self.buffer = buffer
+        self.rows = []
+        self.offset = 0
+        self.slots = []
+        self.selected_rows = set()
+
+        self.scrollbar.configure(command=self.on_scroll)
+        self.tree.bind("<Configure>", lambda event: self.refresh())
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", self.on_mousewheel)
+        self.tree.bind("<Button-5>", self.on_mousewheel)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select, add="+")
+
+    def set_rows(self, rows):
+        # выделение хранится номерами строк: после сортировки или фильтра под теми же
+        # номерами (даже при том же их числе) оказываются другие продукты
+        self.selected_rows.clear()
+        self.rows = rows
+        self.refresh()
+
+    def visible_count(self):
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return int(self.tree.cget("height"))
+        return max(1, height // int(row_height))
+
+    def window(self):
+        """Возвращает границы [first, last) строк, которые нужно материализовать."""
+        visible = self.visible_count()
+        max_offset = max(0, len(self.rows) - visible)
+        self.offset = min(max(0, self.offset), max_offset)
+        return self.offset, min(len(self.rows), self.offset + visible + self.buffer)
+
+    def refresh(self):
+        first, last = self.window()
+        needed = last - first
+        while len(self.slots) < needed:
+            self.slots.append(self.tree.insert("", tk.END))
+        while len(self.slots) > needed:
+            self.tree.delete(self.slots.pop())
+
+        selection = []
+        for slot, row in zip(self.slots, range(first, last)):
+            self.tree.item(slot, values=self.row_values(self.rows[row]))
+            if row in self.selected_rows:
+                selection.append(slot)
+        self.tree.selection_set(selection)
+
+        total = len(self.rows)
+        if total:
+            self.scrollbar.set(first / total, min(1.0, (first + self.visible_count()) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_select(self, event):
+        # пересчет идемпотентен, поэтому события от selection_set в refresh безопасны
+        first, last = self.offset, self.offset + len(self.slots)
+        self.selected_rows.difference_update(range(first, last))
+        for slot in self.tree.selection():
+            self.selected_rows.add(first + self.slots.index(slot))
+
+    def selected_indices(self):
+        return sorted(self.selected_rows)
+
+    def selected_products(self):
+        return [self.rows[row] for row in self.selected_indices()]
+
+    def append(self, product):
+        self.refresh()
+
+    def extend(self, products):
+        self.refresh()
+
+    def insert(self, product, position):
+        # продукт уже стоит на своем месте в self.rows, но номера строк за ним сдвинулись
+        self.selected_rows.clear()
+        self.append(product)
+
+    def move(self, product, position):
+        self.selected_rows.clear()
+        self.refresh()
+
+    def update(self, product):
+        self.refresh()
+
+    def update_many(self, products):
+        self.refresh()
+
+    def replace(self, old, new):
+        self.refresh()
+
+    def select_all(self):
+        self.selected_rows = set(range(len(self.rows)))
+        self.refresh()
+
+    def remove(self, product):
+        self.set_rows(self.rows)
+
+    def scroll_by(self, rows):
+        self.offset += rows
+        self.refresh()
+
+    def on_scroll(self, action, *args):
+        if action == "moveto":
+            self.offset = int(float(args[0]) * len(self.rows))
+            self.refresh()
+        elif action == "scroll":
+            amount, unit = int(args[0]), args[1]
+            self.scroll_by(amount * self.visible_count() if unit == "pages" else amount)
+
+    def on_mousewheel(self, event):
+        # Button-4/5 — колесо в X11, MouseWheel — в Windows и macOS
+        self.scroll_by(-3 if event.num == 4 or event.delta > 0 else 3)
+        # иначе Treeview прокрутит и сами строки-заготовки
+        return "break"
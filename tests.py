@@ -4,10 +4,32 @@ from datetime import datetime
 import tempfile
 import os
 import json
+import logging
 
-from models import BaseProduct, Clothing, Furniture
+from models import BaseProduct, Clothing, Furniture, product_class
 from validation import ValidationError
-from utils import parse_json, set_write_off_date
+from utils import (parse_json, parse_json_parallel, iter_products, save_products, set_write_off_date,
+                   bulk_write_off, product_to_dict, dump_products, iter_json_items)
+from store import ProductStore
+from dates import parse_date, format_date
+from journal import Journal
+from index import ProductIndex, SortIndex
+from storage import JsonStorage, ShardedStorage, SqliteRows, SqliteStorage, open_storage, convert
+import snapshot
+from jsonindex import IndexedJsonFile, index_path
+import cli
+import analytics
+import dedup
+import metrics
+import serialization
+from applog import BufferedLogHandler
+from watcher import diff_products
+from history import Added, Batch, History, Removed, WrittenOff
+from ui import UI
+from table import VirtualTable
+import contextlib
+import io
+from unittest import mock
 
 class TestBaseProductEquality(unittest.TestCase):
     def test_base_product_equality(self):
@@ -126,6 +148,39 @@ class TestFurnitureEquality(unittest.TestCase):
         product2 = Furniture(data2)
         self.assertNotEqual(product1, product2)
 
+class TestSchemaValidators(unittest.TestCase):
+    def test_error_messages(self):
+        """
+        Сгенерированные по схемам конструкторы выдают те же сообщения об ошибках, что и прежние проверки.
+        """
+        base = {"name": "A", "date_of_receipt": "10.04.2025", "count": 1}
+        furniture = dict(base, material="Wood", dimensions="1x2x3", weight=5)
+        cases = [
+            (BaseProduct, {"name": "A", "count": 1}, "Field 'date_of_receipt' is missing"),
+            (BaseProduct, dict(base, date_of_receipt="31.02.2025"), "Неверный формат даты, ожидается 'DD.MM.YYYY'"),
+            (BaseProduct, dict(base, date_of_write_off="x"), "Неверный формат даты списания"),
+            (BaseProduct, dict(base, count="1"), "Поле 'count' должно быть числом"),
+            (Clothing, dict(base, size="M", color="Red"), "Поле 'material' отсутствует в Clothing"),
+            (Clothing, dict(base, size="XXXXL", color="Red", material="Cotton"), "Поле 'size' неверно задано"),
+            (Furniture, dict(furniture, dimensions="1x2"), "Размеры должны быть в формате <int>x<int>x<int>"),
+            (Furniture, dict(furniture, dimensions="ax2x3"), "Размеры должны быть только числами"),
+            (Furniture, dict(furniture, dimensions="0x2x3"), "Размеры должны быть положительными числами"),
+            (Furniture, dict(furniture, weight=-1), "Поле 'weight' должно быть положительным"),
+            (Furniture, {"material": "Wood", "dimensions": "1x2x3", "weight": 5}, "Field 'name' is missing"),
+        ]
+        for cls, data, message in cases:
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(ValidationError, message):
+                    cls(data)
+
+    def test_dispatch_by_key_set(self):
+        base = {"name": "A", "date_of_receipt": "10.04.2025", "count": 1}
+        self.assertIs(product_class(base), BaseProduct)
+        self.assertIs(product_class(dict(base, size="M", color="Red", material="Cotton")), Clothing)
+        self.assertIs(product_class(dict(base, material="Wood", dimensions="1x2x3", weight=5)), Furniture)
+        # одежды без цвета нет, а мебели не хватает веса — базовый продукт
+        self.assertIs(product_class(dict(base, size="M", material="Wood", dimensions="1x2x3")), BaseProduct)
+
 class TestUtilsFunctions(unittest.TestCase):
     def test_set_write_off_date_and_equality(self):
         """
@@ -144,6 +199,39 @@ class TestUtilsFunctions(unittest.TestCase):
         expected_product = BaseProduct(expected_data)
         self.assertEqual(product, expected_product)
 
+    def test_bulk_write_off(self):
+        """
+        Массовое списание с отбором по условию меняет только подходящие продукты,
+        а даты по продуктам применяются попарно.
+        """
+        products = [BaseProduct({"name": f"P{i}", "date_of_receipt": f"1{i}.04.2025", "count": i})
+                    for i in range(4)]
+        written_off = bulk_write_off(products, "20.04.2025", predicate=lambda p: p.count % 2 == 0)
+        self.assertEqual([p.name for p in written_off], ["P0", "P2"])
+        self.assertEqual([p.formated_date_of_write_off for p in products],
+                         ["20.04.2025", "Не списано", "20.04.2025", "Не списано"])
+
+        bulk_write_off(products[1:3], ["21.04.2025", "22.04.2025"])
+        self.assertEqual(products[2].formated_date_of_write_off, "22.04.2025")
+
+        # даты задаются по переданным продуктам, отбор не сдвигает их
+        bulk_write_off(products, ["23.04.2025", "24.04.2025", "25.04.2025", "26.04.2025"],
+                       predicate=lambda p: p.count % 2 == 1)
+        self.assertEqual([p.formated_date_of_write_off for p in products],
+                         ["20.04.2025", "24.04.2025", "22.04.2025", "26.04.2025"])
+
+    def test_bulk_write_off_is_all_or_nothing(self):
+        """
+        Если хотя бы одна дата раньше даты поступления или неверна, ни один продукт не списывается.
+        """
+        products = [BaseProduct({"name": f"P{i}", "date_of_receipt": f"1{i}.04.2025", "count": i})
+                    for i in range(4)]
+        with self.assertRaisesRegex(ValidationError, "раньше даты поступления: P3"):
+            bulk_write_off(products, "12.04.2025")
+        with self.assertRaisesRegex(ValidationError, "Неверный формат даты списания"):
+            bulk_write_off(products, ["20.04.2025", "20.04.2025", "bad", "20.04.2025"])
+        self.assertTrue(all(p.date_of_write_off is None for p in products))
+
     def test_parse_json_equality(self):
         """
         Тест функции parse_json:
@@ -191,5 +279,1182 @@ class TestUtilsFunctions(unittest.TestCase):
         finally:
             os.unlink(tmp_file.name)
 
+class TestStreamingParser(unittest.TestCase):
+    def setUp(self):
+        self.test_data = {
+            "Prod1": {"name": "Продукт А", "date_of_receipt": "10.04.2025", "count": 5},
+            "Prod2": {"name": "Shirt", "date_of_receipt": "10.04.2025", "count": 10,
+                      "size": "M", "color": "Red", "material": "Cotton"},
+            "Prod3": {"name": "Broken", "date_of_receipt": "2025-04-10", "count": 1},
+            "Prod4": {"name": "Table", "date_of_receipt": "10.04.2025", "count": 12345,
+                      "material": "Wood", "dimensions": "100x50x30", "weight": 20}
+        }
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, mode='w+', suffix='.json', encoding="UTF-8")
+        json.dump(self.test_data, tmp_file, indent=2, ensure_ascii=False)
+        tmp_file.close()
+        self.filename = tmp_file.name
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_iter_products_matches_parse_json(self):
+        """
+        Потоковый разбор с маленьким размером куска (границы проходят внутри
+        строк, чисел и многобайтных символов) дает тот же результат, что и parse_json.
+        """
+        for chunk_size in (1, 7, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                products = list(iter_products(self.filename, chunk_size=chunk_size))
+                self.assertEqual(products, parse_json(self.filename))
+                self.assertEqual(len(products), 3)
+                self.assertEqual(products[2].count, 12345)
+
+    def test_iter_products_logs_invalid_items(self):
+        """
+        Некорректный продукт пропускается, а ошибка пишется в лог с ключом продукта.
+        """
+        with self.assertLogs("ProductParser", level="ERROR") as logs:
+            list(iter_products(self.filename))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Prod3", logs.output[0])
+
+    def test_parse_json_parallel_matches_parse_json(self):
+        """
+        Параллельный разбор сохраняет порядок продуктов и пишет в лог те же сообщения,
+        что и parse_json, — и для файла с отступами, и для записанного в одну строку.
+        """
+        compact_file = self.filename + ".compact.json"
+        with open(compact_file, 'w', encoding="UTF-8") as f:
+            json.dump(self.test_data, f, ensure_ascii=False)
+        self.addCleanup(os.unlink, compact_file)
+        for filename in (self.filename, compact_file):
+            with self.subTest(filename=filename):
+                with self.assertLogs("ProductParser", level="ERROR") as serial_logs:
+                    expected = parse_json(filename)
+                with self.assertLogs("ProductParser", level="ERROR") as parallel_logs:
+                    products = parse_json_parallel(filename, workers=2)
+                self.assertEqual(products, expected)
+                self.assertEqual([p.key for p in products], ["Prod1", "Prod2", "Prod4"])
+                self.assertEqual(parallel_logs.output, serial_logs.output)
+
+    def test_iter_products_reports_progress(self):
+        progress = []
+        list(iter_products(self.filename, chunk_size=64, progress=lambda done, total: progress.append((done, total))))
+        self.assertGreater(len(progress), 1)
+        self.assertEqual(progress[-1][0], os.path.getsize(self.filename))
+
+    def test_numbers_split_at_any_boundary(self):
+        """
+        Числа с дробной частью и экспонентой читаются целиком, где бы ни прошла граница куска.
+        """
+        text = '{"a": -25000000000.05, "b": 1e5, "c": [2.5E-3, 7], "d": 12}'
+        expected = list(json.loads(text).items())
+        for split in range(1, len(text)):
+            with self.subTest(split=split):
+                self.assertEqual(list(iter_json_items([text[:split], text[split:]])), expected)
+
+    def test_trailing_data_is_rejected(self):
+        for text in ('{"a": 1} x', '{} {}', '{"a": 1}}'):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    list(iter_json_items(text[i:i + 3] for i in range(0, len(text), 3)))
+        self.assertEqual(list(iter_json_items(['{"a": 1}\n', '  '])), [("a", 1)])
+
+    def test_save_products_round_trip(self):
+        """
+        Продукты, записанные save_products, читаются parse_json без изменений.
+        """
+        products = parse_json(self.filename)
+        save_products(self.filename, iter(products))
+        self.assertEqual(parse_json(self.filename), products)
+
+    def test_save_products_with_each_backend(self):
+        """
+        Все библиотеки JSON записывают файл байт в байт одинаково, с отступом и компактно;
+        компактный файл — по продукту на строке, и параллельный разбор делит его по записям.
+        """
+        products = parse_json(self.filename)
+        products[0].key = 'Кв"/\\'
+        for compact in (False, True):
+            files = {}
+            for name, backend in serialization.BACKENDS.items():
+                with open(self.filename, 'wb') as f:
+                    dump_products(products, f, compact, backend)
+                with open(self.filename, 'rb') as f:
+                    files[name] = f.read()
+                with self.subTest(backend=name, compact=compact):
+                    self.assertEqual(parse_json(self.filename), products)
+            self.assertEqual(len(set(files.values())), 1)
+            if compact:
+                self.assertEqual(files["json"].count(b"\n"), len(products) + 1)
+                self.assertEqual(parse_json_parallel(self.filename, workers=2), products)
+        with self.assertRaises(ValueError):
+            serialization.get_backend("simplejson")
+
+class TestProductStore(unittest.TestCase):
+    def setUp(self):
+        self.products = [
+            BaseProduct({"name": "Продукт А", "date_of_receipt": "10.04.2025", "count": 5,
+                         "date_of_write_off": "12.04.2025"}),
+            Clothing({"name": "Shirt", "date_of_receipt": "10.04.2025", "count": 10,
+                      "size": "M", "color": "Red", "material": "Cotton"}),
+            Furniture({"name": "Table", "date_of_receipt": "10.04.2025", "count": 3,
+                       "material": "Wood", "dimensions": "100x50x30", "weight": 20})
+        ]
+        self.store = ProductStore.from_products(self.products)
+
+    def test_views_equal_products(self):
+        """
+        Представления хранилища равны исходным продуктам в обе стороны сравнения
+        и имеют тот же тип для isinstance.
+        """
+        self.assertEqual(len(self.store), 3)
+        for view, product in zip(self.store, self.products):
+            self.assertEqual(view, product)
+            self.assertEqual(product, view)
+            self.assertIsInstance(view, type(product))
+        self.assertNotEqual(self.store[0], self.products[1])
+
+    def test_view_writes_to_store(self):
+        """
+        Изменение через представление (например, set_write_off_date) сохраняется в колонках.
+        """
+        set_write_off_date(self.store[2], "15.04.2025")
+        self.assertEqual(self.store[2].date_of_write_off, datetime(2025, 4, 15))
+        self.assertEqual(self.store[1].date_of_write_off, None)
+
+    def test_products_have_no_dict(self):
+        self.assertFalse(hasattr(self.products[1], "__dict__"))
+
+class TestDateCodec(unittest.TestCase):
+    def test_parse_date_matches_strptime(self):
+        """
+        Быстрый разбор дат совпадает с datetime.strptime, включая записи без ведущих нулей.
+        """
+        for value in ("10.04.2025", "01.01.2000", "1.4.2025", "29.02.2024"):
+            with self.subTest(value=value):
+                self.assertEqual(parse_date(value), datetime.strptime(value, "%d.%m.%Y"))
+                self.assertEqual(format_date(parse_date(value)), parse_date(value).strftime("%d.%m.%Y"))
+
+    def test_parse_date_rejects_invalid(self):
+        for value in ("2025-04-10", "31.02.2025", "10.04.25", "aa.bb.cccc", "10.13.2025"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_date(value)
+
+    def test_validation_messages_unchanged(self):
+        with self.assertRaisesRegex(ValidationError, "Неверный формат даты, ожидается 'DD.MM.YYYY'"):
+            BaseProduct({"name": "A", "date_of_receipt": "31.02.2025", "count": 1})
+        product = BaseProduct({"name": "A", "date_of_receipt": "10.04.2025", "count": 1})
+        with self.assertRaisesRegex(ValidationError, "Неверный формат даты списания"):
+            set_write_off_date(product, "15/04/2025")
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.base_data = {
+            "Prod1": {"name": "Product A", "date_of_receipt": "10.04.2025", "count": 5},
+            "Prod2": {"name": "Product B", "date_of_receipt": "10.04.2025", "count": 7},
+            "Prod3": {"name": "Product C", "date_of_receipt": "10.04.2025", "count": 9}
+        }
+        with open(self.filename, 'w') as f:
+            json.dump(self.base_data, f)
+        self.journal = Journal(self.filename)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load(self):
+        return list(Journal(self.filename).apply(iter_products(self.filename)))
+
+    def test_apply_changes_from_journal(self):
+        """
+        Изменения из журнала накладываются на основной файл: запись меняет продукт,
+        удаление убирает его, новые продукты добавляются в конец.
+        """
+        self.journal.append({"Prod2": {"name": "Product B", "date_of_receipt": "10.04.2025",
+                                       "date_of_write_off": "12.04.2025", "count": 7}})
+        self.journal.append({"Prod1": None,
+                             "Prod4": {"name": "Product D", "date_of_receipt": "11.04.2025", "count": 1}})
+        products = self.load()
+        self.assertEqual([p.key for p in products], ["Prod2", "Prod3", "Prod4"])
+        self.assertEqual(products[0].formated_date_of_write_off, "12.04.2025")
+
+    def test_truncated_entry_is_ignored(self):
+        """
+        Строка журнала, недописанная из-за сбоя, пропускается, а предыдущие изменения сохраняются.
+        """
+        self.journal.append({"Prod1": None})
+        with open(self.journal.path, 'a') as f:
+            f.write('{"op": "put", "key": "Prod2", "da')
+        with self.assertLogs("ProductParser", level="ERROR"):
+            products = self.load()
+        self.assertEqual([p.key for p in products], ["Prod2", "Prod3"])
+
+    def test_append_after_truncated_entry(self):
+        """
+        Запись, дописанная после недописанной при сбое строки, не склеивается с ней и не теряется.
+        """
+        with open(self.journal.path, 'a') as f:
+            f.write('{"op": "put", "key": "Prod2", "da')
+        self.journal.append({"Prod1": None})
+        with self.assertLogs("ProductParser", level="ERROR"):
+            products = self.load()
+        self.assertEqual([p.key for p in products], ["Prod2", "Prod3"])
+
+    def test_compact_rewrites_file_and_clears_journal(self):
+        self.journal.append({"Prod3": None})
+        products = self.load()
+        self.journal.compact(products)
+        self.assertFalse(os.path.exists(self.journal.path))
+        with open(self.filename) as f:
+            self.assertEqual(list(json.load(f)), ["Prod1", "Prod2"])
+        self.assertEqual(self.load(), products)
+
+class TestProductIndex(unittest.TestCase):
+    def setUp(self):
+        self.products = [
+            BaseProduct({"name": "Red Apple", "date_of_receipt": "01.04.2025", "count": 5}),
+            BaseProduct({"name": "Green Apple", "date_of_receipt": "05.04.2025", "count": 15}),
+            BaseProduct({"name": "Pear", "date_of_receipt": "10.04.2025", "count": 25}),
+            BaseProduct({"name": "Pear", "date_of_receipt": "10.04.2025", "count": 25})
+        ]
+        self.index = ProductIndex(self.products)
+
+    def test_name_and_substring_search(self):
+        """
+        Поиск по точному имени возвращает все одинаковые продукты, поиск подстроки
+        не зависит от регистра, короткий запрос тоже ищет подстроку в любом месте имени.
+        """
+        self.assertEqual(len(self.index.by_name("Pear")), 2)
+        self.assertEqual(self.index.query("APPLE"), self.products[:2])
+        self.assertEqual(self.index.query("en app"), [self.products[1]])
+        self.assertEqual(self.index.query("pe"), self.products[2:])
+        self.assertEqual(self.index.query("le"), self.products[:2])
+        self.assertEqual(self.index.query("ppx"), [])
+
+    def test_range_queries(self):
+        low = datetime(2025, 4, 2).toordinal()
+        self.assertEqual(self.index.query(ranges={"date_of_receipt": (low, None)}), self.products[1:])
+        self.assertEqual(self.index.query("apple", {"count": (10, 30)}), [self.products[1]])
+
+    def test_incremental_updates(self):
+        """
+        Индекс обновляется при списании, удалении и добавлении без перестроения.
+        """
+        set_write_off_date(self.products[0], "20.04.2025")
+        self.index.update(self.products[0])
+        self.assertEqual(self.index.query(ranges={"date_of_write_off": (None, None)}), [self.products[0]])
+
+        self.index.remove(self.products[2])
+        self.assertEqual(self.index.by_name("Pear"), [self.products[3]])
+
+        new_product = BaseProduct({"name": "Plum", "date_of_receipt": "11.04.2025", "count": 1})
+        self.index.add(new_product)
+        self.assertEqual(self.index.query("plu"), [new_product])
+        self.assertEqual(len(self.index), 4)
+
+class TestSortIndex(unittest.TestCase):
+    def setUp(self):
+        self.products = [
+            BaseProduct({"name": name, "date_of_receipt": "10.04.2025", "count": count})
+            for name, count in (("Pear", 5), ("Apple", 15), ("Plum", 5), ("Fig", 1))
+        ]
+        self.keys = {"name": lambda p: p.name, "count": lambda p: p.count}
+        self.sorter = SortIndex(self.products, self.keys)
+
+    def names(self, rows):
+        return [p.name for p in rows]
+
+    def test_sorted_rows_and_direction(self):
+        """Равные ключи остаются в порядке добавления, обратный порядок читается с конца."""
+        self.assertEqual(self.names(self.sorter.rows("count")), ["Fig", "Pear", "Plum", "Apple"])
+        rows = self.sorter.rows("count", descending=True)
+        self.assertEqual(self.names(rows), ["Apple", "Plum", "Pear", "Fig"])
+        self.assertEqual(rows[0].name, "Apple")
+        self.assertEqual(rows[-1].name, "Fig")
+        self.assertEqual(self.sorter.position("count", self.products[1], descending=True), 0)
+
+    def test_incremental_updates_match_full_sort(self):
+        """
+        После добавления, удаления и изменения продуктов кэшированные перестановки
+        совпадают с полной сортировкой текущих продуктов.
+        """
+        by_name, by_count = self.sorter.rows("name"), self.sorter.rows("count")
+        added = BaseProduct({"name": "Kiwi", "date_of_receipt": "10.04.2025", "count": 7})
+        self.sorter.add(added)
+        self.sorter.remove(self.products[0])
+        self.products[3].count = 20
+        self.sorter.update(self.products[3])
+        current = self.products[1:] + [added]
+        self.assertEqual(list(by_name), sorted(current, key=lambda p: p.name))
+        self.assertEqual(self.names(by_count), ["Plum", "Kiwi", "Apple", "Fig"])
+        self.assertEqual(self.names(self.sorter.sort([added, self.products[1]], "count")), ["Kiwi", "Apple"])
+
+class HistoryTarget:
+    """Цель команд истории без интерфейса: только список продуктов."""
+
+    def __init__(self, products):
+        self.products = products
+        self.updated = []
+
+    def insert_product(self, product, position=None):
+        self.products.insert(len(self.products) if position is None else position, product)
+
+    def delete_product(self, product, position=None):
+        position = list(map(id, self.products)).index(id(product))
+        del self.products[position]
+        return position
+
+    def products_updated(self, products):
+        self.updated.extend(products)
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.products = [BaseProduct({"name": f"Product {i}", "date_of_receipt": "10.04.2025", "count": i})
+                         for i in range(5)]
+        self.target = HistoryTarget(list(self.products))
+        self.history = History(depth=3)
+
+    def remove(self, *positions):
+        removed = []
+        for position in positions:
+            removed.append(Removed(self.target.products[position], position))
+            removed[-1].redo(self.target)
+        return removed
+
+    def assertProducts(self, expected):
+        self.assertEqual(list(map(id, self.target.products)), list(map(id, expected)))
+
+    def test_undo_redo_restores_positions(self):
+        """Отмена удаления и добавления возвращает продукты на прежние места, повтор снова применяет правку."""
+        self.history.record(Batch(self.remove(3, 1), "удаление 2 продуктов"))
+        added = BaseProduct({"name": "New", "date_of_receipt": "11.04.2025", "count": 1})
+        self.target.insert_product(added)
+        self.history.record(Added(added, len(self.target.products) - 1))
+
+        self.assertEqual(self.history.undo(self.target).title, "добавление New")
+        self.history.undo(self.target)
+        self.assertProducts(self.products)
+        self.history.redo(self.target)
+        self.assertProducts([self.products[i] for i in (0, 2, 4)])
+        self.history.redo(self.target)
+        self.assertIs(self.target.products[-1], added)
+        self.assertIsNone(self.history.redo(self.target))
+
+    def test_bulk_write_off_is_one_step(self):
+        set_write_off_date(self.products[0], "12.04.2025")
+        previous = [p.date_of_write_off for p in self.products]
+        bulk_write_off(self.products, "20.04.2025")
+        self.history.record(WrittenOff(self.products, previous))
+        self.history.undo(self.target)
+        self.assertEqual([p.date_of_write_off for p in self.products], previous)
+        self.assertEqual(len(self.target.updated), 5)
+        self.history.redo(self.target)
+        self.assertEqual({p.formated_date_of_write_off for p in self.products}, {"20.04.2025"})
+
+    def test_depth_evicts_oldest(self):
+        """Сверх заданной глубины вытесняются самые старые правки; новая правка сбрасывает повтор."""
+        for command in self.remove(0, 0, 0, 0):
+            self.history.record(command)
+        self.assertEqual(len(self.history), 3)
+        while self.history.undo(self.target):
+            pass
+        self.assertProducts(self.products[1:])
+        self.history.record(self.remove(0)[0])
+        self.assertFalse(self.history.can_redo())
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.db_file = os.path.join(self.tmp_dir.name, "inventory.db")
+        test_data = {
+            "Prod1": {"name": "Продукт А", "date_of_receipt": "10.04.2025", "count": 5,
+                      "date_of_write_off": "12.04.2025"},
+            "Prod2": {"name": "Shirt", "date_of_receipt": "10.04.2025", "count": 10,
+                      "size": "M", "color": "Red", "material": "Cotton"},
+            "Prod3": {"name": "Table", "date_of_receipt": "10.04.2025", "count": 3,
+                      "material": "Wood", "dimensions": "100x50x30", "weight": 20}
+        }
+        with open(self.json_file, 'w', encoding="UTF-8") as f:
+            json.dump(test_data, f, ensure_ascii=False)
+        self.products = parse_json(self.json_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_storage_by_extension(self):
+        self.assertIsInstance(open_storage(self.json_file), JsonStorage)
+        storage = open_storage(self.db_file)
+        self.assertIsInstance(storage, SqliteStorage)
+        storage.close()
+        # символы шаблона в имени существующего файла не делают его шаблоном
+        bracketed = os.path.join(self.tmp_dir.name, "inventory[1].json")
+        os.rename(self.json_file, bracketed)
+        self.assertIsInstance(open_storage(bracketed), JsonStorage)
+        self.assertEqual(list(open_storage(bracketed).iter_products()), self.products)
+
+    def test_json_sqlite_round_trip(self):
+        """
+        Продукты, перенесенные из JSON в SQLite и обратно, не меняются, включая ключи и порядок.
+        """
+        convert(self.json_file, self.db_file)
+        back_file = os.path.join(self.tmp_dir.name, "back.json")
+        convert(self.db_file, back_file)
+        products = parse_json(back_file)
+        self.assertEqual(products, self.products)
+        self.assertEqual([p.key for p in products], ["Prod1", "Prod2", "Prod3"])
+
+    def test_sqlite_changes_and_pages(self):
+        """
+        Изменения сохраняются построчно, страницы читаются в исходном порядке.
+        """
+        storage = SqliteStorage(self.db_file)
+        try:
+            storage.save_all(self.products)
+            set_write_off_date(self.products[2], "20.04.2025")
+            storage.update_write_off(self.products[2])
+            storage.save_changes({
+                "Prod1": None,
+                "Prod4": {"name": "Chair", "date_of_receipt": "11.04.2025", "count": 2}
+            })
+            self.assertEqual(storage.count(), 3)
+            self.assertEqual(storage.lazy_products()[1], self.products[2])
+            self.assertEqual([p.key for p in storage.iter_products(page_size=2)], ["Prod2", "Prod3", "Prod4"])
+        finally:
+            storage.close()
+
+    def test_snapshot_round_trip(self):
+        """
+        После полного сохранения продукты загружаются из бинарного снимка без разбора JSON
+        и совпадают с исходными, включая ключи.
+        """
+        JsonStorage(self.json_file).save_all(self.products, write_snapshot=True)
+        store = snapshot.load(self.json_file)
+        self.assertIsInstance(store, ProductStore)
+        self.assertEqual(list(store), self.products)
+        self.assertEqual([p.key for p in store], ["Prod1", "Prod2", "Prod3"])
+        self.assertEqual(list(JsonStorage(self.json_file).iter_products()), self.products)
+
+    def test_snapshot_is_opt_in(self):
+        """Полное сохранение без запроса снимка (командная строка, файлы склада) его не пишет."""
+        JsonStorage(self.json_file).save_all(iter(self.products))
+        self.assertFalse(os.path.exists(snapshot.snapshot_path(self.json_file)))
+        self.assertEqual(list(JsonStorage(self.json_file).iter_products()), self.products)
+
+    def test_stale_snapshot_is_ignored(self):
+        """
+        Если JSON изменился после записи снимка, снимок не используется.
+        """
+        JsonStorage(self.json_file).save_all(self.products, write_snapshot=True)
+        with open(self.json_file, 'w', encoding="UTF-8") as f:
+            json.dump({"Prod1": {"name": "Chair", "date_of_receipt": "11.04.2025", "count": 2}}, f)
+        self.assertIsNone(snapshot.load(self.json_file))
+        self.assertEqual([p.name for p in JsonStorage(self.json_file).iter_products()], ["Chair"])
+
+    def test_indexed_json_random_access(self):
+        """
+        Индекс смещений дает продукты по номеру и ключу, включая имена не в ASCII,
+        пропускает некорректные записи и перестраивается после изменения файла.
+        """
+        with open(self.json_file, 'a', encoding="UTF-8") as f:
+            f.write(" ")
+        with IndexedJsonFile(self.json_file) as products:
+            self.assertEqual(list(products), self.products)
+            self.assertEqual(products.get("Prod3"), self.products[2])
+            self.assertIs(products[0], products[0])
+        self.assertTrue(os.path.exists(index_path(self.json_file)))
+        self.assertEqual(list(IndexedJsonFile(self.json_file)[1:5]), self.products[1:])
+
+        with open(self.json_file, 'w', encoding="UTF-8") as f:
+            json.dump({"Prod1": {"name": "Chair", "date_of_receipt": "bad", "count": 1},
+                       "Prod2": {"name": "Стул", "date_of_receipt": "11.04.2025", "count": 2}},
+                      f, ensure_ascii=False)
+        with self.assertLogs("ProductParser", level="ERROR"):
+            products = IndexedJsonFile(self.json_file)
+        with products:
+            self.assertEqual(products.keys, ["Prod2"])
+            self.assertEqual(products[0].name, "Стул")
+
+    def test_lazy_products(self):
+        """
+        Список для виртуальной таблицы декодирует только запрошенные строки и правится
+        как обычный список; повторный запрос берет тот же открытый индекс.
+        """
+        storage = JsonStorage(self.json_file)
+        self.addCleanup(storage.close)
+        rows = storage.lazy_products()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], self.products[1])
+        added = BaseProduct({"name": "Chair", "date_of_receipt": "11.04.2025", "count": 2})
+        rows.insert(0, added)
+        del rows[2]
+        self.assertEqual(rows.index_of(added), 0)
+        self.assertEqual(len(rows.source.loaded), 1)
+        self.assertEqual(list(rows), [added, self.products[0], self.products[2]])
+        self.assertIs(storage.lazy_products().source, rows.source)
+
+        storage.save_changes({"Prod1": None})
+        self.assertIsNone(storage.lazy_products())
+
+    def test_sqlite_lazy_products(self):
+        """
+        Строки базы для виртуальной таблицы читаются страницами по ключам: запрос
+        одной строки не читает всю таблицу, а сохраненные позже правки не сдвигают строки.
+        """
+        storage = SqliteStorage(self.db_file)
+        self.addCleanup(storage.close)
+        storage.save_all([BaseProduct({"name": f"Item{i}", "date_of_receipt": "10.04.2025", "count": i})
+                          for i in range(600)])
+        rows = storage.lazy_products()
+        self.assertEqual(len(rows), 600)
+        self.assertEqual(rows[300].name, "Item300")
+        self.assertEqual(len(rows.source.loaded), SqliteRows.PAGE_SIZE)
+        storage.save_changes({"Prod1": None, "Prod2": None})
+        self.assertEqual(rows[599].key, "Prod600")
+        self.assertEqual(list(rows.keys())[:2], ["Prod1", "Prod2"])
+        self.assertEqual(len(rows.source.loaded), SqliteRows.PAGE_SIZE + 600 - 2 * SqliteRows.PAGE_SIZE)
+        with self.assertRaises(KeyError):
+            rows[0]
+
+class TestShardedStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shards = {
+            "north.json": {"Prod1": {"name": "Chair", "date_of_receipt": "10.04.2025", "count": 2},
+                           "Prod2": {"name": "Bad", "date_of_receipt": "bad", "count": 1}},
+            "south.json": {"Prod1": {"name": "Shirt", "date_of_receipt": "11.04.2025", "count": 5,
+                                     "size": "M", "color": "Red", "material": "Cotton"}},
+        }
+        for name, data in self.shards.items():
+            with open(os.path.join(self.tmp_dir.name, name), 'w') as f:
+                json.dump(data, f, indent=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def load(self, source=None):
+        storage = open_storage(source or self.tmp_dir.name)
+        with self.assertLogs("ProductParser", level="ERROR") as logs:
+            products = list(storage.iter_products())
+        return storage, products, logs.output
+
+    def test_merged_view_keeps_source_shard(self):
+        """
+        Файлы каталога объединяются в порядке имен, ключ продукта указывает на исходный файл,
+        а ошибки в логе называют файл.
+        """
+        storage, products, logs = self.load()
+        self.assertIsInstance(storage, ShardedStorage)
+        self.assertEqual([p.key for p in products], ["north.json/Prod1", "south.json/Prod1"])
+        self.assertEqual(storage.source_of(products[1].key), "south.json")
+        self.assertIn("north.json/Prod2", logs[0])
+        _, products, _ = self.load(os.path.join(self.tmp_dir.name, "n*.json"))
+        self.assertEqual([p.name for p in products], ["Chair"])
+
+    def test_save_changes_touches_only_changed_shards(self):
+        """
+        Правка продукта пишется только в его файл; новый продукт получает свободный ключ
+        в файле по умолчанию.
+        """
+        storage, products, _ = self.load()
+        set_write_off_date(products[1], "20.04.2025")
+        storage.save_changes({products[1].key: product_to_dict(products[1])})
+        self.assertTrue(os.path.exists(self.path("south.json.journal")))
+        self.assertFalse(os.path.exists(self.path("north.json.journal")))
+
+        added = BaseProduct({"name": "Lamp", "date_of_receipt": "12.04.2025", "count": 1})
+        storage.save_changes({"Prod1": product_to_dict(added)})
+        self.assertEqual(storage.source_of("Prod1"), "north.json")
+
+        _, products, _ = self.load()
+        self.assertEqual([p.key for p in products], ["north.json/Prod1", "north.json/Prod2", "south.json/Prod1"])
+        self.assertEqual(products[2].formated_date_of_write_off, "20.04.2025")
+
+class TestFileWatching(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.data = {f"Prod{i}": {"name": f"Product {i}", "date_of_receipt": "10.04.2025", "count": i}
+                     for i in range(1, 6)}
+        self.write(self.data)
+        self.storage = JsonStorage(self.filename)
+        self.reloader = self.storage.watch()
+        self.products = list(self.storage.iter_products())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, data):
+        with open(self.filename, 'w') as f:
+            json.dump(data, f, indent=2)
+        # при записи подряд mtime может не успеть измениться
+        os.utime(self.filename, ns=(0, os.stat(self.filename).st_mtime_ns + len(data) + 1))
+
+    def reload(self):
+        self.assertTrue(self.reloader.poll())
+        changes = self.reloader.reload(lambda: (p.key for p in self.products))
+        return changes, diff_products(self.products, changes)
+
+    def test_journal_tail_is_read_incrementally(self):
+        """
+        Правка другого процесса через журнал перечитывается без разбора основного файла:
+        в результат попадают только дописанные записи.
+        """
+        other = JsonStorage(self.filename)
+        other.save_changes({"Prod2": dict(self.data["Prod2"], count=20), "Prod6": None})
+        changes, operations = self.reload()
+        self.assertEqual(sorted(changes), ["Prod2", "Prod6"])
+        self.assertIsNone(self.reloader.digests)
+        self.assertEqual([(position, old.key, new.count) for position, old, new in operations], [(1, "Prod2", 20)])
+        self.assertFalse(self.reloader.poll())
+
+    def test_rewritten_file_is_diffed_by_key_and_fingerprint(self):
+        """
+        Первое изменение основного файла сравнивает все продукты и находит удаленные,
+        следующие создают заново только продукты с измененным текстом.
+        """
+        data = dict(self.data, Prod6={"name": "Product 6", "date_of_receipt": "11.04.2025", "count": 6})
+        del data["Prod1"]
+        data["Prod3"] = dict(data["Prod3"], count=30)
+        self.write(data)
+        changes, operations = self.reload()
+        self.assertEqual(len(changes), 6)
+        self.assertEqual([(position, old and old.key, new and new.key) for position, old, new in operations],
+                         [(0, "Prod1", None), (2, "Prod3", "Prod3"), (None, None, "Prod6")])
+
+        self.products = list(self.storage.iter_products())
+        data["Prod4"] = dict(data["Prod4"], date_of_write_off="12.04.2025")
+        self.write(data)
+        changes, operations = self.reload()
+        self.assertEqual(list(changes), ["Prod4"])
+        self.assertEqual(operations[0][2].formated_date_of_write_off, "12.04.2025")
+
+    def test_own_save_produces_no_operations(self):
+        """Сохранение тех же продуктов (в том числе сворачивание журнала) ничего не меняет в памяти."""
+        self.storage.save_all(self.products)
+        _, operations = self.reload()
+        self.assertEqual(operations, [])
+
+    def test_sharded_keys_are_prefixed(self):
+        with open(os.path.join(self.tmp_dir.name, "south.json"), 'w') as f:
+            json.dump({"Prod1": self.data["Prod1"]}, f)
+        storage = ShardedStorage(self.tmp_dir.name)
+        reloader = storage.watch()
+        JsonStorage(self.filename).save_changes({"Prod7": self.data["Prod5"]})
+        self.assertTrue(reloader.poll())
+        changes = reloader.reload(lambda: ())
+        self.assertEqual(list(changes), ["inventory.json/Prod7"])
+        self.assertEqual(changes["inventory.json/Prod7"].key, "inventory.json/Prod7")
+
+    def test_sharded_new_product_is_not_reloaded_as_duplicate(self):
+        """
+        Новый продукт склада из нескольких файлов сразу получает ключ своего файла,
+        поэтому после сохранения перечитывание не добавляет его второй раз.
+        """
+        storage = ShardedStorage(self.tmp_dir.name)
+        ui = headless_ui(storage, storage.iter_products())
+        ui.watcher = storage.watch()
+        added = BaseProduct({"name": "Lamp", "date_of_receipt": "12.04.2025", "count": 1})
+        added.key = ui.new_key()
+        ui.insert_product(added)
+        self.assertEqual(added.key, "inventory.json/Prod6")
+        storage.save_changes({key: product_to_dict(product) for key, product in ui.changes.items()})
+        self.assertTrue(ui.watcher.poll())
+        changes = ui.watcher.reload(lambda: (product.key for product in ui.products))
+        self.assertEqual(diff_products(ui.products, changes), [])
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.csv_file = os.path.join(self.tmp_dir.name, "writeoff.csv")
+        test_data = {
+            "Prod1": {"name": "Product A", "date_of_receipt": "10.04.2025", "count": 5},
+            "Prod2": {"name": "Product B", "date_of_receipt": "10.04.2025", "count": 7},
+            "Prod3": {"name": "Product A", "date_of_receipt": "10.04.2025", "count": 1}
+        }
+        with open(self.json_file, 'w') as f:
+            json.dump(test_data, f)
+        with open(self.csv_file, 'w') as f:
+            f.write("name,date\nProduct A,15.04.2025\nProduct B,01.01.2020\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cli.main(list(argv))
+        return output.getvalue()
+
+    def test_writeoff_from_csv(self):
+        """
+        Списание по CSV затрагивает все продукты с указанным именем, а ошибочные даты
+        записываются в лог и учитываются в отчете.
+        """
+        for target in ("result.json", "result.db"):
+            with self.subTest(target=target):
+                target = os.path.join(self.tmp_dir.name, target)
+                self.run_cli("import", self.json_file, target)
+                with self.assertLogs("ProductParser", level="ERROR"):
+                    output = self.run_cli("writeoff", target, self.csv_file)
+                self.assertIn("Списано продуктов: 2", output)
+                self.assertIn("ошибок: 1", output)
+                storage = open_storage(target)
+                products = list(storage.iter_products())
+                storage.close()
+                self.assertEqual([p.formated_date_of_write_off for p in products],
+                                 ["15.04.2025", "Не списано", "15.04.2025"])
+
+    def test_stats_reports_throughput(self):
+        output = self.run_cli("stats", self.json_file)
+        self.assertIn("Продуктов: 3", output)
+        self.assertIn("Суммарное количество: 13", output)
+        self.assertIn("записей/с", output)
+
+    def test_metrics_dump(self):
+        metrics_file = os.path.join(self.tmp_dir.name, "metrics.json")
+        try:
+            self.run_cli("--metrics", metrics_file, "writeoff", self.json_file, self.csv_file)
+        finally:
+            metrics.enable(False)
+            metrics.reset()
+        with open(metrics_file) as f:
+            self.assertEqual(json.load(f)["timers"]["set_write_off_date"]["count"], 3)
+
+class TestBufferedLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp_dir.name, "app.log")
+        self.logger = logging.getLogger("TestBufferedLog")
+        self.logger.propagate = False
+        self.handler = BufferedLogHandler(self.log_file, burst=2, interval=60)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        self.tmp_dir.cleanup()
+
+    def test_file_is_opened_lazily(self):
+        self.assertFalse(os.path.exists(self.log_file))
+        self.logger.error("Ошибка обработки продукта %s: %s", "Prod1", "bad")
+        self.handler.close()
+        with open(self.log_file, encoding="utf-8") as f:
+            self.assertIn("Ошибка обработки продукта Prod1: bad", f.read())
+
+    def test_repeated_errors_are_aggregated(self):
+        """
+        Из одинаковых ошибок разных продуктов пишутся первые burst, остальные сводятся в одну запись;
+        ошибки с другой причиной ограничиваются отдельно.
+        """
+        for i in range(10):
+            self.logger.error("Ошибка обработки продукта %s: %s", f"Prod{i}", "bad date")
+        self.logger.error("Ошибка обработки продукта %s: %s", "Prod10", "bad count")
+        self.handler.close()
+        with open(self.log_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("Prod1: bad date", lines[1])
+        self.assertIn("Prod10: bad count", lines[2])
+        self.assertIn("Еще 8 похожих записей не выведено, последняя: Ошибка обработки продукта Prod9: bad date",
+                      lines[3])
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.enable(False)
+        metrics.reset()
+
+    def test_parse_phases_and_validation_errors(self):
+        """
+        parse_json замеряет фазы чтения, декодирования и создания продуктов
+        и считает ошибки проверки по видам.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "inventory.json")
+            with open(filename, 'w') as f:
+                json.dump({"Prod1": {"name": "A", "date_of_receipt": "10.04.2025", "count": 1},
+                           "Prod2": {"name": "B", "date_of_receipt": "bad", "count": 1},
+                           "Prod3": {"name": "C", "date_of_receipt": "31.02.2025", "count": 1}}, f)
+            with self.assertLogs("ProductParser", level="ERROR"):
+                parse_json(filename)
+        data = metrics.snapshot()
+        self.assertEqual(set(data["timers"]), {"parse_json_read", "parse_json_decode", "parse_json_construct"})
+        self.assertEqual(data["counters"]["validation_errors"],
+                         [{"labels": {"error": "Неверный формат даты, ожидается 'DD.MM.YYYY'"}, "value": 2}])
+        text = metrics.to_prometheus()
+        self.assertIn("inventory_parse_json_decode_seconds_count 1", text)
+        self.assertIn("inventory_products_parsed_total 1", text)
+
+    def test_disabled_metrics_are_not_recorded(self):
+        metrics.enable(False)
+        with metrics.timer("noop"):
+            metrics.count("noop")
+        self.assertEqual(metrics.snapshot(), {"timers": {}, "counters": {}})
+
+class TestFingerprints(unittest.TestCase):
+    def setUp(self):
+        self.clothing_data = {"name": "Shirt", "date_of_receipt": "10.04.2025", "count": 10,
+                              "size": "M", "color": "Red", "material": "Cotton"}
+        self.base_data = {"name": "Product A", "date_of_receipt": "10.04.2025", "count": 5}
+
+    def test_hash_consistent_with_eq(self):
+        """
+        Равные продукты имеют одинаковый хеш, в том числе представления ProductStore,
+        поэтому продукты можно класть в множества и словари.
+        """
+        first, second = Clothing(self.clothing_data), Clothing(self.clothing_data)
+        self.assertEqual(hash(first), hash(second))
+        view = ProductStore.from_products([first])[0]
+        self.assertEqual(hash(view), hash(first))
+        self.assertEqual(len({first, second, view, BaseProduct(self.base_data)}), 2)
+
+    def test_fingerprint_invalidated_on_change(self):
+        product = BaseProduct(self.base_data)
+        before = product.fingerprint
+        set_write_off_date(product, "15.04.2025")
+        self.assertNotEqual(product.fingerprint, before)
+        product.date_of_write_off = None
+        self.assertEqual(product.fingerprint, before)
+        product.count += 1
+        self.assertNotEqual(product.fingerprint, before)
+
+    def test_deduplicate(self):
+        """
+        Полные дубликаты удаляются, а с merge_counts продукты, различающиеся
+        только количеством, сливаются с суммированием количества.
+        """
+        products = [BaseProduct(self.base_data), BaseProduct(self.base_data),
+                    BaseProduct(dict(self.base_data, count=7)), Clothing(self.clothing_data)]
+        self.assertEqual(len(dedup.find_duplicates(products)), 1)
+        self.assertEqual(len(dedup.deduplicate(products)), 3)
+        merged = dedup.deduplicate(products, merge_counts=True)
+        self.assertEqual([p.count for p in merged], [17, 10])
+
+@unittest.skipIf(analytics.np is None, "NumPy не установлен")
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        self.products = [
+            BaseProduct({"name": "A", "date_of_receipt": "01.01.2025", "count": 5}),
+            Clothing({"name": "B", "date_of_receipt": "01.03.2025", "count": 10, "size": "M",
+                      "color": "Red", "material": "Cotton", "date_of_write_off": "15.03.2025"}),
+            Furniture({"name": "C", "date_of_receipt": "01.02.2025", "count": 3, "material": "Wood",
+                       "dimensions": "1x1x1", "weight": 20, "date_of_write_off": "20.03.2025"}),
+            Furniture({"name": "D", "date_of_receipt": "01.03.2025", "count": 4, "material": "Wood",
+                       "dimensions": "1x1x1", "weight": 7, "date_of_write_off": "02.04.2025"})
+        ]
+
+    def test_summary(self):
+        """
+        Агрегаты совпадают с подсчитанными вручную и одинаковы для списка продуктов и ProductStore.
+        """
+        today = datetime(2025, 1, 31).date()
+        stats = analytics.summary(self.products, today)
+        self.assertEqual(stats["count_by_type"], {"BaseProduct": 5, "Clothing": 10, "Furniture": 7})
+        self.assertEqual(stats["total_weight"], 27)
+        self.assertEqual(stats["average_age_on_hand"], 30.0)
+        self.assertEqual(stats["write_off_rate"], 0.75)
+        self.assertEqual(stats["write_offs_per_month"], {"2025-03": 2, "2025-04": 1})
+        self.assertEqual(stats["age_histogram"]["30-89"], 1)
+        self.assertEqual(analytics.summary(ProductStore.from_products(self.products), today), stats)
+
+class TestLazyUI(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.data = {f"Prod{i}": {"name": f"Product {i}", "date_of_receipt": "10.04.2025", "count": i}
+                     for i in range(1, 51)}
+        self.write(self.data)
+        self.storage = JsonStorage(self.filename)
+        self.addCleanup(self.storage.close)
+        self.ui = headless_ui(self.storage)
+        self.ui.virtual = True
+        self.ui.table = VirtualTableStub()
+        self.ui.load_data()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, data):
+        with open(self.filename, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.utime(self.filename, ns=(0, os.stat(self.filename).st_mtime_ns + len(data) + 1))
+
+    def test_lazy_load_decodes_only_requested_rows(self):
+        rows = self.ui.products
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(self.ui.last_key_number, 50)
+        self.assertEqual(rows.source.loaded, {})
+        self.assertFalse(self.ui.partial)
+
+    def test_reload_decodes_only_changed_rows(self):
+        """Изменение другого процесса накладывается на ленивый список без декодирования всех строк."""
+        self.ui.watcher = self.storage.watch()
+        JsonStorage(self.filename).save_changes({"Prod3": dict(self.data["Prod3"], count=30)})
+        self.assertTrue(self.ui.watcher.poll())
+        self.ui.reload_changes()
+        self.assertEqual(self.ui.products[2].count, 30)
+        self.assertLessEqual(len(self.ui.products.source.loaded), 1)
+
+    def test_reload_closes_previous_file(self):
+        """Повторная загрузка закрывает индекс прежнего файла, а неизмененный файл использует повторно."""
+        first = self.ui.products.source
+        self.ui.load_data()
+        self.assertIs(self.ui.products.source, first)
+        self.assertFalse(first.closed)
+        self.write(dict(self.data, Prod51=self.data["Prod1"]))
+        self.ui.load_data()
+        self.assertTrue(first.closed)
+        self.assertEqual(len(self.ui.products), 51)
+
+class TestVirtualTable(unittest.TestCase):
+    def setUp(self):
+        # Treeview и полоса прокрутки заменены заглушками: видно 10 строк по 20 пикселей
+        patcher = mock.patch("table.ttk.Style")
+        patcher.start().return_value.lookup.return_value = 20
+        self.addCleanup(patcher.stop)
+        tree = mock.Mock()
+        tree.winfo_height.return_value = 200
+        tree.insert.side_effect = lambda *args, **kwargs: object()
+        self.table = VirtualTable(tree, mock.Mock(), lambda product: (product.name,))
+        self.products = [BaseProduct({"name": f"P{i}", "date_of_receipt": "10.04.2025", "count": i})
+                         for i in range(50)]
+
+    def test_new_rows_clear_selection(self):
+        """Выделение не переходит на другие продукты, оказавшиеся под теми же номерами строк."""
+        self.table.set_rows(self.products)
+        self.table.selected_rows = {0, 1}
+        self.assertEqual(self.table.selected_products(), self.products[:2])
+        self.table.set_rows(self.products[::-1])
+        self.assertEqual(self.table.selected_products(), [])
+
+    def test_wheel_scrolls_window_only(self):
+        self.table.set_rows(self.products)
+        self.assertEqual(self.table.on_mousewheel(mock.Mock(num=5, delta=0)), "break")
+        self.assertEqual(self.table.offset, 3)
+        self.assertEqual(self.table.on_mousewheel(mock.Mock(num=4, delta=0)), "break")
+        self.assertEqual(self.table.offset, 0)
+
+class TableStub:
+    """Таблица без Tk: строки в порядке показа."""
+
+    def __init__(self):
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.rows = list(rows)
+
+    def append(self, product):
+        self.rows.append(product)
+
+    def extend(self, products):
+        self.rows.extend(products)
+
+    def insert(self, product, position):
+        self.rows.insert(position, product)
+
+    def remove(self, product):
+        self.rows = [row for row in self.rows if row is not product]
+
+    def move(self, product, position):
+        self.remove(product)
+        self.insert(product, position)
+
+    def update(self, product):
+        pass
+
+    def update_many(self, products):
+        pass
+
+    def replace(self, old, new):
+        self.rows = [new if row is old else row for row in self.rows]
+
+    def selected_products(self):
+        return []
+
+class VirtualTableStub(TableStub):
+    """Как VirtualTable, держит ссылку на список строк и не читает строки вне окна."""
+
+    def set_rows(self, rows):
+        self.rows = rows
+
+    def append(self, product):
+        pass
+
+    def extend(self, products):
+        pass
+
+    def insert(self, product, position):
+        pass
+
+    def remove(self, product):
+        pass
+
+    def move(self, product, position):
+        pass
+
+    def replace(self, old, new):
+        pass
+
+class LabelStub:
+    def config(self, **options):
+        self.options = options
+
+def run_now(title, target, on_message):
+    """Фоновая задача без потока: выполняется сразу, сообщения доходят без очереди."""
+    task = mock.Mock()
+    task.report.side_effect = on_message
+    on_message("done", target(task))
+
+def headless_ui(storage, products=()):
+    """
+    UI без окна: состояние модели, таблица и строка статуса заменены заглушками,
+    фоновые задачи выполняются сразу.
+    """
+    ui = UI.__new__(UI)
+    ui.run_task = run_now
+    ui.storage = storage
+    ui.changes = {}
+    ui.last_key_number = 0
+    ui.partial = False
+    ui.index = ui.index_backlog = None
+    ui.sort = ui.sorter = ui.sort_backlog = None
+    ui.filtered = None
+    ui.virtual = False
+    ui.task = ui.load_task = None
+    ui.watch = False
+    ui.watcher = None
+    ui.history = History()
+    ui.table = TableStub()
+    ui.status = LabelStub()
+    ui.tree = mock.Mock()
+    ui.search_entry, ui.filter_low, ui.filter_high, ui.filter_field = (mock.Mock() for _ in range(4))
+    ui.products = list(products)
+    ui.table.set_rows(ui.products)
+    return ui
+
+class TestUIModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "inventory.json")
+        self.products = [BaseProduct({"name": f"Product {i}", "date_of_receipt": "10.04.2025", "count": i})
+                         for i in range(1, 4)]
+        for number, product in enumerate(self.products, 1):
+            product.key = f"Prod{number}"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_partial_load_blocks_full_save(self):
+        """После прерванной загрузки полное сохранение не перезаписывает файл неполным списком."""
+        ui = headless_ui(JsonStorage(self.filename), self.products[:1])
+        ui.partial = True
+        ui.mark_dirty(self.products[0])
+        with mock.patch("ui.messagebox.askyesno", return_value=False), \
+                mock.patch.object(ui, "load_data") as load_data:
+            ui.save_data()
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertIn("Prod1", ui.changes)
+        load_data.assert_not_called()
+        with mock.patch("ui.messagebox.askyesno", return_value=True), \
+                mock.patch.object(ui, "load_data") as load_data:
+            ui.save_data()
+        load_data.assert_called_once_with()
+        self.assertEqual(ui.changes, {})
+
+    def test_edits_wait_for_load(self):
+        """Пока идет загрузка, добавление, удаление и списание не выполняются: ключи еще не известны."""
+        ui = headless_ui(JsonStorage(self.filename), self.products)
+        ui.partial = True
+        ui.load_task = mock.Mock(finished=False)
+        ui.table.selected_products = lambda: [self.products[0]]
+        with mock.patch("ui.messagebox.showwarning") as warning:
+            ui.add_product()
+            ui.remove_product()
+            ui.write_off_product()
+        self.assertEqual(warning.call_count, 3)
+        self.assertEqual(ui.products, self.products)
+        self.assertEqual(ui.changes, {})
+
+    def test_edits_blocked_after_cancelled_load(self):
+        """После отмены загрузки правки не выполняются, пока данные не загружены заново."""
+        ui = headless_ui(JsonStorage(self.filename), self.products[:2])
+        ui.partial = True
+        ui.load_task = mock.Mock(finished=True)
+        ui.table.selected_products = lambda: [self.products[0]]
+        with mock.patch("ui.messagebox.askyesno", return_value=False) as ask:
+            ui.add_product()
+            ui.remove_product()
+            ui.write_off_product()
+        self.assertEqual(ask.call_count, 3)
+        self.assertEqual(ui.products, self.products[:2])
+        self.assertEqual(ui.changes, {})
+        with mock.patch("ui.messagebox.askyesno", return_value=True), \
+                mock.patch.object(ui, "load_data") as load_data:
+            ui.add_product()
+        load_data.assert_called_once_with()
+
+    def test_undo_add_hidden_by_filter(self):
+        """Отмена добавления продукта, который не попадает под фильтр, не падает и убирает его из списка."""
+        ui = headless_ui(JsonStorage(self.filename), self.products[:2])
+        ui.insert_product(self.products[2])
+        ui.history.record(Added(self.products[2], 2))
+        ui.filtered = [self.products[0]]
+        ui.table.set_rows(ui.filtered)
+        ui.undo()
+        self.assertEqual(list(map(id, ui.products)), list(map(id, self.products[:2])))
+        self.assertEqual(ui.filtered, [self.products[0]])
+        self.assertIsNone(ui.changes["Prod3"])
+        self.assertTrue(ui.history.can_redo())
+
+    def test_reload_removes_product_hidden_by_filter(self):
+        """Продукт, удаленный другим процессом и скрытый фильтром, убирается из списка без ошибки."""
+        ui = headless_ui(JsonStorage(self.filename), self.products)
+        ui.filtered = [self.products[0]]
+        ui.table.set_rows(ui.filtered)
+        ui.apply_reload(diff_products(ui.products, {"Prod2": None}))
+        self.assertEqual(list(map(id, ui.products)), [id(self.products[0]), id(self.products[2])])
+        self.assertEqual(ui.filtered, [self.products[0]])
+        self.assertEqual(ui.changes, {})
+
+    def test_reload_resets_search(self):
+        """Повторная загрузка сбрасывает индекс и результаты поиска: они ссылаются на прежние продукты."""
+        ui = headless_ui(JsonStorage(self.filename), self.products)
+        ui.index = ProductIndex(self.products)
+        ui.filtered = ui.index.query("Product 1")
+        with mock.patch.object(ui, "run_task") as run_task:
+            ui.load_data()
+        on_message = run_task.call_args.args[2]
+        reloaded = [BaseProduct(product_to_dict(product)) for product in self.products]
+        on_message("products", reloaded)
+        on_message("done", None)
+        self.assertIsNone(ui.index)
+        self.assertIsNone(ui.filtered)
+        self.assertEqual(ui.table.rows, reloaded)
+        ui.search_entry.delete.assert_called_once_with(0, "end")
+
+    def test_reload_resets_sort(self):
+        """Повторная загрузка при сортировке по колонке сбрасывает сортировку и стрелку в заголовке."""
+        ui = headless_ui(JsonStorage(self.filename), self.products)
+        ui.sort_by("Количество")
+        self.assertEqual(ui.table.rows, self.products)
+        with mock.patch.object(ui, "run_task") as run_task:
+            ui.load_data()
+        run_task.call_args.args[2]("products", self.products[::-1])
+        self.assertIsNone(ui.sort)
+        self.assertEqual(ui.table.rows, self.products[::-1])
+        ui.tree.heading.assert_called_with("Детали", text="Детали")
+        self.assertIn(mock.call("Количество", text="Количество"), ui.tree.heading.call_args_list)
+
 if __name__ == '__main__':
     unittest.main()
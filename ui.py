@@ -1,15 +1,86 @@
+import operator
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 from models import BaseProduct, Clothing, Furniture
 from validation import ValidationError
-from utils import parse_json, set_write_off_date
-import json
+from utils import bulk_write_off, product_to_dict, set_write_off_date
+from storage import open_storage
+from index import ProductIndex, SortIndex
+from dates import parse_date
+import analytics
+from table import ProductTable, VirtualTable
+from jsonindex import LazyProducts
+from workers import BackgroundTask
+from watcher import diff_products
+from history import Added, Batch, History, Removed, WrittenOff
+import metrics
+
+LOAD_CHUNK = 1000
+SAVE_CHUNK = 10000
+# период опроса файла склада на изменения другими процессами, мс
+WATCH_INTERVAL = 1000
+
+def _write_off_key(product):
+    write_off = product.date_of_write_off
+    return write_off.toordinal() if write_off else 0
+
+def product_row(product):
+    """Возвращает значения строки таблицы для продукта."""
+    details = ""
+    product_type = "Base Product"
+
+    if isinstance(product, Clothing):
+        product_type = "Clothing"
+        details = f"Size: {product.size}, Color: {product.color}, Material: {product.material}"
+    elif isinstance(product, Furniture):
+        product_type = "Furniture"
+        details = f"Material: {product.material}, Dimensions: {product.dimensions}, Weight: {product.weight}"
+
+    return (
+        product.name,
+        product_type,
+        product.formated_date_of_receipt,
+        product.formated_date_of_write_off,
+        product.count,
+        details
+    )
+
+# ключи сортировки по колонкам таблицы; даты сравниваются порядковыми номерами дней
+SORT_KEYS = {
+    "Название": operator.attrgetter("name"),
+    "Тип": lambda product: product_row(product)[1],
+    "Дата поступления": lambda product: product.date_of_receipt.toordinal(),
+    "Дата списания": _write_off_key,
+    "Количество": operator.attrgetter("count"),
+    "Детали": lambda product: product_row(product)[5],
+}
 
 class UI:
-    def __init__(self, master, filename):
+    def __init__(self, master, filename, virtual=False, storage=None, watch=True, history_depth=100):
         self.master = master
         self.filename = filename
         self.products = []
+        self.virtual = virtual
+        self.storage = storage or open_storage(filename)
+        # несохраненные изменения: ключ продукта -> продукт или None для удаленных
+        self.changes = {}
+        self.last_key_number = 0
+        # загрузка отменена или прервана ошибкой: в списке не все продукты хранилища
+        self.partial = False
+        # индекс строится при первом поиске; правки, сделанные во время
+        # построения, копятся в index_backlog и применяются после
+        self.index = None
+        self.index_backlog = None
+        self.filtered = None
+        # сортировка по колонке: (колонка, по убыванию) и кэш перестановок; перестановки
+        # строятся в рабочем потоке, правки на это время копятся в sort_backlog
+        self.sort = None
+        self.sorter = None
+        self.sort_backlog = None
+        # отслеживание изменений хранилища другими процессами (None — не отслеживается)
+        self.watch = watch
+        self.watcher = None
+        self.history = History(history_depth)
 
         master.title("Менеджмент склада")
         master.geometry("1200x600")
@@ -26,11 +97,68 @@ class UI:
         self.remove_btn = ttk.Button(self.toolbar, text="Удалить выбранное", command=self.remove_product)
         self.remove_btn.pack(side=tk.LEFT, padx=2)
 
+        self.undo_btn = ttk.Button(self.toolbar, text="Отменить", command=self.undo)
+        self.undo_btn.pack(side=tk.LEFT, padx=2)
+
+        self.redo_btn = ttk.Button(self.toolbar, text="Повторить", command=self.redo)
+        self.redo_btn.pack(side=tk.LEFT, padx=2)
+        master.bind("<Control-z>", lambda event: self.undo())
+        master.bind("<Control-y>", lambda event: self.redo())
+
         self.save_btn = ttk.Button(self.toolbar, text="Сохранить", command=self.save_data)
         self.save_btn.pack(side=tk.RIGHT, padx=2)
 
+        self.stats_btn = ttk.Button(self.toolbar, text="Статистика", command=self.show_stats)
+        self.stats_btn.pack(side=tk.RIGHT, padx=2)
+
+        self.cancel_btn = ttk.Button(self.toolbar, text="Отмена", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT, padx=2)
+
+        self.progress = ttk.Progressbar(self.toolbar, length=150, maximum=1.0)
+        self.progress.pack(side=tk.RIGHT, padx=2)
+
+        self.status = ttk.Label(self.toolbar, text="")
+        self.status.pack(side=tk.RIGHT, padx=5)
+        self.task = None
+        self.load_task = None
+
+        self.search_bar = ttk.Frame(master)
+        self.search_bar.pack(fill=tk.X, padx=5)
+
+        ttk.Label(self.search_bar, text="Название:").pack(side=tk.LEFT, padx=2)
+        self.search_entry = ttk.Entry(self.search_bar, width=30)
+        self.search_entry.pack(side=tk.LEFT, padx=2)
+        self.search_entry.bind("<Return>", lambda event: self.apply_filter())
+
+        self.filter_fields = {
+            "Дата поступления": "date_of_receipt",
+            "Дата списания": "date_of_write_off",
+            "Количество": "count"
+        }
+        self.filter_field = ttk.Combobox(self.search_bar, values=["—"] + list(self.filter_fields),
+                                         state="readonly", width=18)
+        self.filter_field.current(0)
+        self.filter_field.pack(side=tk.LEFT, padx=2)
+
+        ttk.Label(self.search_bar, text="от").pack(side=tk.LEFT, padx=2)
+        self.filter_low = ttk.Entry(self.search_bar, width=12)
+        self.filter_low.pack(side=tk.LEFT, padx=2)
+        ttk.Label(self.search_bar, text="до").pack(side=tk.LEFT, padx=2)
+        self.filter_high = ttk.Entry(self.search_bar, width=12)
+        self.filter_high.pack(side=tk.LEFT, padx=2)
+
+        ttk.Button(self.search_bar, text="Найти", command=self.apply_filter).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.search_bar, text="Сбросить", command=self.reset_filter).pack(side=tk.LEFT, padx=2)
+
         self.tree = ttk.Treeview(master, columns=("Название", "Тип", "Дата поступления", "Дата списания", "Количество", "Детали"), show="headings")
+        if virtual:
+            self.scrollbar = ttk.Scrollbar(master, orient=tk.VERTICAL)
+            self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=6)
+            self.table = VirtualTable(self.tree, self.scrollbar, product_row)
+        else:
+            self.table = ProductTable(self.tree, product_row)
         self.tree.pack(expand=True, fill=tk.BOTH, padx=6, pady=6)
+        self.tree.bind("<Control-a>", lambda event: self.table.select_all())
 
         columns = [
             ("Название", 200),
@@ -42,97 +170,589 @@ class UI:
         ]
 
         for col_name, width in columns:
-            self.tree.heading(col_name, text=col_name)
+            self.tree.heading(col_name, text=col_name, command=lambda column=col_name: self.sort_by(column))
             self.tree.column(col_name, width=width, anchor=tk.W)
 
         self.load_data()
-        self.update_table()
+        if watch:
+            self.master.after(WATCH_INTERVAL, self.watch_storage)
+
+    def busy(self):
+        """Проверяет, выполняется ли фоновая задача, и предупреждает пользователя."""
+        if self.task is not None and not self.task.finished:
+            messagebox.showwarning("Warning", "Дождитесь завершения текущей операции")
+            return True
+        return False
+
+    def loading(self):
+        """
+        Проверяет, загружены ли все продукты, и предупреждает пользователя. Пока загрузка
+        идет или после ее отмены и ошибки новый ключ может совпасть с ключом непрочитанного
+        продукта, а удаление и списание — затереть его при сохранении, поэтому правки ждут.
+        """
+        if not self.partial:
+            return False
+        if self.load_task is not None and not self.load_task.finished:
+            messagebox.showwarning("Warning", "Дождитесь окончания загрузки данных")
+        else:
+            self.offer_reload("Данные загружены не полностью, правки недоступны.")
+        return True
+
+    def offer_reload(self, reason):
+        """Предлагает загрузить данные заново, отбросив несохраненные правки."""
+        if messagebox.askyesno("Warning", f"{reason} Загрузить данные заново? Несохраненные правки будут потеряны."):
+            self.changes = {}
+            self.load_data()
+
+    def run_task(self, title, target, on_message):
+        """Запускает фоновую задачу, если другая задача сейчас не выполняется."""
+        if self.busy():
+            return
+
+        def handle(kind, payload):
+            if kind == "progress":
+                self.progress["value"] = payload
+            elif kind in ("done", "error", "cancelled"):
+                self.progress["value"] = 0
+                self.cancel_btn.config(state=tk.DISABLED)
+                self.save_btn.config(state=tk.NORMAL)
+                self.status.config(text="Отменено" if kind == "cancelled" else "")
+            on_message(kind, payload)
+
+        self.status.config(text=f"{title}...")
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.save_btn.config(state=tk.DISABLED)
+        self.task = BackgroundTask(self.master, target, handle).start()
+
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
 
     def load_data(self):
-        try:
-            self.products = parse_json(self.filename)
-        except Exception as e:
-            messagebox.showerror("Error", f"Ошибка загрузки данных: {str(e)}")
+        """
+        Загружает продукты в рабочем потоке. Продукты приходят порциями
+        и добавляются в список и таблицу в главном потоке. Виртуальная таблица
+        над JSON-файлом без журнала получает вместо них LazyProducts: продукты
+        декодируются из файла по мере прокрутки.
+        """
+        previous, self.products = self.products, []
+        self.partial = True
+        # перестановки строились по прежнему списку: сортировка сбрасывается вместе с ними
+        self.sort = self.sorter = self.sort_backlog = None
+        self.show_sort()
+        # индекс и результаты поиска ссылаются на продукты прежнего списка
+        self.index = self.index_backlog = self.filtered = None
+        self.clear_search()
+        # состояние файлов запоминается до чтения: правки, сделанные во время загрузки, не теряются
+        self.watcher = self.storage.watch() if self.watch else None
+        self.history.clear()
+        self.update_table()
+        def load(task):
+            rows = self.storage.lazy_products() if self.virtual else None
+            if rows is not None:
+                task.report("rows", rows)
+                return
+
+            def progress(done, total):
+                task.report("progress", done / total if total else 1.0)
+
+            chunk = []
+            for product in self.storage.iter_products(progress=progress):
+                chunk.append(product)
+                if len(chunk) >= LOAD_CHUNK:
+                    task.check_cancelled()
+                    task.report("products", chunk)
+                    chunk = []
+            task.report("products", chunk)
+
+        def on_message(kind, payload):
+            if kind == "products":
+                for product in payload:
+                    self.note_key(product.key)
+                    self.index_event("add", product)
+                    self.sort_event("add", product)
+                self.products.extend(payload)
+                if self.filtered is None:
+                    self.show_added(payload)
+            elif kind == "rows":
+                for key in payload.source.keys:
+                    self.note_key(key)
+                self.products = payload
+                self.update_table()
+            if kind in ("done", "error", "cancelled") and isinstance(previous, LazyProducts):
+                # прежний список больше не читается; хранилище могло вернуть тот же индекс и новому
+                if previous.source is not getattr(self.products, "source", None):
+                    previous.source.close()
+            if kind == "done":
+                self.partial = False
+            elif kind == "error":
+                messagebox.showerror("Error", f"Ошибка загрузки данных: {str(payload)}")
+
+        self.run_task("Загрузка", load, on_message)
+        self.load_task = self.task
 
     def save_data(self):
-        data = {}
-        for idx, product in enumerate(self.products):
-            item_data = {
-                "name": product.name,
-                "date_of_receipt": product.formated_date_of_receipt,
-                "count": product.count
-            }
-
-            if product.date_of_write_off:
-                item_data["date_of_write_off"] = product.formated_date_of_write_off
-
-            if isinstance(product, Clothing):
-                item_data.update({
-                    "size": product.size,
-                    "color": product.color,
-                    "material": product.material
-                })
-            elif isinstance(product, Furniture):
-                item_data.update({
-                    "material": product.material,
-                    "dimensions": product.dimensions,
-                    "weight": product.weight
-                })
-
-            data[f"Prod{idx + 1}"] = item_data
-
-        try:
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=2)
-            messagebox.showinfo("Success", "Данные успешно сохранены")
-        except Exception as e:
-            messagebox.showerror("Error", f"Ошибка сохранения данных: {str(e)}")
+        """
+        Сохраняет изменения в рабочем потоке. Обычно в хранилище записываются только
+        измененные продукты (в журнал JSON-файла или отдельными строками SQLite);
+        когда журнал разрастается, все продукты атомарно записываются в основной файл. Сохраняется снимок на момент нажатия кнопки,
+        поэтому продолжать правки во время сохранения безопасно.
+        """
+        if self.busy():
+            return
+        if self.partial and self.storage.needs_full_save(len(self.changes)):
+            # полная перезапись из неполного списка потеряла бы незагруженные продукты
+            self.offer_reload("Данные загружены не полностью, и сохранение перезаписало бы файл "
+                              "без незагруженных продуктов.")
+            return
 
+        pending = self.changes
+        self.changes = {}
+        changes = {}
+        for key, product in pending.items():
+            if product is not None:
+                product.dirty = False
+                changes[key] = product_to_dict(product)
+            else:
+                changes[key] = None
+
+        if self.storage.needs_full_save(len(changes)):
+            snapshot = self.products.copy()
+
+            def save(task):
+                def products():
+                    for idx, product in enumerate(snapshot):
+                        if idx % SAVE_CHUNK == 0:
+                            task.check_cancelled()
+                            task.report("progress", idx / len(snapshot))
+                        yield product
+
+                with metrics.timer("save_data"):
+                    self.storage.save_all(products(), write_snapshot=True)
+        else:
+            def save(task):
+                with metrics.timer("save_data"):
+                    self.storage.save_changes(changes)
+
+        def on_message(kind, payload):
+            if kind == "done":
+                messagebox.showinfo("Success", "Данные успешно сохранены")
+                return
+            # изменения не сохранены: возвращаем их, не затирая более новые правки
+            for key, product in pending.items():
+                if key not in self.changes:
+                    self.changes[key] = product
+                    if product is not None:
+                        product.dirty = True
+            if kind == "error":
+                messagebox.showerror("Error", f"Ошибка сохранения данных: {str(payload)}")
+
+        self.run_task("Сохранение", save, on_message)
+
+    def show_stats(self):
+        """Считает агрегаты по снимку списка в рабочем потоке и показывает их в отдельном окне."""
+        snapshot = self.products.copy()
+
+        def on_message(kind, payload):
+            if kind == "done":
+                self.stats_window(payload)
+            elif kind == "error":
+                messagebox.showerror("Error", f"Ошибка расчета статистики: {str(payload)}")
+
+        self.run_task("Статистика", lambda task: analytics.summary(snapshot), on_message)
+
+    def stats_window(self, stats):
+        window = tk.Toplevel(self.master)
+        window.title("Статистика склада")
+        text = tk.Text(window, width=60, height=30)
+        text.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+
+        average_age = stats["average_age_on_hand"]
+        lines = [
+            f"Продуктов: {stats['products']}",
+            f"Общий вес мебели: {stats['total_weight']}",
+            f"Средний возраст остатков: {'—' if average_age is None else f'{average_age:.1f} дн.'}",
+            f"Доля списанных: {stats['write_off_rate']:.1%}",
+            "",
+            "Тип: продуктов / единиц товара"
+        ]
+        for type_name, products in stats["products_by_type"].items():
+            lines.append(f"  {type_name}: {products} / {stats['count_by_type'][type_name]}")
+        lines += ["", "Возраст остатков (дни):"]
+        lines += [f"  {label}: {count}" for label, count in stats["age_histogram"].items()]
+        lines += ["", "Списания по месяцам:"]
+        lines += [f"  {month}: {count}" for month, count in stats["write_offs_per_month"].items()]
+        text.insert(tk.END, "\n".join(lines))
+        text.config(state=tk.DISABLED)
+
+    def note_key(self, key):
+        if key and key.startswith("Prod") and key[4:].isdigit():
+            self.last_key_number = max(self.last_key_number, int(key[4:]))
+
+    def new_key(self):
+        self.last_key_number += 1
+        return self.storage.assign_key(f"Prod{self.last_key_number}")
+
+    def mark_dirty(self, product):
+        product.dirty = True
+        self.changes[product.key] = product
+
+    @metrics.timed("update_table")
     def update_table(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for product in self.products:
-            details = ""
-            product_type = "Base Product"
-
-            if isinstance(product, Clothing):
-                product_type = "Clothing"
-                details = f"Size: {product.size}, Color: {product.color}, Material: {product.material}"
-            elif isinstance(product, Furniture):
-                product_type = "Furniture"
-                details = f"Material: {product.material}, Dimensions: {product.dimensions}, Weight: {product.weight}"
-
-            self.tree.insert("", tk.END, values=(
-                product.name,
-                product_type,
-                product.formated_date_of_receipt,
-                product.formated_date_of_write_off,
-                product.count,
-                details
-            ))
+        rows = self.products if self.filtered is None else self.filtered
+        if self.sort is not None:
+            column, descending = self.sort
+            if self.filtered is None:
+                rows = self.sorter.rows(column, descending)
+            else:
+                rows = self.sorter.sort(rows, column, descending)
+        self.table.set_rows(rows)
+
+    def sort_by(self, column):
+        """
+        Сортирует таблицу по колонке, повторный щелчок меняет направление.
+        Перестановка для колонки строится один раз и дальше поддерживается правками.
+        """
+        if self.sorter is None:
+            if self.sort_backlog is None:
+                self.build_sorter(column, lambda: self.sort_by(column))
+            return
+        descending = self.sort == (column, False)
+        self.sort = (column, descending)
+        self.show_sort()
+        self.update_table()
+
+    def show_sort(self):
+        """Стрелка направления сортировки в заголовке отсортированной колонки."""
+        column, descending = self.sort or (None, False)
+        for name in SORT_KEYS:
+            arrow = (" ▼" if descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=name + arrow)
+
+    def build_sorter(self, column, then):
+        """Строит перестановку для колонки в рабочем потоке по снимку списка и затем вызывает then()."""
+        if self.busy():
+            return
+        snapshot = self.products.copy()
+        self.sort_backlog = []
+
+        def build(task):
+            sorter = SortIndex(snapshot, SORT_KEYS)
+            sorter.order(column)
+            return sorter
+
+        def on_message(kind, payload):
+            if kind == "done":
+                self.sorter = payload
+                for action, product in self.sort_backlog:
+                    getattr(self.sorter, action)(product)
+                self.sort_backlog = None
+                then()
+            elif kind in ("error", "cancelled"):
+                self.sort_backlog = None
+                if kind == "error":
+                    messagebox.showerror("Error", f"Ошибка сортировки: {str(payload)}")
+
+        self.run_task("Сортировка", build, on_message)
+
+    def sorted_position(self, product):
+        column, descending = self.sort
+        return self.sorter.position(column, product, descending)
+
+    def show_added(self, products):
+        """Показывает новые продукты при отсутствии фильтра: в конце таблицы или на своих местах при сортировке."""
+        if self.sort is None or self.virtual:
+            # виртуальная таблица читает строки из перестановки, они уже на месте
+            self.table.extend(products)
+        else:
+            for product in products:
+                self.table.insert(product, self.sorted_position(product))
+
+    def product_added(self, product):
+        self.mark_dirty(product)
+        self.display_added(product)
+
+    def display_added(self, product):
+        self.sort_event("add", product)
+        if self.filtered is None:
+            self.show_added([product])
+        else:
+            self.filtered.append(product)
+            if self.sort is None:
+                self.table.append(product)
+            else:
+                self.update_table()
+        self.index_event("add", product)
+
+    def product_updated(self, product):
+        self.mark_dirty(product)
+        self.sort_event("update", product)
+        self.table.update(product)
+        if self.sort is not None:
+            if self.filtered is None:
+                self.table.move(product, self.sorted_position(product))
+            else:
+                self.update_table()
+        self.index_event("update", product)
+
+    def products_updated(self, products):
+        for product in products:
+            self.mark_dirty(product)
+            self.sort_event("update", product)
+            self.index_event("update", product)
+        if self.sort is None:
+            self.table.update_many(products)
+        else:
+            self.update_table()
+
+    def product_removed(self, product):
+        product.dirty = False
+        self.changes[product.key] = None
+        self.display_removed(product)
+
+    def display_removed(self, product):
+        self.sort_event("remove", product)
+        if self.filtered is not None:
+            # продукт мог не попадать под фильтр, тогда в отфильтрованном списке его нет
+            ids = list(map(id, self.filtered))
+            if id(product) in ids:
+                del self.filtered[ids.index(id(product))]
+        if self.sort is not None and self.filtered is not None:
+            self.update_table()
+        else:
+            self.table.remove(product)
+        self.index_event("remove", product)
+
+    def display_replaced(self, old, new):
+        """Показывает новую версию продукта, перечитанную из хранилища, на месте старой."""
+        self.sort_event("remove", old)
+        self.sort_event("add", new)
+        if self.filtered is not None:
+            ids = list(map(id, self.filtered))
+            if id(old) in ids:
+                self.filtered[ids.index(id(old))] = new
+        self.table.replace(old, new)
+        if self.sort is not None:
+            if self.filtered is None:
+                self.table.move(new, self.sorted_position(new))
+            else:
+                self.update_table()
+        self.index_event("remove", old)
+        self.index_event("add", new)
+
+    def watch_storage(self):
+        """
+        Периодически проверяет, не изменил ли хранилище другой процесс. Опрос
+        пропускается, пока выполняется фоновая задача; изменения подхватятся позже.
+        """
+        self.master.after(WATCH_INTERVAL, self.watch_storage)
+        if self.watcher is None or (self.task is not None and not self.task.finished):
+            return
+        if self.watcher.poll():
+            self.reload_changes()
+
+    def reload_changes(self):
+        """Перечитывает изменения хранилища в рабочем потоке и накладывает их на список."""
+        watcher = self.watcher
+        snapshot = self.products.copy()
+
+        def keys():
+            # ключи ленивого списка читаются из индекса файла, продукты не декодируются
+            if isinstance(snapshot, LazyProducts):
+                return snapshot.keys()
+            return (product.key for product in snapshot)
+
+        def reload(task):
+            changes = watcher.reload(keys)
+            return diff_products(snapshot, changes, keys())
+
+        def on_message(kind, payload):
+            if kind == "done" and watcher is self.watcher:
+                self.apply_reload(payload)
+            elif kind == "error":
+                messagebox.showerror("Error", f"Ошибка обновления данных: {str(payload)}")
+
+        self.run_task("Обновление", reload, on_message)
+
+    def apply_reload(self, operations):
+        """
+        Накладывает операции diff_products на список и таблицу. Продукты с несохраненными
+        правками в этом окне не трогаются: при сохранении они запишутся поверх.
+        """
+        removed = []
+        for position, old, new in operations:
+            key = (new if old is None else old).key
+            if key in self.changes:
+                continue
+            if old is None:
+                self.note_key(key)
+                self.products.append(new)
+                self.display_added(new)
+                continue
+            if position >= len(self.products) or self.products[position] is not old:
+                # список изменился, пока хранилище перечитывалось
+                try:
+                    position = self.index_of(old)
+                except ValueError:
+                    continue
+            if new is None:
+                removed.append((position, old))
+            else:
+                self.products[position] = new
+                self.display_replaced(old, new)
+        # удаление с конца не сдвигает позиции еще не удаленных продуктов
+        for position, old in sorted(removed, key=operator.itemgetter(0), reverse=True):
+            del self.products[position]
+            self.display_removed(old)
+        if operations:
+            # команды истории ссылаются на замененные продукты и прежние позиции
+            self.history.clear()
+            self.status.config(text=f"Обновлено из файла: {len(operations)}")
+
+    def insert_product(self, product, position=None):
+        """Вставляет продукт в позицию списка (по умолчанию в конец) как новую правку."""
+        if position is None or position >= len(self.products):
+            self.products.append(product)
+        else:
+            self.products.insert(position, product)
+        self.product_added(product)
+        if position is not None and self.sort is None and self.filtered is None:
+            self.table.move(product, position)
+
+    def delete_product(self, product, position=None):
+        """Удаляет продукт из списка как новую правку и возвращает позицию, которую он занимал."""
+        if position is None or position >= len(self.products) or self.products[position] is not product:
+            position = self.index_of(product)
+        del self.products[position]
+        self.product_removed(product)
+        return position
+
+    def undo(self):
+        command = self.history.undo(self)
+        self.status.config(text=f"Отменено: {command.title}" if command else "Нечего отменять")
+
+    def redo(self):
+        command = self.history.redo(self)
+        self.status.config(text=f"Повторено: {command.title}" if command else "Нечего повторять")
+
+    def sort_event(self, action, product):
+        if self.sorter is not None:
+            getattr(self.sorter, action)(product)
+        elif self.sort_backlog is not None:
+            self.sort_backlog.append((action, product))
+
+    def index_event(self, action, product):
+        if self.index is not None:
+            getattr(self.index, action)(product)
+        elif self.index_backlog is not None:
+            self.index_backlog.append((action, product))
+
+    def build_index(self, then):
+        """Строит индекс в рабочем потоке по снимку списка и затем вызывает then()."""
+        if self.busy():
+            return
+        snapshot = self.products.copy()
+        self.index_backlog = []
+
+        def build(task):
+            return ProductIndex(snapshot)
+
+        def on_message(kind, payload):
+            if kind == "done":
+                self.index = payload
+                for action, product in self.index_backlog:
+                    getattr(self.index, action)(product)
+                self.index_backlog = None
+                then()
+            elif kind in ("error", "cancelled"):
+                self.index_backlog = None
+                if kind == "error":
+                    messagebox.showerror("Error", f"Ошибка построения индекса: {str(payload)}")
+
+        self.run_task("Индексация", build, on_message)
+
+    def apply_filter(self):
+        text = self.search_entry.get().strip()
+        ranges = {}
+        field = self.filter_fields.get(self.filter_field.get())
+        if field is not None:
+            try:
+                bounds = [self.parse_bound(field, entry.get().strip())
+                          for entry in (self.filter_low, self.filter_high)]
+            except ValueError:
+                messagebox.showerror("Error", "Неверная граница фильтра: ожидается дата 'DD.MM.YYYY' или число")
+                return
+            ranges[field] = tuple(bounds)
+
+        if self.index is None:
+            if self.index_backlog is None:
+                self.build_index(self.apply_filter)
+            return
+        self.filtered = self.index.query(text, ranges)
+        self.update_table()
+        self.status.config(text=f"Найдено: {len(self.filtered)}")
+
+    @staticmethod
+    def parse_bound(field, value):
+        if not value:
+            return None
+        if field == "count":
+            return int(value)
+        return parse_date(value).toordinal()
+
+    def reset_filter(self):
+        self.filtered = None
+        self.clear_search()
+        self.update_table()
+        self.status.config(text="")
+
+    def clear_search(self):
+        self.search_entry.delete(0, tk.END)
+        self.filter_low.delete(0, tk.END)
+        self.filter_high.delete(0, tk.END)
+        self.filter_field.current(0)
+
+    def selected_product(self):
+        """Возвращает выбранный в таблице продукт или None."""
+        selected = self.table.selected_products()
+        return selected[0] if selected else None
+
+    def index_of(self, product):
+        """Индекс продукта в self.products по идентичности, а не по __eq__."""
+        if isinstance(self.products, LazyProducts):
+            return self.products.index_of(product)
+        return list(map(id, self.products)).index(id(product))
 
     def write_off_product(self):
-        selected = self.tree.selection()
+        """Списывает все выбранные продукты одной датой: либо все, либо ни одного."""
+        if self.loading():
+            return
+        selected = self.table.selected_products()
         if not selected:
             messagebox.showwarning("Warning", "Продукт не выбран")
             return
 
-        index = self.tree.index(selected[0])
-        product = self.products[index]
-
-        date_str = simpledialog.askstring("Списание",
-                                          "Введите дату списания:",
-                                          parent=self.master)
+        prompt = "Введите дату списания:"
+        if len(selected) > 1:
+            prompt = f"Введите дату списания для {len(selected)} продуктов:"
+        date_str = simpledialog.askstring("Списание", prompt, parent=self.master)
 
         if date_str:
+            previous = [product.date_of_write_off for product in selected]
             try:
-                set_write_off_date(product, date_str)
-                self.update_table()
+                if len(selected) == 1:
+                    set_write_off_date(selected[0], date_str)
+                    self.product_updated(selected[0])
+                else:
+                    self.products_updated(bulk_write_off(selected, date_str))
+                self.history.record(WrittenOff(selected, previous))
             except ValidationError as e:
                 messagebox.showerror("Error", str(e))
 
     def add_product(self):
+        if self.loading():
+            return
+
         class TypeChoiceDialog(tk.Toplevel):
             def __init__(self, parent):
                 super().__init__(parent)
@@ -227,8 +847,10 @@ class UI:
                 else:
                     new_product = BaseProduct(data)
 
+                new_product.key = self.new_key()
                 self.products.append(new_product)
-                self.update_table()
+                self.product_added(new_product)
+                self.history.record(Added(new_product, len(self.products) - 1))
 
             except ValidationError as e:
                 messagebox.showerror("Validation Error", str(e))
@@ -236,11 +858,22 @@ class UI:
                 messagebox.showerror("Error", f"Ошибка создания продукта: {str(e)}")
 
     def remove_product(self):
-        selected = self.tree.selection()
+        """Удаляет выбранные продукты; удаление нескольких отменяется одним шагом."""
+        if self.loading():
+            return
+        selected = self.table.selected_products()
         if not selected:
             messagebox.showwarning("Warning", "Не выбран продукт")
             return
 
-        index = self.tree.index(selected[0])
-        del self.products[index]
-        self.update_table()
+        # с конца списка, чтобы отмена в обратном порядке вернула продукты на прежние позиции
+        # выбранные продукты уже показаны в таблице, поэтому ленивому списку хватает декодированных
+        loaded = self.products.loaded() if isinstance(self.products, LazyProducts) else enumerate(self.products)
+        positions = {id(product): position for position, product in loaded}
+        selected.sort(key=lambda product: positions[id(product)], reverse=True)
+        removed = [Removed(product, self.delete_product(product, positions[id(product)]))
+                   for product in selected]
+        if len(removed) == 1:
+            self.history.record(removed[0])
+        else:
+            self.history.record(Batch(removed, f"удаление {len(removed)} продуктов"))
@@ -1,17 +1,38 @@
 # utils.py
+import codecs
 import json
 import logging
-from models import BaseProduct, Clothing, Furniture
+import operator
+import os
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import repeat
+import metrics
+import serialization
+from applog import BufferedLogHandler, flush as flush_log
+from dates import parse_date
+from models import BaseProduct, Clothing, Furniture, product_class
 from validation import ValidationError
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 logger = logging.getLogger("ProductParser")
 logger.setLevel(logging.INFO)
 if not logger.handlers:
-    file_handler = logging.FileHandler("app.log", encoding="utf-8")
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    # app.log открывается при первой ошибке, а пишется фоновым потоком
+    logger.addHandler(BufferedLogHandler())
+
+def build_product(item, key=None):
+    """Создает объект продукта нужного типа по словарю с данными."""
+    product = product_class(item)(item)
+    product.key = key
+    return product
 
 def parse_json(filename):
     """
@@ -21,37 +42,489 @@ def parse_json(filename):
     """
     products = []
     try:
-        with open(filename, 'r', encoding="UTF-8") as f:
-            data = json.load(f)
+        with metrics.timer("parse_json_read"), open(filename, 'rb') as f:
+            raw = f.read()
+        with metrics.timer("parse_json_decode"):
+            data = serialization.loads(raw)
+        del raw
     except Exception as e:
-        logger.error(f"Ошибка открытия или чтения файла {filename}: {e}")
+        logger.error("Ошибка открытия или чтения файла %s: %s", filename, e)
         return products
 
-    for key, item in data.items():
+    # проверка полей идет в конструкторах моделей, поэтому замеряется вместе с созданием
+    with metrics.timer("parse_json_construct"):
+        for key, item in data.items():
+            try:
+                products.append(build_product(item, key))
+            except ValidationError as ve:
+                logger.error("Ошибка обработки продукта %s: %s", key, ve)
+                metrics.count("validation_errors", error=metrics.error_label(ve))
+                continue
+            except Exception as e:
+                logger.error("Непредвиденная ошибка при обработке продукта %s: %s", key, e)
+                metrics.count("validation_errors", error=metrics.error_label(e))
+                continue
+    metrics.count("products_parsed", len(products))
+    flush_log(logger)
+    return products
+
+_CLASS_CODES = {BaseProduct: 0, Clothing: 1, Furniture: 2}
+_CODE_CLASSES = (BaseProduct, Clothing, Furniture)
+
+def _build_chunk(chunk_text):
+    """
+    Разбирает и проверяет порцию записей в дочернем процессе. Порция передается
+    JSON-текстом объекта, а результат — компактными кортежами: передача готовых
+    объектов и словарей между процессами стоит дороже самой проверки.
+    Ошибки возвращаются шаблоном сообщения с аргументами, чтобы главный процесс
+    записал их в лог в исходном порядке.
+    """
+    results = []
+    for key, item in serialization.loads(chunk_text).items():
         try:
-            if "size" in item and "color" in item and "material" in item:
-                product = Clothing(item)
-            elif "dimensions" in item and "weight" in item and "material" in item:
-                product = Furniture(item)
-            else:
-                product = BaseProduct(item)
-            products.append(product)
+            product = build_product(item)
         except ValidationError as ve:
-            logger.error(f"Ошибка обработки продукта {key}: {ve}")
+            results.append(("Ошибка обработки продукта %s: %s", key, str(ve)))
             continue
         except Exception as e:
-            logger.error(f"Непредвиденная ошибка при обработке продукта {key}: {e}")
+            results.append(("Непредвиденная ошибка при обработке продукта %s: %s", key, str(e)))
             continue
+        write_off = product.date_of_write_off
+        row = (_CLASS_CODES[type(product)], key, product.name, product.date_of_receipt.toordinal(),
+               write_off.toordinal() if write_off else 0, product.count)
+        if isinstance(product, Clothing):
+            row += (product.size, product.color, product.material)
+        elif isinstance(product, Furniture):
+            row += (product.material, product.dimensions, product.weight)
+        results.append(row)
+    return results
+
+_MEMBER_START = '\n  "'
+
+def _split_members(text, parts):
+    """
+    Делит текст JSON-объекта на parts объектов поменьше без полного разбора.
+    Разрез делается перед строкой, начинающейся ровно с двух пробелов и кавычки:
+    так json.dump(indent=2) и save_products записывают ключи верхнего уровня.
+    Строки JSON не содержат переводов строк, поэтому ошибочный разрез внутри
+    вложенного объекта дает несбалансированные скобки и обнаруживается при разборе.
+    Возвращает None, если текст не похож на объект.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start or text[:start].strip() or text[end + 1:].strip():
+        return None
+    body_end = end
+    cuts = [start + 1]
+    step = max(1, (end - start) // parts)
+    while True:
+        cut = text.find(_MEMBER_START, cuts[-1] + step, body_end)
+        if cut < 0:
+            break
+        cuts.append(cut)
+    cuts.append(body_end)
+    chunks = []
+    for left, right in zip(cuts, cuts[1:]):
+        segment = text[left:right].strip()
+        if segment.endswith(","):
+            segment = segment[:-1]
+        chunks.append("{" + segment + "}")
+    return chunks
+
+def _restore_product(row, dates):
+    """Создает уже проверенный продукт из кортежа _build_chunk без повторной проверки."""
+    cls = _CODE_CLASSES[row[0]]
+    product = cls.__new__(cls)
+    product.key = row[1]
+    product.dirty = False
+    product.name = row[2]
+    product.date_of_receipt = dates[row[3]]
+    product.date_of_write_off = dates[row[4]] if row[4] else None
+    product.count = row[5]
+    if cls is Clothing:
+        product.size, product.color, product.material = row[6:]
+    elif cls is Furniture:
+        product.material, product.dimensions, product.weight = row[6:]
+    return product
+
+class _DateCache(dict):
+    def __missing__(self, ordinal):
+        value = self[ordinal] = datetime.fromordinal(ordinal)
+        return value
+
+def _submit_chunks(pool, text, parts):
+    """
+    Делит текст JSON-объекта на порции по границам записей и отправляет их в пул.
+    Возвращает futures в исходном порядке или None, если текст не удалось разделить.
+    """
+    chunks = _split_members(text, parts)
+    # файл без отступов целиком достался бы одному процессу
+    if not chunks or len(chunks) < 2:
+        return None
+    return [pool.submit(_build_chunk, chunk) for chunk in chunks]
+
+def _chunk_results(pool, text, futures, parts, filename):
+    """
+    Собирает результаты _build_chunk по порциям текста. Если разрез оказался неверным
+    или текст не делился, текст разбирается целиком и делится уже разобранным.
+    Возвращает None, если файл не является корректным JSON (ошибка пишется в лог).
+    """
+    if futures is not None:
+        try:
+            return [future.result() for future in futures]
+        except ValueError:
+            # ошибка разбора порции (у быстрых библиотек JSON свои классы исключений)
+            pass
+    try:
+        data = serialization.loads(text)
+    except Exception as e:
+        logger.error("Ошибка открытия или чтения файла %s: %s", filename, e)
+        return None
+    items = list(data.items())
+    step = max(1, len(items) // parts)
+    chunks = (serialization.dumps(dict(items[i:i + step])) for i in range(0, len(items), step))
+    return list(pool.map(_build_chunk, chunks))
+
+def _restore_results(results, dates, source=None):
+    """Выдает продукты из результатов _build_chunk и пишет в лог ошибки; source уточняет ключ в сообщении."""
+    for chunk_results in results:
+        for result in chunk_results:
+            if isinstance(result[0], str):
+                message, key, reason = result
+                logger.error(message, key if source is None else f"{source}/{key}", reason)
+            else:
+                yield _restore_product(result, dates)
+
+def parse_json_parallel(filename, workers=None):
+    """
+    Аналог parse_json, который разбирает и проверяет продукты в пуле процессов.
+    Текст файла делится на порции по границам записей верхнего уровня;
+    порядок продуктов и сообщения об ошибках в логе совпадают с parse_json.
+    Если файл не удается разделить (например, он записан в одну строку),
+    он разбирается целиком и делится уже разобранным.
+    """
+    products = []
+    workers = workers or os.cpu_count() or 1
+    try:
+        with open(filename, 'r', encoding="UTF-8") as f:
+            text = f.read()
+    except Exception as e:
+        logger.error("Ошибка открытия или чтения файла %s: %s", filename, e)
+        return products
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = _submit_chunks(pool, text, workers * 4)
+        results = _chunk_results(pool, text, futures, workers * 4, filename)
+        del text
+        if results is not None:
+            products.extend(_restore_results(results, _DateCache()))
+    flush_log(logger)
     return products
 
+def _read_text(filename):
+    try:
+        with open(filename, 'r', encoding="UTF-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error("Ошибка открытия или чтения файла %s: %s", filename, e)
+        return None
+
+def parse_files_parallel(filenames, workers=None, io_workers=8):
+    """
+    Разбирает несколько JSON-файлов: чтение идет в пуле потоков, проверка продуктов —
+    в пуле процессов, причем порции всех файлов отправляются в пул сразу.
+    Выдает пары (имя файла, список продуктов) в порядке filenames; отсутствующий файл
+    дает пустой список. В сообщениях об ошибках ключ уточняется именем файла.
+    """
+    filenames = list(filenames)
+    workers = workers or os.cpu_count() or 1
+    parts = workers * 4
+    with ThreadPoolExecutor(max_workers=max(1, min(io_workers, len(filenames)))) as io_pool, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for filename, text in zip(filenames, io_pool.map(_read_text, filenames)):
+            pending.append((filename, text, None if text is None else _submit_chunks(pool, text, parts)))
+        for i, (filename, text, futures) in enumerate(pending):
+            # текст файла больше не нужен после сборки его результатов
+            pending[i] = None
+            products = []
+            if text is not None:
+                results = _chunk_results(pool, text, futures, parts, filename)
+                del text
+                products.extend(_restore_results(results or (), _DateCache(),
+                                                 source=os.path.basename(filename)))
+            yield filename, products
+    flush_log(logger)
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# символы, после которых число в JSON заведомо закончилось
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+def iter_json_items(chunks):
+    """
+    Потоково разбирает JSON-объект верхнего уровня, поступающий кусками текста,
+    и выдает пары (ключ, значение) по одной.
+    В памяти одновременно держится только текущий кусок и разбираемое значение.
+    """
+    for key, value, _, _ in iter_json_spans(chunks):
+        yield key, value
+
+def iter_json_spans(chunks):
+    """
+    То же, что iter_json_items, но вместе с ключом и значением выдает границы
+    [start, end) текста значения от начала потока.
+    """
+    buf = ""
+    pos = 0
+    base = 0
+    eof = False
+    chunks = iter(chunks)
+
+    def fill():
+        nonlocal buf, pos, base, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            return False
+        base += pos
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or not fill():
+                return
+
+    def expect(chars):
+        nonlocal pos
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("Неожиданный конец файла")
+        char = buf[pos]
+        if char not in chars:
+            raise ValueError(f"Ожидался один из символов {chars!r}, получен {char!r}")
+        pos += 1
+        return char
+
+    def decode_value():
+        nonlocal pos
+        skip_ws()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+                continue
+            # число на границе куска могло быть прочитано не полностью, в том числе
+            # до точки или экспоненты ("-25." + "5"): оно дочитывается, если за ним не разделитель
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if (end == len(buf) or number and buf[end] not in _DELIMITERS) and not eof and fill():
+                continue
+            start = base + pos
+            pos = end
+            return value, start, base + end
+
+    def finish():
+        skip_ws()
+        if pos < len(buf):
+            raise ValueError(f"Лишние данные после объекта в позиции {base + pos}")
+
+    expect("{")
+    skip_ws()
+    if pos < len(buf) and buf[pos] == "}":
+        pos += 1
+        finish()
+        return
+    while True:
+        key, _, _ = decode_value()
+        if not isinstance(key, str):
+            raise ValueError("Ключ продукта должен быть строкой")
+        expect(":")
+        value, start, end = decode_value()
+        yield key, value, start, end
+        if expect(",}") == "}":
+            finish()
+            return
+
+def iter_products(filename, chunk_size=1 << 16, progress=None):
+    """
+    Потоковый аналог parse_json: читает файл кусками и выдает проверенные
+    продукты по одному, не загружая весь файл в память.
+    Ошибки отдельных продуктов регистрируются в лог так же, как в parse_json.
+    Если задан progress, он вызывается после каждого куска с числом
+    прочитанных байт и размером файла.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            total = os.fstat(f.fileno()).st_size
+
+            def chunks():
+                while True:
+                    raw = f.read(chunk_size)
+                    if progress is not None:
+                        progress(f.tell(), total)
+                    if not raw:
+                        tail = decoder.decode(b"", final=True)
+                        if tail:
+                            yield tail
+                        return
+                    yield decoder.decode(raw)
+
+            for key, item in iter_json_items(chunks()):
+                try:
+                    yield build_product(item, key)
+                except ValidationError as ve:
+                    logger.error("Ошибка обработки продукта %s: %s", key, ve)
+                    metrics.count("validation_errors", error=metrics.error_label(ve))
+                except Exception as e:
+                    logger.error("Непредвиденная ошибка при обработке продукта %s: %s", key, e)
+                    metrics.count("validation_errors", error=metrics.error_label(e))
+    except Exception as e:
+        logger.error("Ошибка открытия или чтения файла %s: %s", filename, e)
+    flush_log(logger)
+
+def product_to_dict(product):
+    """Преобразует продукт в словарь в формате файла склада."""
+    item_data = {
+        "name": product.name,
+        "date_of_receipt": product.formated_date_of_receipt,
+        "count": product.count
+    }
+
+    if product.date_of_write_off:
+        item_data["date_of_write_off"] = product.formated_date_of_write_off
+
+    if isinstance(product, Clothing):
+        item_data.update({
+            "size": product.size,
+            "color": product.color,
+            "material": product.material
+        })
+    elif isinstance(product, Furniture):
+        item_data.update({
+            "material": product.material,
+            "dimensions": product.dimensions,
+            "weight": product.weight
+        })
+    return item_data
+
+WRITE_CHUNK = 1 << 20
+
+_encode_string = json.encoder.encode_basestring
+_encode_other = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+# открывающая скобка, разделитель полей, двоеточие и закрывающая скобка продукта;
+# с отступом — уже сдвинутые на уровень вложения в объект файла
+_COMPACT_LAYOUT = ("{", ",", ":", "}")
+_INDENTED_LAYOUT = ("{\n    ", ",\n    ", ": ", "\n  }")
+
+def _json_value(value):
+    if type(value) is str:
+        return _encode_string(value)
+    if type(value) is int:
+        return int.__repr__(value)
+    return _encode_other(value)
+
+def encode_product(product, compact=True):
+    """
+    Кодирует продукт в JSON прямо из его полей, без промежуточного словаря product_to_dict
+    (поля в том же порядке). Без compact — с отступом продукта, вложенного в объект файла,
+    как его пишет dump_products. Возвращает bytes в UTF-8.
+    """
+    begin, sep, colon, end = _COMPACT_LAYOUT if compact else _INDENTED_LAYOUT
+    parts = [begin, '"name"', colon, _json_value(product.name),
+             sep, '"date_of_receipt"', colon, '"', product.formated_date_of_receipt, '"',
+             sep, '"count"', colon, _json_value(product.count)]
+    if product.date_of_write_off:
+        parts += [sep, '"date_of_write_off"', colon, '"', product.formated_date_of_write_off, '"']
+    if isinstance(product, Clothing):
+        parts += [sep, '"size"', colon, _json_value(product.size),
+                  sep, '"color"', colon, _json_value(product.color),
+                  sep, '"material"', colon, _json_value(product.material)]
+    elif isinstance(product, Furniture):
+        parts += [sep, '"material"', colon, _json_value(product.material),
+                  sep, '"dimensions"', colon, _json_value(product.dimensions),
+                  sep, '"weight"', colon, _json_value(product.weight)]
+    parts.append(end)
+    return "".join(parts).encode("utf-8")
+
+def dump_products(products, f, compact=None, backend=None):
+    """
+    Потоково записывает продукты в открытый двоичный файл, не собирая промежуточный словарь.
+    Каждый продукт начинается с новой строки с отступом в два пробела, как в json.dump(..., indent=2);
+    в компактном режиме (по умолчанию — serialization.compact) продукт занимает одну строку
+    без пробелов внутри. Закодированные продукты копятся в буфере и пишутся порциями
+    по WRITE_CHUNK байт. backend — библиотека JSON из serialization, по умолчанию текущая.
+    Возвращает число записанных продуктов.
+    """
+    backend = backend or serialization.backend
+    if compact is None:
+        compact = serialization.compact
+    if backend.name == "json":
+        # стандартному модулю дешевле не строить словарь: поля кодируются напрямую
+        def encode(product):
+            return encode_product(product, compact)
+    else:
+        dumps = backend.dumps if compact else backend.dumps_indented
+
+        def encode(product):
+            item = dumps(product_to_dict(product))
+            return item if compact else item.replace(b"\n", b"\n  ")
+    buffer = bytearray()
+    count = 0
+    for product in products:
+        key = product.key or f"Prod{count + 1}"
+        buffer += b"{\n  " if count == 0 else b",\n  "
+        buffer += _encode_string(key).encode("utf-8")
+        buffer += b": "
+        buffer += encode(product)
+        count += 1
+        if len(buffer) >= WRITE_CHUNK:
+            f.write(buffer)
+            buffer.clear()
+    buffer += b"\n}" if count else b"{}"
+    f.write(buffer)
+    return count
+
+def save_products(filename, products, compact=None):
+    """
+    Записывает продукты в JSON-файл. Ключом служит product.key, а для продуктов
+    без ключа — Prod1, Prod2, ... по порядку.
+    Продукты пишутся потоково во временный файл рядом, который затем атомарно
+    подменяет основной, поэтому сбой во время записи не портит прежнюю версию.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        os.chmod(tmp_name, mode)
+        with os.fdopen(fd, 'wb') as f:
+            dump_products(products, f, compact)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+@metrics.timed("set_write_off_date")
 def set_write_off_date(product, date_str):
     """
     Устанавливает дату списания для переданного продукта.
     Функция проверяет корректность формата даты, и в случае ошибки поднимает ValidationError.
     """
-    from datetime import datetime
     try:
-        new_date = datetime.strptime(date_str, "%d.%m.%Y")
+        new_date = parse_date(date_str)
     except ValueError as ve:
         raise ValidationError("Неверный формат даты списания, ожидается 'DD.MM.YYYY'") from ve
 
@@ -60,6 +533,56 @@ def set_write_off_date(product, date_str):
 
     product.date_of_write_off = new_date
 
+def _first_earlier(write_off, receipt):
+    """
+    Индекс первого продукта, у которого дата списания раньше даты поступления, или None.
+    write_off — порядковый номер дня для всех продуктов или список номеров по одному на продукт.
+    """
+    if np is not None:
+        violations = np.flatnonzero(np.asarray(write_off) < np.asarray(receipt))
+        return int(violations[0]) if len(violations) else None
+    if isinstance(write_off, int):
+        write_off = repeat(write_off)
+    return next((i for i, bad in enumerate(map(operator.lt, write_off, receipt)) if bad), None)
+
+def bulk_write_off(products, dates, predicate=None):
+    """
+    Списывает продукты по принципу «все или ничего».
+    dates — одна дата DD.MM.YYYY для всех продуктов или список дат по одной на каждый
+    переданный продукт; predicate — необязательный отбор продуктов, даты отобранных
+    остаются при них. Правило «не раньше даты поступления»
+    проверяется одним векторным проходом до изменения продуктов; при любой ошибке
+    поднимается ValidationError и ни один продукт не меняется.
+    Возвращает список списанных продуктов.
+    """
+    products = list(products)
+    per_item = not isinstance(dates, str)
+    if per_item and len(dates) != len(products):
+        raise ValidationError("Число дат списания не совпадает с числом продуктов")
+    if per_item and predicate:
+        pairs = [(p, d) for p, d in zip(products, dates) if predicate(p)]
+        selected, dates = [p for p, _ in pairs], [d for _, d in pairs]
+    else:
+        selected = [p for p in products if predicate(p)] if predicate else products
+    try:
+        new_dates = [parse_date(d) for d in dates] if per_item else parse_date(dates)
+    except ValueError as ve:
+        raise ValidationError("Неверный формат даты списания, ожидается 'DD.MM.YYYY'") from ve
+
+    write_off = [d.toordinal() for d in new_dates] if per_item else new_dates.toordinal()
+    receipt = [p.date_of_receipt.toordinal() for p in selected]
+    bad = _first_earlier(write_off, receipt)
+    if bad is not None:
+        raise ValidationError(f"Дата списания не может быть раньше даты поступления: {selected[bad].name}")
+
+    if per_item:
+        for product, new_date in zip(selected, new_dates):
+            product.date_of_write_off = new_date
+    else:
+        for product in selected:
+            product.date_of_write_off = new_dates
+    return selected
+
 if __name__ == "__main__":
     products = parse_json("example.json")
     for prod in products:
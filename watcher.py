@@ -0,0 +1,240 @@
+"""
+Отслеживание изменений файлов склада, сделанных другими процессами.
+
+FileWatcher опрашивает mtime и размер файлов, без внешних служб. По изменению
+JsonReloader перечитывает только нужное: из журнала — дописанные строки,
+из основного файла — продукты, текст которых изменился. Для этого запоминается
+хеш текста каждого значения, так что неизменные продукты не проверяются
+и не создаются заново. Результат сравнивается с продуктами в памяти по ключу
+"ProdN" и отпечатку содержимого (diff_products), и в модель и таблицу
+попадают только добавленные, измененные и удаленные продукты.
+"""
+import json
+import os
+import re
+from journal import Journal
+from utils import build_product, flush_log, logger
+
+_decoder = json.JSONDecoder()
+# разделитель ("{" перед первым продуктом, "," перед остальными) и ключ продукта
+_MEMBER = re.compile(r'[ \t\n\r]*([{,])[ \t\n\r]*("(?:[^"\\]|\\.)*")[ \t\n\r]*:[ \t\n\r]*')
+_END = re.compile(r'[ \t\n\r]*}[ \t\n\r]*\Z')
+_EMPTY = re.compile(r'[ \t\n\r]*{[ \t\n\r]*}[ \t\n\r]*\Z')
+
+
+def _iter_spans(text):
+    """
+    Ключи, значения и границы [start, end) значений объекта верхнего уровня.
+    То же, что iter_json_spans, но по уже прочитанному тексту: разделители и ключи
+    находит регулярное выражение, а не посимвольный разбор, поэтому просмотр
+    файла при каждом изменении в несколько раз дешевле.
+    """
+    if _EMPTY.match(text):
+        return
+    pos, separator = 0, "{"
+    while True:
+        match = _MEMBER.match(text, pos)
+        if match is None or match.group(1) != separator:
+            if separator == "," and _END.match(text, pos):
+                return
+            raise ValueError(f"Ошибка разбора JSON в позиции {pos}")
+        literal = match.group(2)
+        key = json.loads(literal) if "\\" in literal else literal[1:-1]
+        start = match.end()
+        value, pos = _decoder.raw_decode(text, start)
+        yield key, value, start, pos
+        separator = ","
+
+
+class FileWatcher:
+    """Опрос набора файлов по mtime и размеру; отсутствующий файл — отдельное состояние."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.state = self.stat()
+
+    def stat(self):
+        state = {}
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                state[path] = None
+            else:
+                state[path] = (info.st_mtime_ns, info.st_size)
+        return state
+
+    def poll(self):
+        """Пути файлов, изменившихся с прошлого опроса."""
+        state = self.stat()
+        changed = [path for path in self.paths if state[path] != self.state[path]]
+        self.state = state
+        return changed
+
+    def size(self, path):
+        state = self.state[path]
+        return state[1] if state else 0
+
+
+class JsonReloader:
+    """
+    Инкрементальное перечитывание JSON-файла склада с журналом.
+    Хеши значений основного файла появляются при первом его просмотре: первое
+    изменение файла другим процессом проверяет все продукты, следующие — только
+    измененные. Дописанный журнал читается с места, где закончилось прошлое чтение.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal = Journal(filename)
+        self.watcher = FileWatcher((filename, self.journal.path))
+        self.changed = set()
+        # ключ -> хеш текста значения в основном файле; None, пока файл не просматривался
+        self.digests = None
+        # записи журнала (ключ -> данные или None для удаленных) и смещение прочитанной части
+        self.journaled, self.offset = self.journal.tail()
+
+    def poll(self):
+        """True, если файл или журнал изменились и еще не перечитаны."""
+        self.changed.update(self.watcher.poll())
+        return bool(self.changed)
+
+    def reload(self, known_keys):
+        """
+        Перечитывает изменившиеся файлы. Возвращает словарь ключ -> новый продукт
+        или None для удаленных; в него попадают только затронутые ключи. known_keys() —
+        ключи продуктов в памяти, они нужны лишь при первом просмотре основного файла,
+        чтобы найти удаленные.
+        """
+        changed, self.changed = self.changed, set()
+        if not changed:
+            return {}
+        main_changed = self.filename in changed
+        data = {}
+        fallback = ()
+        if main_changed or self.watcher.size(self.journal.path) < self.offset:
+            # журнал свернут или перезаписан: читается заново целиком
+            previous = self.journaled
+            self.journaled, self.offset = self.journal.tail()
+            data.update(self.journaled)
+            # продукты, выпавшие из журнала, теперь берутся из основного файла
+            fallback = previous.keys() - self.journaled.keys()
+        elif self.journal.path in changed:
+            appended, self.offset = self.journal.tail(self.offset)
+            self.journaled.update(appended)
+            data.update(appended)
+
+        complete = main_changed and self.digests is None
+        if main_changed or fallback:
+            scanned = self._scan(fallback)
+            if scanned is not None:
+                values, removed = scanned
+                for key in removed:
+                    values[key] = None
+                for key in fallback:
+                    values.setdefault(key, None)
+                for key, item in values.items():
+                    if key not in self.journaled:
+                        data[key] = item
+            else:
+                complete = False
+        if complete:
+            data.update(self.journaled)
+            for key in known_keys():
+                data.setdefault(key, None)
+        changes = {key: None if item is None else self._build(key, item) for key, item in data.items()}
+        flush_log(logger)
+        return changes
+
+    def _scan(self, wanted):
+        """
+        Просматривает основной файл. Возвращает данные продуктов, текст которых
+        изменился или которые перечислены в wanted, и ключи исчезнувших продуктов;
+        None, если файл не удалось разобрать.
+        """
+        try:
+            with open(self.filename, 'r', encoding="UTF-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = "{}"
+        except Exception as e:
+            logger.error("Ошибка открытия или чтения файла %s: %s", self.filename, e)
+            return None
+        digests, values = {}, {}
+        previous = self.digests or {}
+        try:
+            for key, item, start, end in _iter_spans(text):
+                digest = digests[key] = hash(text[start:end])
+                if key in wanted or previous.get(key) != digest:
+                    values[key] = item
+        except Exception as e:
+            # файл правят вручную и он пока не разбирается: изменения подхватятся при следующей записи
+            logger.error("Ошибка открытия или чтения файла %s: %s", self.filename, e)
+            return None
+        removed = previous.keys() - digests.keys()
+        self.digests = digests
+        return values, removed
+
+    def _build(self, key, item):
+        # некорректный продукт при загрузке пропускается, поэтому здесь он считается удаленным
+        try:
+            return build_product(item, key)
+        except Exception as e:
+            logger.error("Ошибка обработки продукта %s: %s", key, e)
+            return None
+
+
+class ShardedReloader:
+    """Перечитывание склада из нескольких файлов: JsonReloader на файл, ключи "<файл>/<ключ>"."""
+
+    def __init__(self, reloaders, note_key=None):
+        self.reloaders = reloaders
+        self.note_key = note_key
+
+    def poll(self):
+        return any([reloader.poll() for reloader in self.reloaders.values()])
+
+    def reload(self, known_keys):
+        changes = {}
+        for name, reloader in self.reloaders.items():
+            prefix = name + "/"
+
+            def shard_keys(prefix=prefix):
+                return (key[len(prefix):] for key in known_keys() if key.startswith(prefix))
+
+            for local, product in reloader.reload(shard_keys).items():
+                if product is not None:
+                    if self.note_key is not None:
+                        self.note_key(name, local)
+                    product.key = prefix + local
+                changes[prefix + local] = product
+        return changes
+
+
+def diff_products(products, changes, keys=None):
+    """
+    Сопоставляет перечитанные продукты (ключ -> продукт или None) с продуктами в памяти.
+    Возвращает операции (позиция в products, старый продукт, новый продукт): у новых
+    продуктов позиция и старый продукт — None, у удаленных новый продукт — None.
+    Продукты с прежним отпечатком содержимого пропускаются. keys — ключи products
+    по порядку, если их можно получить, не обращаясь к самим продуктам (LazyProducts).
+    """
+    operations = []
+    found = set()
+    if changes:
+        if keys is None:
+            keys = (product.key for product in products)
+        for position, key in enumerate(keys):
+            if key not in changes:
+                continue
+            product = products[position]
+            found.add(key)
+            new = changes[key]
+            if new is None:
+                operations.append((position, product, None))
+            elif new.fingerprint != product.fingerprint:
+                operations.append((position, product, new))
+    for key, new in changes.items():
+        if new is not None and key not in found:
+            operations.append((None, None, new))
+    return operations
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask:
+    """
+    Выполняет функцию в рабочем потоке, не блокируя главный цикл Tkinter.
+    Функция получает саму задачу: task.report(kind, payload) отправляет сообщение,
+    task.check_cancelled() прерывает работу, если пользователь нажал «Отмена».
+    Сообщения забираются из очереди опросом через master.after и передаются
+    в on_message уже в главном потоке, поэтому обработчик может свободно
+    менять виджеты и список продуктов.
+    """
+
+    def __init__(self, master, target, on_message, interval=50, batch=50):
+        self.master = master
+        self.target = target
+        self.on_message = on_message
+        self.interval = interval
+        self.batch = batch
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.master.after(self.interval, self._poll)
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise TaskCancelled()
+
+    def report(self, kind, payload=None):
+        self.messages.put((kind, payload))
+
+    def _run(self):
+        try:
+            result = self.target(self)
+        except TaskCancelled:
+            self.report("cancelled")
+        except Exception as e:
+            self.report("error", e)
+        else:
+            self.report("done", result)
+
+    def _poll(self):
+        # за один тик обрабатывается ограниченное число сообщений, чтобы интерфейс не замирал
+        for _ in range(self.batch):
+            try:
+                kind, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            self.on_message(kind, payload)
+            if kind in ("done", "error", "cancelled"):
+                self.finished = True
+                return
+        self.master.after(self.interval, self._poll)